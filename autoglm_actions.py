@@ -0,0 +1,577 @@
+"""
+AutoGLM 动作序列列式存储与离线分析
+任务结束后把其 server_task 动作序列按列追加写入一个目录：动作编码、整数坐标、步骤耗时，
+指令、应用名与输入文本等字符串统一驻留（intern）为编号。写入只依赖标准库；
+分析用 NumPy 以内存映射方式读入各列并做向量化统计（每任务步数、等待耗时占比、
+滑动方向分布、各应用步数、按指令汇总的 VM 耗时），百万级动作也能在秒级内完成。
+
+目录结构（各列为小端定长数组，一个文件一列）:
+    strings.jsonl              驻留字符串表，第 n 行（从 0 开始）是编号 n 的 JSON 字符串
+    codes.jsonl                动作名表，第 n 行是编码 n 的动作名（最多 256 种，超出记为 other）
+    task_instruction.i32       任务列：指令编号
+    task_app.i32               首个 launch 的应用编号，-1 表示没有
+    task_status.u8             状态编码（见 STATUSES）
+    task_started.f64           发送时间（time.time() 秒）
+    task_duration.f32          任务耗时（秒）
+    task_first.i64 / task_count.i32   动作在动作列中的起始位置与数量
+    action_task.i32            动作列：所属任务序号
+    action_code.u8             动作编码
+    action_x.i16 / action_y.i16 / action_x2.i16 / action_y2.i16   坐标（滑动为起点与终点）
+    action_dt.f32              步骤耗时：从该动作到下一个动作（或任务结束）的秒数
+    action_arg.i32             launch 的应用、input 的文本或 swipe 的 direction 编号，-1 表示没有
+
+用法:
+    AUTO_GLM_ACTIONS=actions/ python interactive_autoglm.py      # 记录交互式会话的动作
+    python batch_autoglm.py corpus.jsonl --actions actions/      # 记录批量执行的动作
+    python autoglm_actions.py actions/ --top 20                  # 离线分析（需要 NumPy）
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from array import array
+
+from autoglm_liveness import normalize_instruction
+
+try:
+    # 离线分析需要 NumPy，只写入时不需要
+    import numpy as np
+except ImportError:
+    np = None
+
+# 任务状态编码
+STATUSES = ('finished', 'timeout', 'error', 'cancelled', 'other')
+
+# 预置的动作编码（其余动作名按出现顺序追加）
+BASE_CODES = ('other', 'tap', 'click', 'swipe', 'long_press', 'input', 'type', 'launch',
+              'wait', 'home', 'back', 'finish')
+
+# 滑动方向（按坐标判定时的顺序）
+DIRECTIONS = ('up', 'down', 'left', 'right')
+
+# 判定滑动方向的最小位移（像素），与交互式客户端的显示一致
+SWIPE_THRESHOLD = 100
+
+_I16_MIN, _I16_MAX = -32768, 32767
+
+# 列名 -> (array 类型码, NumPy dtype)
+TASK_COLUMNS = {
+    'task_instruction': ('i', '<i4'),
+    'task_app': ('i', '<i4'),
+    'task_status': ('B', 'u1'),
+    'task_started': ('d', '<f8'),
+    'task_duration': ('f', '<f4'),
+    'task_first': ('q', '<i8'),
+    'task_count': ('i', '<i4'),
+}
+ACTION_COLUMNS = {
+    'action_task': ('i', '<i4'),
+    'action_code': ('B', 'u1'),
+    'action_x': ('h', '<i2'),
+    'action_y': ('h', '<i2'),
+    'action_x2': ('h', '<i2'),
+    'action_y2': ('h', '<i2'),
+    'action_dt': ('f', '<f4'),
+    'action_arg': ('i', '<i4'),
+}
+_SUFFIX = {'<i4': 'i32', 'u1': 'u8', '<f8': 'f64', '<f4': 'f32', '<i8': 'i64', '<i2': 'i16'}
+
+
+def _column_path(path: str, name: str, dtype: str) -> str:
+    return os.path.join(path, f"{name}.{_SUFFIX[dtype]}")
+
+
+def _coord(value) -> int:
+    """坐标转为 int16（无法解析时为 0）"""
+    try:
+        return min(max(int(value), _I16_MIN), _I16_MAX)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _itemsize(dtype: str) -> int:
+    """列元素的字节数"""
+    return int(dtype[-1]) if dtype[-1].isdigit() else 1
+
+
+def _read_table(path: str) -> tuple:
+    """读入 JSONL 字符串表，返回 (字符串列表, 完整行的字节数)；崩溃时写了一半的最后一行被忽略"""
+    items, size = [], 0
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return items, size
+    with f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                break
+            size += len(line)
+    return items, size
+
+
+class _StringTable:
+    """追加写的驻留字符串表"""
+
+    def __init__(self, path: str, initial: tuple = ()):
+        self.path = path
+        self.items, size = _read_table(path)
+        self._file = open(path, 'ab')
+        self._file.truncate(size)
+        self.index = {s: i for i, s in enumerate(self.items)}
+        for s in initial:
+            self.intern(s)
+
+    def intern(self, text: str) -> int:
+        """返回字符串的编号，首次出现时追加到表中"""
+        idx = self.index.get(text)
+        if idx is None:
+            idx = self.index[text] = len(self.items)
+            self.items.append(text)
+            self._file.write(json.dumps(text, ensure_ascii=False).encode('utf-8') + b'\n')
+        return idx
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ActionStore:
+    """
+    动作序列的列式存储（追加写）
+
+    add_task 在任务结束时调用，把动作序列追加到各列；每个任务写完后刷新到操作系统缓冲区。
+    先写字符串表和动作列、最后写任务列，打开已有目录时按任务列截断多余的部分，
+    进程崩溃最多丢失最后一个任务。可在多个线程间共享（内部加锁）；
+    多个进程应各自使用不同的目录，分析时一起读入。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 存储目录，不存在时创建，已存在时继续追加
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self.strings = _StringTable(os.path.join(path, 'strings.jsonl'))
+        self.codes = _StringTable(os.path.join(path, 'codes.jsonl'), BASE_CODES)
+        self.tasks, self.actions = self._recover()
+        self._files = {}
+        for columns in (TASK_COLUMNS, ACTION_COLUMNS):
+            for name, (_, dtype) in columns.items():
+                self._files[name] = open(_column_path(path, name, dtype), 'ab')
+
+    def _recover(self) -> tuple:
+        """按最短的任务列确定完整写入的任务数，把各列截断到一致的长度"""
+        def length(name, dtype):
+            try:
+                return os.path.getsize(_column_path(self.path, name, dtype)) // _itemsize(dtype)
+            except FileNotFoundError:
+                return 0
+
+        tasks = min(length(name, dtype) for name, (_, dtype) in TASK_COLUMNS.items())
+        actions = 0
+        if tasks:
+            first = array('q')
+            count = array('i')
+            with open(_column_path(self.path, 'task_first', '<i8'), 'rb') as f:
+                f.seek((tasks - 1) * first.itemsize)
+                first.fromfile(f, 1)
+            with open(_column_path(self.path, 'task_count', '<i4'), 'rb') as f:
+                f.seek((tasks - 1) * count.itemsize)
+                count.fromfile(f, 1)
+            actions = first[0] + count[0]
+        for columns, rows in ((TASK_COLUMNS, tasks), (ACTION_COLUMNS, actions)):
+            for name, (_, dtype) in columns.items():
+                file_path = _column_path(self.path, name, dtype)
+                if os.path.exists(file_path) and os.path.getsize(file_path) > rows * _itemsize(dtype):
+                    os.truncate(file_path, rows * _itemsize(dtype))
+        return tasks, actions
+
+    def _code(self, action) -> int:
+        code = self.codes.intern(str(action)) if action else 0
+        return code if code < 256 else 0
+
+    def add_task(self, record) -> bool:
+        """
+        追加一个已结束任务的动作序列（TaskRecord）
+
+        Returns:
+            是否写入（由缓存返回的任务没有动作，不写入）
+        """
+        if record.cached or record.sent_at is None:
+            return False
+        end = record.finished_at or time.time()
+        times = record.action_times
+        with self._lock:
+            columns = {name: array(code) for name, (code, _) in {**TASK_COLUMNS, **ACTION_COLUMNS}.items()}
+            app = -1
+            for i, params in enumerate(record.actions):
+                action = params.get('action')
+                x, y, x2, y2, arg = (params.get('x'), params.get('y'), 0, 0, -1)
+                if action == 'swipe':
+                    x, y = params.get('start_x'), params.get('start_y')
+                    x2, y2 = _coord(params.get('end_x')), _coord(params.get('end_y'))
+                    if params.get('direction'):
+                        arg = self.strings.intern(str(params['direction']))
+                elif action == 'launch' and params.get('app'):
+                    arg = self.strings.intern(str(params['app']))
+                    app = arg if app < 0 else app
+                elif action in ('input', 'type') and params.get('text'):
+                    arg = self.strings.intern(str(params['text']))
+                next_at = times[i + 1] if i + 1 < len(times) else end
+                dt = max(next_at - times[i], 0.0) if i < len(times) else 0.0
+                columns['action_task'].append(self.tasks)
+                columns['action_code'].append(self._code(action))
+                columns['action_x'].append(_coord(x))
+                columns['action_y'].append(_coord(y))
+                columns['action_x2'].append(x2)
+                columns['action_y2'].append(y2)
+                columns['action_dt'].append(dt)
+                columns['action_arg'].append(arg)
+            status = record.status if record.status in STATUSES else 'other'
+            columns['task_instruction'].append(self.strings.intern(record.instruction))
+            columns['task_app'].append(app)
+            columns['task_status'].append(STATUSES.index(status))
+            columns['task_started'].append(record.sent_at)
+            columns['task_duration'].append(max(end - record.sent_at, 0.0))
+            columns['task_first'].append(self.actions)
+            columns['task_count'].append(len(record.actions))
+            self.strings.flush()
+            self.codes.flush()
+            for name in (*ACTION_COLUMNS, *TASK_COLUMNS):
+                columns[name].tofile(self._files[name])
+                self._files[name].flush()
+            self.tasks += 1
+            self.actions += len(record.actions)
+        return True
+
+    def stats(self) -> dict:
+        """已写入的任务数与动作数"""
+        return {"path": self.path, "tasks": self.tasks, "actions": self.actions}
+
+    def close(self):
+        """关闭各列文件"""
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self.strings.close()
+            self.codes.close()
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("离线分析需要 NumPy，请先执行 pip install numpy")
+
+
+def _merge(table: list, merged: list, ids: dict) -> list:
+    """把一个目录的字符串表合并到 merged，返回原编号到合并后编号的映射"""
+    mapping = []
+    for text in table:
+        if text not in ids:
+            ids[text] = len(merged)
+            merged.append(text)
+        mapping.append(ids[text])
+    return mapping
+
+
+def find_stores(paths: list) -> list:
+    """展开路径：本身是存储目录的直接使用，否则查找其下一层的存储目录（多进程各自写入的子目录）"""
+    stores = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, 'task_count.i32')):
+            stores.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            sub = os.path.join(path, name)
+            if os.path.exists(os.path.join(sub, 'task_count.i32')):
+                stores.append(sub)
+    return stores
+
+
+class ActionTable:
+    """
+    读入内存的动作表（NumPy 数组），多个存储目录合并后统一编号
+
+    列以内存映射读入，只有参与计算的列才会被实际读取；所有查询都是向量化的。
+    """
+
+    def __init__(self, tasks: dict, actions: dict, strings: list, codes: list):
+        self.tasks = tasks
+        self.actions = actions
+        self.strings = strings
+        self.codes = codes
+
+    @classmethod
+    def load(cls, paths) -> "ActionTable":
+        """
+        读入一个或多个存储目录（见 find_stores）
+
+        各目录的字符串与动作编码重新映射到合并后的编号，动作的任务序号依次偏移。
+        """
+        _require_numpy()
+        if isinstance(paths, str):
+            paths = [paths]
+        strings, string_ids = [], {}
+        codes, code_ids = [], {}
+        tasks = {name: [] for name in TASK_COLUMNS}
+        actions = {name: [] for name in ACTION_COLUMNS}
+        task_offset = action_offset = 0
+        for path in find_stores(paths):
+            string_map = np.array(_merge(_read_table(os.path.join(path, 'strings.jsonl'))[0],
+                                         strings, string_ids) + [-1], dtype=np.int32)
+            code_map = np.array(_merge(_read_table(os.path.join(path, 'codes.jsonl'))[0],
+                                       codes, code_ids), dtype=np.int32)
+
+            cols = {}
+            for name, (_, dtype) in {**TASK_COLUMNS, **ACTION_COLUMNS}.items():
+                file_path = _column_path(path, name, dtype)
+                rows = os.path.getsize(file_path) // _itemsize(dtype) if os.path.exists(file_path) else 0
+                cols[name] = (np.memmap(file_path, dtype=dtype, mode='r', shape=(rows,)) if rows
+                              else np.zeros(0, dtype=dtype))
+            # 与写入端相同的一致性规则：以最短的任务列为准（读取时不截断文件）
+            n_tasks = min(len(cols[name]) for name in TASK_COLUMNS)
+            n_actions = int(cols['task_first'][n_tasks - 1] + cols['task_count'][n_tasks - 1]) if n_tasks else 0
+            for name in TASK_COLUMNS:
+                cols[name] = cols[name][:n_tasks]
+            for name in ACTION_COLUMNS:
+                cols[name] = cols[name][:n_actions]
+
+            # 重新映射编号（-1 通过 string_map 的最后一项保持为 -1）
+            tasks['task_instruction'].append(string_map[cols['task_instruction']])
+            tasks['task_app'].append(string_map[cols['task_app']])
+            tasks['task_first'].append(cols['task_first'] + action_offset)
+            actions['action_task'].append(cols['action_task'] + task_offset)
+            actions['action_code'].append(code_map[cols['action_code']].astype(np.uint8))
+            actions['action_arg'].append(string_map[cols['action_arg']])
+            for name in ('task_status', 'task_started', 'task_duration', 'task_count'):
+                tasks[name].append(cols[name])
+            for name in ('action_x', 'action_y', 'action_x2', 'action_y2', 'action_dt'):
+                actions[name].append(cols[name])
+            task_offset += n_tasks
+            action_offset += n_actions
+
+        def concat(parts, dtype):
+            if len(parts) == 1:
+                return parts[0]
+            return np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+
+        tasks = {name: concat(tasks[name], dtype) for name, (_, dtype) in TASK_COLUMNS.items()}
+        actions = {name: concat(actions[name], dtype) for name, (_, dtype) in ACTION_COLUMNS.items()}
+        return cls(tasks, actions, strings, codes)
+
+    @property
+    def task_count(self) -> int:
+        return len(self.tasks['task_count'])
+
+    @property
+    def action_count(self) -> int:
+        return len(self.actions['action_code'])
+
+    def code(self, name: str) -> int:
+        """动作名的编码，不存在时返回 -1"""
+        return self.codes.index(name) if name in self.codes else -1
+
+    def step_counts(self):
+        """每个任务的步数（不含 finish 动作）"""
+        counts = self.tasks['task_count'].astype(np.int64)
+        finish = self.code('finish')
+        if finish >= 0 and self.action_count:
+            finishes = np.bincount(self.actions['action_task'][self.actions['action_code'] == finish],
+                                   minlength=self.task_count)
+            counts = counts - finishes[:self.task_count]
+        return counts
+
+    def steps_per_task(self) -> dict:
+        """每任务步数的分布（不含 finish 动作）"""
+        counts = self.step_counts()
+        if not len(counts):
+            return {"tasks": 0}
+        p50, p90, p99 = np.percentile(counts, [50, 90, 99])
+        return {"tasks": int(len(counts)), "mean": float(counts.mean()), "p50": float(p50),
+                "p90": float(p90), "p99": float(p99), "max": int(counts.max())}
+
+    def time_by_action(self) -> dict:
+        """各动作的次数、累计步骤耗时与耗时占比，按耗时从高到低"""
+        codes = self.actions['action_code']
+        dt = self.actions['action_dt'].astype(np.float64)
+        counts = np.bincount(codes, minlength=len(self.codes))
+        seconds = np.bincount(codes, weights=dt, minlength=len(self.codes))
+        total = seconds.sum() or 1.0
+        order = np.argsort(-seconds)
+        return {self.codes[i]: {"count": int(counts[i]), "seconds": float(seconds[i]),
+                                "share": float(seconds[i] / total)}
+                for i in order if counts[i]}
+
+    def wait_share(self) -> float:
+        """wait 动作占全部步骤耗时的比例"""
+        wait = self.code('wait')
+        dt = self.actions['action_dt'].astype(np.float64)
+        total = dt.sum()
+        if wait < 0 or not total:
+            return 0.0
+        return float(dt[self.actions['action_code'] == wait].sum() / total)
+
+    def swipe_directions(self) -> dict:
+        """滑动方向分布：按坐标位移判定，没有坐标时使用服务端给出的 direction"""
+        swipe = self.code('swipe')
+        mask = self.actions['action_code'] == swipe
+        x, y = self.actions['action_x'][mask].astype(np.int32), self.actions['action_y'][mask].astype(np.int32)
+        dx = self.actions['action_x2'][mask].astype(np.int32) - x
+        dy = self.actions['action_y2'][mask].astype(np.int32) - y
+        # 与交互式客户端显示相同的判定顺序：右、左、下、上
+        kind = np.full(len(dx), 4, dtype=np.int8)  # 4 表示无法判定
+        kind[dy < -SWIPE_THRESHOLD] = 0
+        kind[dy > SWIPE_THRESHOLD] = 1
+        kind[dx < -SWIPE_THRESHOLD] = 2
+        kind[dx > SWIPE_THRESHOLD] = 3
+        arg = self.actions['action_arg'][mask]
+        for i, name in enumerate(DIRECTIONS):
+            if name in self.strings:
+                kind[(kind == 4) & (arg == self.strings.index(name))] = i
+        counts = np.bincount(kind, minlength=5)
+        return {name: int(counts[i]) for i, name in enumerate(DIRECTIONS + ('unknown',))}
+
+    def steps_by_app(self, top: int = 20) -> list:
+        """各应用（任务中首个启动的应用）的任务数、步数与累计耗时，按步数从高到低"""
+        apps = self.tasks['task_app']
+        known = apps >= 0
+        if not known.any():
+            return []
+        ids, inverse = np.unique(apps[known], return_inverse=True)
+        tasks = np.bincount(inverse)
+        steps = np.bincount(inverse, weights=self.step_counts()[known])
+        seconds = np.bincount(inverse, weights=self.tasks['task_duration'][known].astype(np.float64))
+        order = np.argsort(-steps)[:top]
+        return [{"app": self.strings[ids[i]], "tasks": int(tasks[i]), "steps": int(steps[i]),
+                 "seconds": float(seconds[i])} for i in order]
+
+    def by_instruction(self, top: int = 20, prefix: int = None) -> list:
+        """
+        按指令类型汇总：任务数、平均步数、累计 VM 耗时、wait 占比与未成功比例，按累计耗时从高到低
+
+        用于找出最浪费 VM 时间的指令类型。指令先归一化（去掉空白与标点、统一小写），
+        指定 prefix 时按归一化后的前 prefix 个字符归为一类（与任务期限估计的“相似指令”一致）。
+        """
+        if not self.task_count:
+            return []
+        # 只对出现过的指令编号做一次 Python 层面的归一化，其余都是数组运算
+        used = np.unique(self.tasks['task_instruction'])
+        names, group_of = [], {}
+        mapping = np.empty(len(used), dtype=np.int64)
+        for i, idx in enumerate(used):
+            key = normalize_instruction(self.strings[idx])
+            key = key[:prefix] if prefix else key
+            if key not in group_of:
+                group_of[key] = len(names)
+                names.append(self.strings[idx])  # 以每类中首个出现的原始指令作为显示文本
+            mapping[i] = group_of[key]
+        inverse = mapping[np.searchsorted(used, self.tasks['task_instruction'])]
+        n = len(names)
+        tasks = np.bincount(inverse, minlength=n)
+        steps = np.bincount(inverse, weights=self.step_counts(), minlength=n)
+        seconds = np.bincount(inverse, weights=self.tasks['task_duration'].astype(np.float64), minlength=n)
+        failed = np.bincount(inverse, weights=self.tasks['task_status'] != 0, minlength=n)
+        wait_seconds = np.zeros(n)
+        step_seconds = np.zeros(n)
+        if self.action_count:
+            group = inverse[self.actions['action_task']]  # 每个动作所属的指令组
+            dt = self.actions['action_dt'].astype(np.float64)
+            step_seconds = np.bincount(group, weights=dt, minlength=n)
+            wait = self.code('wait')
+            if wait >= 0:
+                is_wait = self.actions['action_code'] == wait
+                wait_seconds = np.bincount(group[is_wait], weights=dt[is_wait], minlength=n)
+        order = np.argsort(-seconds)[:top]
+        return [{
+            "instruction": names[i],
+            "tasks": int(tasks[i]),
+            "mean_steps": float(steps[i] / tasks[i]),
+            "seconds": float(seconds[i]),
+            "mean_seconds": float(seconds[i] / tasks[i]),
+            "wait_share": float(wait_seconds[i] / step_seconds[i]) if step_seconds[i] else 0.0,
+            "failed_rate": float(failed[i] / tasks[i]),
+        } for i in order]
+
+    def status_counts(self) -> dict:
+        """各状态的任务数"""
+        counts = np.bincount(self.tasks['task_status'], minlength=len(STATUSES))
+        return {name: int(counts[i]) for i, name in enumerate(STATUSES) if counts[i]}
+
+    def report(self, top: int = 20, prefix: int = None) -> dict:
+        """全部统计"""
+        return {
+            "tasks": self.task_count,
+            "actions": self.action_count,
+            "status": self.status_counts(),
+            "steps_per_task": self.steps_per_task(),
+            "wait_share": self.wait_share(),
+            "time_by_action": self.time_by_action(),
+            "swipe_directions": self.swipe_directions(),
+            "apps": self.steps_by_app(top),
+            "instructions": self.by_instruction(top, prefix),
+        }
+
+
+def _print_report(report: dict, elapsed: float):
+    """输出可读的统计报告"""
+    print(f"📊 任务 {report['tasks']}，动作 {report['actions']}（分析耗时 {elapsed:.2f}s）")
+    print(f"   状态: {', '.join(f'{k} {v}' for k, v in report['status'].items()) or '-'}")
+    steps = report['steps_per_task']
+    if steps.get('tasks'):
+        print(f"   每任务步数: 平均 {steps['mean']:.1f}，p50 {steps['p50']:.0f} / p90 {steps['p90']:.0f} / "
+              f"p99 {steps['p99']:.0f}，最多 {steps['max']}")
+    print(f"⏳ wait 耗时占比: {report['wait_share']:.1%}")
+    print("⏱️  各动作耗时:")
+    for name, s in report['time_by_action'].items():
+        print(f"   {name:<12} {s['count']:>9} 次  {s['seconds']:>10.1f}s  {s['share']:>6.1%}")
+    print("👋 滑动方向: " + "，".join(f"{k} {v}" for k, v in report['swipe_directions'].items()))
+    if report['apps']:
+        print("📱 各应用步数:")
+        for a in report['apps']:
+            print(f"   {a['app']:<16} 任务 {a['tasks']:>7}  步数 {a['steps']:>9}  耗时 {a['seconds']:>10.1f}s")
+    if report['instructions']:
+        print("🐢 累计耗时最多的指令:")
+        for r in report['instructions']:
+            text = r['instruction'][:30] + ('...' if len(r['instruction']) > 30 else '')
+            print(f"   {r['seconds']:>9.1f}s  任务 {r['tasks']:>6}  平均 {r['mean_steps']:>5.1f} 步 / "
+                  f"{r['mean_seconds']:>6.1f}s  wait {r['wait_share']:>5.1%}  未成功 {r['failed_rate']:>5.1%}  {text}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="AutoGLM 动作序列离线分析")
+    parser.add_argument("paths", nargs="+", help="存储目录（或包含多个存储子目录的目录）")
+    parser.add_argument("--top", type=int, default=20, help="应用与指令排行的条数（默认 20）")
+    parser.add_argument("--prefix", type=int, default=None,
+                        help="按归一化后指令的前 N 个字符归类汇总（默认按完整指令）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出全部统计")
+    args = parser.parse_args()
+
+    if np is None:
+        print("❌ 离线分析需要 NumPy，请先执行 pip install numpy", file=sys.stderr)
+        sys.exit(1)
+    if not find_stores(args.paths):
+        print("❌ 没有找到动作存储目录", file=sys.stderr)
+        sys.exit(1)
+    start = time.perf_counter()
+    table = ActionTable.load(args.paths)
+    report = table.report(args.top, args.prefix)
+    elapsed = time.perf_counter() - start
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report, elapsed)
+
+
+if __name__ == "__main__":
+    main()
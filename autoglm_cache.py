@@ -0,0 +1,191 @@
+"""
+AutoGLM 结果缓存
+以指令文本为键（只合并连续空白、统一大小写，标点与数字原样保留），把最终 result 保存在本地 SQLite 文件中，
+重复的查询类指令可直接返回缓存结果而不必再跑一次 VM。
+按 TTL 过期，并按最近使用时间（LRU）淘汰，总条目数与总字节数都有上限。
+命中时的使用时间与命中次数先记在内存中，批量写回数据库。
+"""
+
+import json
+import time
+import sqlite3
+import threading
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    instruction TEXT NOT NULL,
+    result TEXT NOT NULL,
+    actions INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+"""
+
+
+def cache_key(instruction: str) -> str:
+    """
+    缓存键：合并连续空白并统一大小写
+
+    不能像耗时估计那样去掉标点与空白，否则“低于3.5元”与“低于35元”会共用一条结果。
+    """
+    return ' '.join(instruction.split()).casefold()
+
+
+class ResultCache:
+    """
+    基于 SQLite 的结果缓存
+
+    可在多个线程间共享（内部加锁）；命中、未命中、过期与淘汰次数只统计本进程。
+    get 只读数据库，命中记录（使用时间、命中次数）累积到 flush_every 条，
+    或在 put / 淘汰 / stats / close 时一并写回，命中路径上没有写事务。
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600, max_entries: int = 1000,
+                 max_bytes: int = 50 * 1024 * 1024, flush_every: int = 64):
+        """
+        Args:
+            path: SQLite 文件路径，':memory:' 表示仅在内存中缓存
+            ttl: 缓存有效期（秒）
+            max_entries: 最多保留的条目数
+            max_bytes: 结果 JSON 的总字节数上限
+            flush_every: 累积多少条命中记录后写回数据库
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.flush_every = flush_every
+        self._touched = {}  # key -> [最近使用时间, 未写回的命中次数]
+        self._pending = 0  # 未写回的命中总数
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def get(self, instruction: str) -> dict:
+        """
+        查询缓存
+
+        Returns:
+            命中时返回 {"result", "actions", "created_at", "hits"}，未命中或已过期返回 None
+        """
+        key = cache_key(instruction)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, actions, created_at, hits FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            result, actions, created_at, hits = row
+            if now - created_at > self.ttl:
+                self._discard(key)
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._db.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            touched = self._touched.setdefault(key, [now, 0])
+            touched[0] = now
+            touched[1] += 1
+            hits += touched[1]
+            self.hits += 1
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._flush()
+                self._db.commit()
+        return {"result": json.loads(result), "actions": actions, "created_at": created_at, "hits": hits}
+
+    def put(self, instruction: str, result, action_count: int = 0):
+        """保存一条指令的最终结果，然后按上限淘汰最久未使用的条目"""
+        text = json.dumps(result, ensure_ascii=False)
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        key = cache_key(instruction)
+        with self._lock:
+            self._discard(key)
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, instruction, result, actions, size, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, instruction, text, action_count, size, now, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _flush(self):
+        """把累积的命中记录写回数据库（调用方持有锁并负责提交）"""
+        if not self._touched:
+            return
+        self._db.executemany(
+            "UPDATE results SET last_used = MAX(last_used, ?), hits = hits + ? WHERE key = ?",
+            [(used, count, key) for key, (used, count) in self._touched.items()]
+        )
+        self._touched.clear()
+        self._pending = 0
+
+    def _discard(self, key: str):
+        """丢弃某个键未写回的命中记录（调用方持有锁）"""
+        touched = self._touched.pop(key, None)
+        if touched is not None:
+            self._pending -= touched[1]
+
+    def _evict(self, now: float):
+        """删除过期条目，再按 LRU 淘汰到条目数与字节数上限以内（调用方持有锁）"""
+        self._flush()  # 淘汰顺序依赖最新的使用时间
+        cursor = self._db.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,))
+        self.expired += cursor.rowcount
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY last_used"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        self._db.executemany("DELETE FROM results WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._touched.clear()
+            self._pending = 0
+            self._db.execute("DELETE FROM results")
+            self._db.commit()
+
+    def stats(self) -> dict:
+        """缓存统计"""
+        with self._lock:
+            self._flush()
+            self._db.commit()
+            entries, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def close(self):
+        """写回命中记录并关闭数据库连接"""
+        with self._lock:
+            self._flush()
+            self._db.commit()
+            self._db.close()
@@ -0,0 +1,306 @@
+"""
+AutoGLM 无界面客户端 API
+配置显式传入（不依赖导入时读取的全局变量），不做任何终端输出，
+任务事件以异步迭代器的形式交给调用方，任务结束后返回结构化结果。可嵌入其他服务，
+交互式命令行、批量执行等入口都只是它的使用者。
+
+用法:
+    config = AutoGLMConfig(api_key="...")
+    async with AutoGLMClient(config) as client:
+        stream = client.submit("在美团搜索附近的火锅店")
+        async for event in stream:          # 该任务的 Echo / TaskAction / Notify / Result 事件
+            print(event.msg_type)
+        result = await stream.result()      # TaskRecord.to_dict()
+"""
+
+import os
+import asyncio
+
+from autoglm_session import AutoGLMSession, ReconnectPolicy, TaskRecord
+
+# 默认服务端点
+DEFAULT_URL = "wss://autoglm-api.zhipuai.cn/openapi/v1/autoglm/developer"
+
+# 事件流结束标记
+_END = object()
+
+
+class AutoGLMConfig:
+    """客户端配置"""
+
+    def __init__(self, api_key: str = None, url: str = DEFAULT_URL, keys=None, reconnect: int = 0,
+                 cache_path: str = None, cache_ttl: float = 24 * 3600, trace_path: str = None,
+                 ring_frames: int = 2000, ring_bytes: int = 4 * 1024 * 1024, actions_path: str = None):
+        """
+        Args:
+            api_key: API Key（指定 keys 时可省略）
+            url: WebSocket 地址
+            keys: KeyPool，多个 API Key 按余量轮换
+            reconnect: 断线自动重连的最大次数，0 表示不重连
+            cache_path: 结果缓存 SQLite 文件，None 表示不缓存
+            cache_ttl: 缓存有效期（秒）
+            trace_path: 原始消息录制文件，None 表示不录制
+            ring_frames: 内存中保留的最近原始消息帧数，0 表示不保留
+            ring_bytes: 最近原始消息的字节数上限
+            actions_path: 动作序列列式存储目录，None 表示不记录
+        """
+        self.api_key = api_key or (keys.keys[0].key if keys is not None else None)
+        self.url = url
+        self.keys = keys
+        self.reconnect = reconnect
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.trace_path = trace_path
+        self.ring_frames = ring_frames
+        self.ring_bytes = ring_bytes
+        self.actions_path = actions_path
+
+    @classmethod
+    def from_env(cls, dotenv: bool = True) -> "AutoGLMConfig":
+        """
+        从环境变量读取配置（缺少 API Key 时不报错，需要时调用 validate）
+
+        Args:
+            dotenv: 是否先把当前目录下 .env 中的变量加载到环境变量
+        """
+        if dotenv:
+            from dotenv import load_dotenv
+            load_dotenv()
+        from autoglm_keys import KeyPool
+
+        return cls(
+            api_key=os.getenv("AUTO_GLM_API_KEY"),
+            url=os.getenv("AUTO_GLM_URL", DEFAULT_URL),
+            keys=KeyPool.from_env(),
+            reconnect=int(os.getenv("AUTO_GLM_RECONNECT", "0")),
+            cache_path=os.getenv("AUTO_GLM_CACHE"),
+            cache_ttl=float(os.getenv("AUTO_GLM_CACHE_TTL", str(24 * 3600))),
+            trace_path=os.getenv("AUTO_GLM_TRACE"),
+            ring_frames=int(os.getenv("AUTO_GLM_RING_FRAMES", "2000")),
+            ring_bytes=int(os.getenv("AUTO_GLM_RING_BYTES", str(4 * 1024 * 1024))),
+            actions_path=os.getenv("AUTO_GLM_ACTIONS"),
+        )
+
+    def validate(self):
+        """检查必需的配置，缺少 API Key 时抛出 ValueError"""
+        if not self.api_key:
+            raise ValueError("未找到 API Key，请在 .env 文件中设置 AUTO_GLM_API_KEY 或 AUTO_GLM_API_KEYS")
+
+    @property
+    def headers(self) -> dict:
+        """请求头（认证信息）"""
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    @property
+    def masked_key(self) -> str:
+        """用于显示的脱敏 API Key"""
+        if self.keys is not None:
+            return f"{len(self.keys.keys)} 个，按余量轮换"
+        if not self.api_key:
+            return "-"
+        return f"{self.api_key[:10]}...{self.api_key[-4:]}"
+
+    def create_session(self, **callbacks) -> AutoGLMSession:
+        """按配置创建会话（缓存、录制、环形缓冲区、动作存储与 Key 池），callbacks 透传给 AutoGLMSession"""
+        from autoglm_actions import ActionStore
+        from autoglm_cache import ResultCache
+        from autoglm_ring import FrameRing
+        from autoglm_trace import TraceWriter
+
+        return AutoGLMSession(
+            self.url,
+            self.headers,
+            reconnect=ReconnectPolicy(max_attempts=self.reconnect) if self.reconnect > 0 else None,
+            cache=ResultCache(self.cache_path, ttl=self.cache_ttl) if self.cache_path else None,
+            recorder=TraceWriter(self.trace_path) if self.trace_path else None,
+            ring=FrameRing(self.ring_frames, self.ring_bytes) if self.ring_frames > 0 else None,
+            keys=self.keys,
+            action_store=ActionStore(self.actions_path) if self.actions_path else None,
+            **callbacks
+        )
+
+
+class TaskStream:
+    """
+    单个任务的事件流
+
+    async for 逐个得到该任务的事件（按 msg_id 关联，不含心跳），任务结束（含等待 result 的宽限时间）后迭代停止；
+    result() 返回结构化的最终结果。事件在登记后即开始缓存，晚一些开始迭代也不会遗漏。
+    """
+
+    def __init__(self, session: AutoGLMSession):
+        self.session = session
+        self.record = None  # 提交后得到的 TaskRecord
+        self._queue = asyncio.Queue()
+        self._submitted = asyncio.Event()
+        self._runner = None
+
+    def _on_event(self, record: TaskRecord, event):
+        self._queue.put_nowait(event)
+
+    def _on_start(self, record: TaskRecord):
+        self.record = record
+        self._submitted.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self._queue.get()
+        if event is _END:
+            self._queue.put_nowait(_END)  # 重复迭代时仍然立即结束
+            raise StopAsyncIteration
+        return event
+
+    async def submitted(self) -> TaskRecord:
+        """等待指令提交（已发送、已排队或命中缓存），返回任务记录；提交失败时抛出异常"""
+        waiter = asyncio.ensure_future(self._submitted.wait())
+        await asyncio.wait({waiter, self._runner}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if self.record is None:
+            await self._runner  # 抛出提交失败的异常
+        return self.record
+
+    async def wait(self) -> TaskRecord:
+        """等待任务结束，返回任务记录"""
+        return await asyncio.shield(self._runner)
+
+    async def result(self) -> dict:
+        """等待任务结束，返回结构化结果（TaskRecord.to_dict()）"""
+        return (await self.wait()).to_dict()
+
+    def cancel(self, reason: str = '已取消') -> bool:
+        """取消任务（在事件循环线程中调用），返回是否触发了会话回收"""
+        if self.record is None:
+            self._runner.cancel()
+            return False
+        return self.session.cancel_task(self.record, reason)
+
+
+class _Subscription:
+    """events() 的订阅队列：满时丢弃最早的事件，消费慢不会拖慢消息接收"""
+
+    def __init__(self, maxsize: int):
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def push(self, item):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+
+class AutoGLMClient:
+    """
+    无界面的 AutoGLM 客户端
+
+    封装一个 AutoGLMSession：events() 订阅会话收到的全部事件，submit() 提交指令并返回该任务的 TaskStream，
+    run() 执行指令并直接返回结构化结果。只在一个事件循环中使用；on_open / on_error / on_close /
+    on_reconnect 等回调透传给会话。
+    """
+
+    def __init__(self, config: AutoGLMConfig, **callbacks):
+        self.config = config
+        self._subscribers = set()
+        self._on_message = callbacks.pop('on_message', None)
+        self.session = config.create_session(on_message=self._dispatch, **callbacks)
+        self._watcher = None
+
+    async def __aenter__(self):
+        if not await self.connect():
+            await self.close()
+            raise ConnectionError("等待虚拟机就绪超时")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self, timeout: float = 10, ready_timeout: float = 60) -> bool:
+        """建立连接并等待 VM 就绪，连接失败抛出异常，就绪超时返回 False"""
+        await self.session.connect(timeout)
+        if self._watcher is None:
+            self._watcher = asyncio.ensure_future(self._watch_closed())
+        return await self.session.wait_ready(ready_timeout)
+
+    def _dispatch(self, session, message, event):
+        """会话 on_message 回调：把事件分发给所有订阅者"""
+        for subscriber in self._subscribers:
+            subscriber.push(event)
+        if self._on_message is not None:
+            self._on_message(session, message, event)
+
+    async def _watch_closed(self):
+        """会话终止后结束所有事件流"""
+        await self.session.wait_closed()
+        for subscriber in self._subscribers:
+            subscriber.push(_END)
+
+    async def events(self, maxsize: int = 1000):
+        """
+        订阅会话收到的全部事件（含心跳、初始化进度等），会话终止时结束
+
+        Args:
+            maxsize: 未消费事件的上限，超出时丢弃最早的事件
+        """
+        subscriber = _Subscription(maxsize)
+        self._subscribers.add(subscriber)
+        try:
+            while True:
+                event = await subscriber.queue.get()
+                if event is _END:
+                    return
+                yield event
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def submit(self, instruction: str, timeout: float = None, result_grace: float = 5,
+               use_cache: bool = True) -> TaskStream:
+        """
+        提交指令，立即返回该任务的事件流（在事件循环中调用）
+
+        Args:
+            instruction: 要执行的任务指令
+            timeout: 任务期限（秒），None 时按历史自适应；超时按取消处理并回收会话
+            result_grace: 任务完成后继续等待 result 消息的时间（秒）
+            use_cache: 是否使用结果缓存
+        """
+        stream = TaskStream(self.session)
+
+        async def run():
+            try:
+                return await self.session.run_instruction(
+                    instruction, timeout, result_grace, use_cache=use_cache,
+                    on_start=stream._on_start, listener=stream._on_event)
+            finally:
+                stream._queue.put_nowait(_END)
+
+        stream._runner = asyncio.ensure_future(run())
+        return stream
+
+    async def run(self, instruction: str, timeout: float = None, result_grace: float = 5,
+                  use_cache: bool = True) -> dict:
+        """执行指令并返回结构化结果（TaskRecord.to_dict()）"""
+        return await self.submit(instruction, timeout, result_grace, use_cache).result()
+
+    def cancel(self, key, reason: str = '已取消') -> bool:
+        """按序号或 msg_id（前缀）取消任务，找不到或已结束返回 False"""
+        record = self.session.get_task(key)
+        if record is None or record.done.is_set():
+            return False
+        self.session.cancel_task(record, reason)
+        return True
+
+    async def close(self):
+        """关闭会话，并关闭配置创建的缓存、录制文件与动作存储"""
+        await self.session.close()
+        for subscriber in self._subscribers:
+            subscriber.push(_END)
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self.session.cache is not None:
+            self.session.cache.close()
+        if self.session.recorder is not None:
+            self.session.recorder.close()
+        if self.session.action_store is not None:
+            self.session.action_store.close()
@@ -0,0 +1,279 @@
+"""
+AutoGLM 多会话全屏面板
+每个会话 / VM 一行，显示状态、当前任务与动作、步数、已执行时间和最近一次心跳。
+会话状态由事件循环按固定间隔采样（只保留最新一份），独立的绘制线程以受限的帧率
+与上一帧逐格比较，只重绘发生变化的单元格；可见行数受终端高度限制，
+因此终端输出量与会话数量和消息速率无关。
+"""
+
+import sys
+import time
+import shutil
+import asyncio
+import threading
+import unicodedata
+from collections import deque
+
+# 列标题与显示宽度
+COLUMNS = (
+    ("会话", 5),
+    ("状态", 8),
+    ("任务", 30),
+    ("当前动作", 22),
+    ("步数", 5),
+    ("耗时", 7),
+    ("心跳", 7),
+)
+
+
+def fit(text: str, width: int) -> str:
+    """
+    按显示宽度截断并用空格补齐到 width 列
+
+    文本可能来自服务端或用户输入：控制字符（含 ESC、换行）替换为空格，
+    零宽字符（格式字符 Cf，如 U+200B / U+200D / U+FEFF）与组合字符丢弃，写入终端的每个字符都占确定的列数，不会破坏差量重绘的布局。
+    """
+    out, used = [], 0
+    for ch in text:
+        category = unicodedata.category(ch)
+        if category in ('Cf', 'Mn', 'Me', 'Zl', 'Zp'):
+            continue
+        if category[0] == 'C':
+            ch = ' '
+        w = 2 if unicodedata.east_asian_width(ch) in 'WF' else 1
+        if used + w > width:
+            break
+        out.append(ch)
+        used += w
+    return ''.join(out) + ' ' * (width - used)
+
+
+def _age(seconds) -> str:
+    if seconds is None:
+        return '-'
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    return f"{seconds // 60:.0f}m{seconds % 60:02.0f}s"
+
+
+def describe_action(params: dict) -> str:
+    """动作的简短描述"""
+    action = params.get('action', '') or '-'
+    if action in ('tap', 'click', 'long_press') and params.get('x') is not None:
+        return f"{action} ({params.get('x')},{params.get('y')})"
+    if action == 'swipe':
+        direction = params.get('direction')
+        if direction:
+            return f"swipe {direction}"
+        return f"swipe ({params.get('start_x')},{params.get('start_y')})→({params.get('end_x')},{params.get('end_y')})"
+    if action == 'launch':
+        return f"launch {params.get('app', '')}"
+    if action in ('input', 'type'):
+        return f"input {str(params.get('text', ''))[:20]}"
+    return action
+
+
+def session_row(index: int, session, now: float = None, mono: float = None) -> list:
+    """
+    一个会话的显示行（在事件循环线程中调用，只读取会话状态）
+
+    Args:
+        index: 会话序号
+        session: AutoGLMSession，None 表示尚未建立
+    """
+    now = time.time() if now is None else now
+    mono = time.monotonic() if mono is None else mono
+    if session is None:
+        return [f"#{index}", "未连接", "", "", "", "", ""]
+    if session.closed:
+        state = "已关闭"
+    elif session.recycling:
+        state = "回收中"
+    elif session.reconnecting:
+        state = "重连中"
+    elif not session.vm_ready:
+        state = "初始化"
+    elif session.current_task is not None and not session.current_task.done.is_set():
+        state = "执行中"
+    else:
+        state = "空闲"
+    task = session.current_task if state == "执行中" else None
+    liveness = session.liveness
+    heartbeat = liveness.last_heartbeat_at or liveness.last_frame_at
+    if task is None:
+        return [f"#{index}", state, "", "", "", "", _age(mono - heartbeat if heartbeat else None)]
+    return [
+        f"#{index}",
+        state,
+        f"#{task.seq} {task.instruction}",
+        describe_action(task.actions[-1]) if task.actions else "等待首个动作",
+        str(len(task.actions)),
+        _age(now - task.sent_at if task.sent_at else None),
+        _age(mono - heartbeat if heartbeat else None),
+    ]
+
+
+class Dashboard:
+    """
+    全屏面板（差量重绘）
+
+    update 可在任意线程调用，只保存最新一份数据；绘制线程最多每秒 max_fps 次，
+    把新画面与上一帧逐格比较，只输出变化的单元格（光标定位 + 定宽文本）。
+    终端尺寸变化时整屏重绘。log 的消息显示在面板底部（保留最近几条）。
+    """
+
+    def __init__(self, title: str = "AutoGLM", stream=None, max_fps: float = 4, log_lines: int = 5,
+                 columns=COLUMNS):
+        self.title = title
+        self.stream = stream or sys.stderr
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0
+        self.columns = columns
+        self.frames = 0  # 实际绘制的帧数
+        self.cells = 0  # 累计重绘的单元格数
+        self.bytes = 0  # 累计输出的字节数
+        self._header = ''
+        self._rows = []
+        self._logs = deque(maxlen=log_lines)
+        self._prev = []  # 上一帧每行的 (单元格布局, 各单元格文本)
+        self._size = None
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """切换到备用屏幕并启动绘制线程"""
+        self._write("\x1b[?1049h\x1b[?25l\x1b[2J")
+        self._thread = threading.Thread(target=self._run, name="autoglm-dashboard", daemon=True)
+        self._thread.start()
+
+    def update(self, header: str, rows: list):
+        """提交最新的标题行与会话行（每行为各列文本的列表）"""
+        with self._lock:
+            self._header = header
+            self._rows = rows
+        self._dirty.set()
+
+    def log(self, text: str):
+        """在面板底部显示一条消息"""
+        with self._lock:
+            self._logs.append(text)
+        self._dirty.set()
+
+    def close(self):
+        """绘制最后一帧，恢复普通屏幕与光标"""
+        if self._thread is None:
+            return
+        self._closed.set()
+        self._dirty.set()
+        self._thread.join()
+        self._thread = None
+        self._write("\x1b[?25h\x1b[?1049l")
+
+    def stats(self) -> dict:
+        """绘制帧数、重绘单元格数与输出字节数"""
+        return {"frames": self.frames, "cells": self.cells, "bytes": self.bytes}
+
+    def _write(self, text: str):
+        try:
+            self.stream.write(text)
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass
+        self.bytes += len(text.encode('utf-8', 'replace'))
+
+    def _run(self):
+        """绘制线程：有更新时绘制，两帧之间至少间隔 min_interval 秒"""
+        last = 0.0
+        while True:
+            self._dirty.wait()
+            if self._closed.is_set():
+                self._draw()
+                return
+            wait = last + self.min_interval - time.monotonic()
+            if wait > 0 and self._closed.wait(wait):
+                self._draw()
+                return
+            self._dirty.clear()
+            self._draw()
+            last = time.monotonic()
+
+    def _layout(self, width: int, height: int) -> list:
+        """
+        组装整屏内容
+
+        Returns:
+            每行为 [(起始列, 宽度, 文本), ...]
+        """
+        with self._lock:
+            header, rows, logs = self._header, self._rows, list(self._logs)
+        spans = []
+        x = 0
+        for _, w in self.columns:
+            spans.append((x, w))
+            x += w + 1
+        if spans:
+            # 最后一列占满剩余宽度
+            spans[-1] = (spans[-1][0], max(width - spans[-1][0], 1))
+        spans = [(x, min(w, width - x)) for x, w in spans if x < width]
+
+        def cells(values):
+            return [(x, w, values[i] if i < len(values) else '') for i, (x, w) in enumerate(spans)]
+
+        lines = [[(0, width, self.title + ('  ' + header if header else ''))],
+                 cells([name for name, _ in self.columns])]
+        room = max(height - len(lines) - len(logs) - 1, 1)
+        if len(rows) > room:
+            lines.extend(cells(row) for row in rows[:room - 1])
+            lines.append([(0, width, f"… 另有 {len(rows) - room + 1} 个会话")])
+        else:
+            lines.extend(cells(row) for row in rows)
+        lines.extend([] for _ in range(height - len(lines) - len(logs)))
+        lines.extend([(0, width, text)] for text in logs)
+        return lines[:height]
+
+    def _draw(self):
+        """与上一帧比较，只输出变化的单元格；某行的单元格布局变化时整行重绘"""
+        width, height = shutil.get_terminal_size((100, 30))
+        width -= 1  # 不写最后一列，避免自动换行
+        out = []
+        if (width, height) != self._size:
+            self._size = (width, height)
+            self._prev = []
+            out.append("\x1b[2J")
+        current = []
+        changed = 0
+        for y, line in enumerate(self._layout(width, height)):
+            layout = tuple((x, w) for x, w, _ in line if w > 0)
+            texts = [fit(str(text), w) for _, w, text in line if w > 0]
+            prev_layout, prev_texts = self._prev[y] if y < len(self._prev) else (None, None)
+            if layout != prev_layout:
+                out.append(f"\x1b[{y + 1};1H\x1b[2K")
+                prev_texts = [None] * len(texts)
+            for (x, _), text, old in zip(layout, texts, prev_texts):
+                if text != old:
+                    out.append(f"\x1b[{y + 1};{x + 1}H{text}")
+                    changed += 1
+            current.append((layout, texts))
+        self._prev = current
+        if out:
+            self._write(''.join(out))
+        self.frames += 1
+        self.cells += changed
+
+
+async def run_pool_dashboard(dashboard: Dashboard, pool, header, interval: float = 0.25):
+    """
+    按固定间隔采样会话池中各会话的状态并提交给面板（在事件循环中运行，取消即停止）
+
+    Args:
+        dashboard: Dashboard
+        pool: AutoGLMSessionPool
+        header: 无参函数，返回标题行右侧的汇总文本
+        interval: 采样间隔（秒）
+    """
+    while True:
+        now, mono = time.time(), time.monotonic()
+        rows = [session_row(i + 1, session, now, mono) for i, session in enumerate(pool.sessions)]
+        dashboard.update(header(), rows)
+        await asyncio.sleep(interval)
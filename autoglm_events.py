@@ -0,0 +1,275 @@
+"""
+AutoGLM 消息解码
+每帧只解析一次（包括 server_task 中嵌套的 data_agent JSON 字符串），
+通过按 msg_type / biz_type / action 注册的解码函数生成带 __slots__ 的事件对象，
+状态跟踪与显示逻辑都只消费这些事件。
+字段类型不符合协议（如 msg_type 不是字符串）的消息按畸形消息处理，不会中断接收。
+"""
+
+import json
+
+try:
+    # 可选的更快 JSON 后端
+    import orjson
+
+    def json_loads(text):
+        return orjson.loads(text)
+
+    JSON_BACKEND = "orjson"
+    JSON_DECODE_ERRORS = (orjson.JSONDecodeError, TypeError)
+except ImportError:
+    json_loads = json.loads
+    JSON_BACKEND = "json"
+    JSON_DECODE_ERRORS = (json.JSONDecodeError, TypeError)
+
+
+# 连续出现时可以合并显示的动作
+COALESCE_ACTIONS = frozenset(('tap', 'click', 'wait'))
+
+
+def _text(value) -> str:
+    """协议中的字符串字段，类型不符时按空串处理"""
+    return value if isinstance(value, str) else ''
+
+
+class Event:
+    """所有事件的基类，frame 为解析后的完整消息（调试显示用）"""
+
+    __slots__ = ('msg_type', 'msg_id', 'conversation_id', 'timestamp', 'frame')
+
+    def __init__(self, frame: dict):
+        self.msg_type = frame.get('msg_type', 'unknown')
+        msg_id = frame.get('msg_id')
+        self.msg_id = msg_id if isinstance(msg_id, str) else None
+        conversation_id = frame.get('conversation_id')
+        self.conversation_id = conversation_id if isinstance(conversation_id, (str, int)) else None
+        timestamp = frame.get('timestamp')
+        self.timestamp = timestamp if isinstance(timestamp, (int, float)) else None
+        self.frame = frame
+
+    @property
+    def data(self) -> dict:
+        """消息中的 data 字段"""
+        data = self.frame.get('data')
+        return data if isinstance(data, dict) else {}
+
+    def __repr__(self):
+        return f"{type(self).__name__}(msg_type={self.msg_type!r}, msg_id={self.msg_id!r})"
+
+
+class Heartbeat(Event):
+    """心跳"""
+
+    __slots__ = ()
+
+
+class InitProgress(Event):
+    """服务 / VM 初始化进度（server_init、server_session）"""
+
+    __slots__ = ('biz_type', 'vm_state')
+
+    def __init__(self, frame: dict, data: dict):
+        super().__init__(frame)
+        self.biz_type = _text(data.get('biz_type'))
+        self.vm_state = _text(data.get('vm_state'))
+
+    @property
+    def ready(self) -> bool:
+        """VM 是否初始化完成"""
+        return self.biz_type == 'init_session' and self.vm_state == 'vm_successful'
+
+
+class Echo(Event):
+    """服务端对 client_test 指令的回执"""
+
+    __slots__ = ('instruction',)
+
+    def __init__(self, frame: dict, data: dict):
+        super().__init__(frame)
+        self.instruction = data.get('instruction', '')
+
+
+class TaskAction(Event):
+    """
+    server_task 中的一个动作，params 为解析后的 data_agent
+
+    is_finish / coalescible 由按 action 注册的解码函数在解码时确定
+    """
+
+    __slots__ = ('biz_type', 'action', 'params', 'is_finish', 'coalescible')
+
+    def __init__(self, frame: dict, data: dict, params: dict, is_finish: bool = False,
+                 coalescible: bool = False):
+        super().__init__(frame)
+        self.biz_type = _text(data.get('biz_type'))
+        self.params = params
+        self.action = _text(params.get('action'))
+        self.is_finish = is_finish
+        self.coalescible = coalescible
+
+
+class Notify(Event):
+    """server_notify 通知"""
+
+    __slots__ = ('biz_type', 'query_status', 'reason')
+
+    def __init__(self, frame: dict, data: dict):
+        super().__init__(frame)
+        self.biz_type = _text(data.get('biz_type'))
+        self.query_status = _text(data.get('query_status'))
+        self.reason = _text(data.get('reason'))
+
+    @property
+    def task_done(self) -> bool:
+        """是否为任务完成通知"""
+        return self.biz_type == 'notify_task' and (
+            self.query_status == 'task_done' or self.reason == 'finished')
+
+
+class Result(Event):
+    """最终执行结果，payload 为 result 消息中的 data"""
+
+    __slots__ = ('result_type', 'payload')
+
+    def __init__(self, frame: dict, data: dict):
+        super().__init__(frame)
+        self.payload = data
+        self.result_type = _text(data.get('result_type')) or 'unknown'
+
+
+class GenericMessage(Event):
+    """未注册的消息类型"""
+
+    __slots__ = ()
+
+
+class Malformed:
+    """无法解析为 JSON 对象的原始消息"""
+
+    __slots__ = ('raw',)
+
+    msg_type = 'malformed'
+    msg_id = None
+    conversation_id = None
+    timestamp = None
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __repr__(self):
+        return f"Malformed({str(self.raw)[:40]!r})"
+
+
+def parse_data_agent(msg_data: dict) -> dict:
+    """解析 server_task 消息中嵌套的 data_agent JSON 字符串"""
+    data_agent = msg_data.get('data_agent', '{}')
+    if isinstance(data_agent, str):
+        try:
+            data_agent = json_loads(data_agent)
+        except JSON_DECODE_ERRORS:
+            return {}
+    return data_agent if isinstance(data_agent, dict) else {}
+
+
+# (msg_type, biz_type) 或 msg_type -> 解码函数 decoder(frame, data) -> Event
+_DECODERS = {}
+
+# server_task 的 action -> 解码函数 decoder(frame, data, params) -> TaskAction
+_ACTION_DECODERS = {}
+
+
+def register(msg_type: str, biz_type: str = None):
+    """注册解码函数；指定 biz_type 时优先于同 msg_type 的通用解码函数"""
+    def decorator(func):
+        _DECODERS[(msg_type, biz_type) if biz_type else msg_type] = func
+        return func
+    return decorator
+
+
+def register_action(*actions: str):
+    """注册 server_task 动作的解码函数（按 data_agent 中的 action），未注册的动作按通用 TaskAction 解码"""
+    def decorator(func):
+        for action in actions:
+            _ACTION_DECODERS[action] = func
+        return func
+    return decorator
+
+
+@register('heartbeat')
+def _decode_heartbeat(frame, data):
+    return Heartbeat(frame)
+
+
+@register('server_init')
+@register('server_session')
+def _decode_init(frame, data):
+    return InitProgress(frame, data)
+
+
+@register('client_test')
+def _decode_echo(frame, data):
+    return Echo(frame, data)
+
+
+@register('server_task')
+def _decode_task(frame, data):
+    params = parse_data_agent(data)
+    action = params.get('action')
+    decoder = _ACTION_DECODERS.get(action) if isinstance(action, str) else None
+    if decoder is None:
+        return TaskAction(frame, data, params)
+    return decoder(frame, data, params)
+
+
+@register_action('finish')
+def _decode_finish(frame, data, params):
+    return TaskAction(frame, data, params, is_finish=True)
+
+
+@register_action(*COALESCE_ACTIONS)
+def _decode_coalescible(frame, data, params):
+    return TaskAction(frame, data, params, coalescible=True)
+
+
+@register('server_notify')
+def _decode_notify(frame, data):
+    return Notify(frame, data)
+
+
+@register('result')
+def _decode_result(frame, data):
+    return Result(frame, data)
+
+
+def decode_frame(message):
+    """
+    解码一帧消息
+
+    Args:
+        message: WebSocket 收到的原始文本或字节
+
+    Returns:
+        Event 子类实例；无法解析时返回 Malformed
+    """
+    try:
+        frame = json_loads(message)
+    except JSON_DECODE_ERRORS:
+        return Malformed(message)
+    if not isinstance(frame, dict):
+        return Malformed(message)
+    data = frame.get('data')
+    if not isinstance(data, dict):
+        data = {}
+    msg_type = frame.get('msg_type', 'unknown')
+    if not isinstance(msg_type, str):
+        # 不可哈希的 msg_type 无法查表，按畸形消息处理
+        return Malformed(message)
+    biz_type = data.get('biz_type')
+    decoder = None
+    if isinstance(biz_type, str):
+        decoder = _DECODERS.get((msg_type, biz_type))
+    if decoder is None:
+        decoder = _DECODERS.get(msg_type)
+    if decoder is None:
+        return GenericMessage(frame)
+    return decoder(frame, data)
@@ -0,0 +1,171 @@
+"""
+AutoGLM 有界开销的格式化
+摘要与显示只处理输出预算以内的部分：序列化在输出达到上限后立即停止，
+长文本按字符数与行数截断，开销与消息大小无关。超大的结果可直接写入文件，终端只显示引用。
+
+配置（环境变量）:
+    AUTO_GLM_SPILL_DIR=results/     # 超大结果写入的目录（未设置时不写文件，只截断显示）
+    AUTO_GLM_SPILL_BYTES=65536      # 结果超过多少字符时写入文件（默认 64K）
+"""
+
+import os
+import re
+import json
+import time
+
+_UNSAFE_NAME_RE = re.compile(r'[^0-9A-Za-z_.-]+')
+
+
+def _iter_json(value, limit: int, indent: int, level: int):
+    """
+    逐段生成 JSON 文本（与 json.dumps 的默认分隔符一致），调用方拿够后即可停止
+
+    字符串与字典键先截到 limit 个字符再转义，单段的开销也不超过预算。
+    """
+    if isinstance(value, dict):
+        if not value:
+            yield '{}'
+            return
+        yield '{'
+        sep = ''
+        for key, item in value.items():
+            yield sep + _newline(indent, level + 1) + json.dumps(str(key)[:limit], ensure_ascii=False) + ': '
+            sep = ',' if indent else ', '
+            yield from _iter_json(item, limit, indent, level + 1)
+        yield _newline(indent, level) + '}'
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            yield '[]'
+            return
+        yield '['
+        sep = ''
+        for item in value:
+            yield sep + _newline(indent, level + 1)
+            sep = ',' if indent else ', '
+            yield from _iter_json(item, limit, indent, level + 1)
+        yield _newline(indent, level) + ']'
+    elif isinstance(value, str):
+        yield json.dumps(value[:limit], ensure_ascii=False)
+    else:
+        yield json.dumps(value, ensure_ascii=False, default=str)[:limit + 2]
+
+
+def _newline(indent: int, level: int) -> str:
+    return '\n' + ' ' * (indent * level) if indent else ''
+
+
+def _size_hint(value) -> str:
+    """不遍历内容即可得到的大小说明"""
+    if isinstance(value, (dict, list, tuple)):
+        return f"共 {len(value)} 项"
+    if isinstance(value, (str, bytes)):
+        return f"共 {len(value)} 字符"
+    return "已截断"
+
+
+def truncate_json(value, max_len: int, indent: int = None) -> tuple:
+    """
+    序列化为 JSON，输出超过 max_len 个字符时提前停止
+
+    Returns:
+        (文本, 是否完整)；不完整时文本为前 max_len 个字符
+    """
+    pieces = []
+    length = 0
+    for piece in _iter_json(value, max_len, indent, 0):
+        pieces.append(piece)
+        length += len(piece)
+        if length > max_len:
+            return ''.join(pieces)[:max_len], False
+    return ''.join(pieces), True
+
+
+def summarize(value, max_len: int = 100, indent: int = None) -> str:
+    """对复杂值生成不超过 max_len 个字符（另加截断说明）的摘要"""
+    text, complete = truncate_json(value, max_len, indent)
+    if complete:
+        return text
+    return f"{text}... ({_size_hint(value)})"
+
+
+def clip_text(text: str, max_chars: int = 2000, max_lines: int = 40) -> str:
+    """截断长文本：最多 max_chars 个字符、max_lines 行，超出部分以一行说明代替"""
+    head = text[:max_chars]
+    lines = head.split('\n', max_lines)
+    if len(lines) > max_lines:
+        head = '\n'.join(lines[:max_lines])
+    if len(head) == len(text):
+        return text
+    return f"{head}\n... (共 {len(text)} 字符，已省略 {len(text) - len(head)} 字符)"
+
+
+def estimate_size(value, limit: int) -> int:
+    """估计值序列化后的字符数，累计超过 limit 即停止（返回值大于 limit 表示“至少这么大”）"""
+    size = 0
+    stack = [value]
+    while stack and size <= limit:
+        item = stack.pop()
+        if isinstance(item, dict):
+            size += 2 + 4 * len(item)
+            for key, child in item.items():
+                size += len(key) if isinstance(key, str) else 8
+                stack.append(child)
+        elif isinstance(item, (list, tuple)):
+            size += 2 + 2 * len(item)
+            stack.extend(item)
+        elif isinstance(item, (str, bytes)):
+            size += len(item) + 2
+        else:
+            size += 8
+    return size
+
+
+class ResultSpill:
+    """超大结果写入文件：显示时只给出路径与大小，不在终端输出全部内容"""
+
+    def __init__(self, directory: str, threshold: int = 64 * 1024):
+        """
+        Args:
+            directory: 写入的目录，不存在时创建
+            threshold: 结果超过多少字符时写入文件
+        """
+        self.directory = directory
+        self.threshold = threshold
+        self.spilled = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ResultSpill":
+        """从 AUTO_GLM_SPILL_DIR / AUTO_GLM_SPILL_BYTES 读取，未设置目录时返回 None"""
+        directory = os.getenv("AUTO_GLM_SPILL_DIR")
+        if not directory:
+            return None
+        return cls(directory, int(os.getenv("AUTO_GLM_SPILL_BYTES", str(64 * 1024))))
+
+    def oversized(self, value) -> bool:
+        """值是否超过阈值（有界估计）"""
+        if isinstance(value, str):
+            return len(value) > self.threshold
+        return estimate_size(value, self.threshold) > self.threshold
+
+    def _path(self, msg_id: str, suffix: str) -> str:
+        name = _UNSAFE_NAME_RE.sub('_', msg_id or '')[:64] or time.strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.directory, f"result-{name}{suffix}")
+
+    def write(self, msg_id: str, value) -> str:
+        """
+        把值写入文件（文本原样写入 .txt，其余流式序列化为 .json）
+
+        Returns:
+            文件路径
+        """
+        if isinstance(value, str):
+            path = self._path(msg_id, '.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(value)
+        else:
+            path = self._path(msg_id, '.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False, default=str)
+        self.spilled += 1
+        return path
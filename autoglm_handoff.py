@@ -0,0 +1,305 @@
+"""
+AutoGLM 预热会话交接
+VM 初始化通常需要数秒到数十秒。TLS 上的 WebSocket 连接无法在进程之间传递，
+因此由一个后台保温进程（keeper）持有上游连接：它连接服务端并等待 VM 就绪，
+然后在 127.0.0.1 的随机端口上监听，把地址与一次性令牌写入交接文件。
+新启动的命令行读取交接文件并连接 keeper，keeper 先重放初始化消息，再在两端之间原样转发，
+命令行不必等待 VM 初始化即可直接执行指令。keeper 只接受一个客户端，
+客户端断开或空闲超过有效期后关闭上游连接并退出。
+
+配置（环境变量）:
+    AUTO_GLM_HANDOFF=.autoglm_handoff.json   # 交接文件路径（未设置时不预热）
+    AUTO_GLM_HANDOFF_TTL=300                 # 预热会话的空闲有效期（秒，默认 300）
+
+用法:
+    python autoglm_handoff.py keep .autoglm_handoff.json --ttl 300   # 通常由交互式命令行退出时自动启动
+"""
+
+import os
+import sys
+import json
+import time
+import secrets
+import asyncio
+import argparse
+import subprocess
+from http import HTTPStatus
+
+from autoglm_events import decode_frame, Heartbeat, InitProgress
+
+
+def read_handoff(path: str) -> dict:
+    """读取交接文件，文件不存在、无法解析或已过期时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(info, dict) or not info.get('url') or not info.get('token'):
+        return None
+    if info.get('expires', 0) <= time.time():
+        return None
+    return info
+
+
+def write_handoff(path: str, info: dict):
+    """原子写入交接文件（只有当前用户可读，文件中含有令牌）"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    os.replace(tmp, path)
+
+
+def remove_handoff(path: str, token: str):
+    """删除交接文件（只删除令牌匹配的，不影响之后启动的 keeper 写入的文件）"""
+    info = read_handoff(path)
+    if info is not None and info.get('token') != token:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class WarmHandoff:
+    """交互式命令行一侧：启动时接入预热会话，退出时启动 keeper 为下一次预热"""
+
+    def __init__(self, path: str, ttl: float = 300):
+        """
+        Args:
+            path: 交接文件路径
+            ttl: 预热会话的空闲有效期（秒）
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.ttl = ttl
+
+    @classmethod
+    def from_env(cls) -> "WarmHandoff":
+        """从 AUTO_GLM_HANDOFF / AUTO_GLM_HANDOFF_TTL 读取，未设置路径时返回 None"""
+        path = os.getenv("AUTO_GLM_HANDOFF")
+        if not path:
+            return None
+        return cls(path, float(os.getenv("AUTO_GLM_HANDOFF_TTL", "300")))
+
+    def available(self) -> bool:
+        """是否有尚未过期的预热会话"""
+        return read_handoff(self.path) is not None
+
+    async def attach(self, session, timeout: float = 3) -> dict:
+        """
+        把会话连接到预热会话（keeper），连接后会话的地址与认证恢复原配置，之后的重连直接连服务端
+
+        Args:
+            session: 尚未连接的 AutoGLMSession
+            timeout: 连接 keeper 的超时（秒）
+
+        Returns:
+            交接信息；没有可用的预热会话或连接失败时返回 None，调用方按原配置连接
+        """
+        info = read_handoff(self.path)
+        if info is None:
+            return None
+        saved = session.url, session.headers, session.keys, session.on_error
+        # keeper 使用一次性令牌认证，不占用 Key 池名额；连接失败时静默回退，不显示错误
+        session.url = info['url']
+        session.headers = {"Authorization": f"Bearer {info['token']}"}
+        session.keys = None
+        session.on_error = None
+        try:
+            await session.connect(timeout)
+        except Exception:
+            # keeper 已退出（或已被其他命令行接入），交接文件作废
+            remove_handoff(self.path, info['token'])
+            return None
+        finally:
+            session.url, session.headers, session.keys, session.on_error = saved
+        return info
+
+    def spawn(self) -> int:
+        """
+        在后台启动 keeper 进程（与当前终端分离，日志写入 交接文件.log）
+
+        Returns:
+            keeper 进程号
+        """
+        args = [sys.executable, os.path.abspath(__file__), 'keep', self.path, '--ttl', str(self.ttl)]
+        if os.name == 'posix':
+            detach = {'start_new_session': True}
+        else:
+            detach = {'creationflags': subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+        with open(f"{self.path}.log", 'ab') as log:
+            proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                                    cwd=os.getcwd(), **detach)
+        return proc.pid
+
+
+class WarmKeeper:
+    """
+    保温进程：持有一个 VM 已就绪的上游连接，交给下一个连接到本地端口的命令行
+
+    初始化阶段的消息（server_init / server_session）缓存下来，客户端接入时先重放，
+    客户端的会话因此按正常流程得到 vm_ready；接入前收到的心跳直接丢弃。
+    """
+
+    def __init__(self, config, path: str, ttl: float = 300, ready_timeout: float = 60):
+        """
+        Args:
+            config: AutoGLMConfig（上游地址与 API Key）
+            path: 交接文件路径
+            ttl: 等待客户端接入的最长时间（秒）
+            ready_timeout: 等待 VM 就绪的最长时间（秒）
+        """
+        self.config = config
+        self.path = path
+        self.ttl = ttl
+        self.ready_timeout = ready_timeout
+        self.token = secrets.token_urlsafe(24)
+        self.init_frames = []  # 就绪前收到的初始化消息（原始帧）
+        self.frames_relayed = 0
+        self._upstream = None
+        self._drainer = None
+        self._attached = asyncio.Event()
+        self._finished = asyncio.Event()
+
+    async def run(self) -> str:
+        """
+        连接上游、等待 VM 就绪、发布交接文件并等待客户端接入，结束后关闭上游连接
+
+        Returns:
+            结束原因
+        """
+        from websockets.asyncio.client import connect as ws_connect
+        from websockets.asyncio.server import serve
+
+        self._upstream = await asyncio.wait_for(
+            ws_connect(self.config.url, additional_headers=self.config.headers, max_size=None), 10)
+        server = None
+        try:
+            if not await self._wait_ready():
+                return "VM 初始化超时或连接断开"
+            server = await serve(self._handler, "127.0.0.1", 0,
+                                 process_request=self._check_auth, max_size=None)
+            port = server.sockets[0].getsockname()[1]
+            write_handoff(self.path, {
+                "url": f"ws://127.0.0.1:{port}",
+                "token": self.token,
+                "pid": os.getpid(),
+                "upstream": self.config.url,
+                "created": time.time(),
+                "expires": time.time() + self.ttl,
+            })
+            self._drainer = asyncio.ensure_future(self._drain())
+            attached = asyncio.ensure_future(self._attached.wait())
+            await asyncio.wait({attached, self._drainer}, timeout=self.ttl,
+                               return_when=asyncio.FIRST_COMPLETED)
+            attached.cancel()
+            if not self._attached.is_set():
+                return "上游连接已断开" if self._drainer.done() else f"{self.ttl:g} 秒内没有客户端接入"
+            await self._finished.wait()
+            return f"客户端已断开，共转发 {self.frames_relayed} 帧"
+        finally:
+            remove_handoff(self.path, self.token)
+            if self._drainer is not None:
+                self._drainer.cancel()
+            if server is not None:
+                server.close()
+            await self._upstream.close()
+
+    async def _wait_ready(self) -> bool:
+        """接收初始化消息直到 VM 就绪，缓存非心跳帧"""
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            async with asyncio.timeout(self.ready_timeout):
+                async for message in self._upstream:
+                    event = decode_frame(message)
+                    if isinstance(event, Heartbeat):
+                        continue
+                    self.init_frames.append(message)
+                    if isinstance(event, InitProgress) and event.ready:
+                        return True
+        except (TimeoutError, ConnectionClosed):
+            pass
+        return False
+
+    async def _drain(self):
+        """客户端接入前持续读取上游（丢弃心跳），上游断开时结束"""
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            async for _ in self._upstream:
+                pass
+        except ConnectionClosed:
+            pass
+
+    def _check_auth(self, connection, request):
+        """只接受持有令牌的第一个客户端"""
+        if request.headers.get("Authorization") != f"Bearer {self.token}":
+            return connection.respond(HTTPStatus.UNAUTHORIZED, "invalid token\n")
+        if self._attached.is_set():
+            return connection.respond(HTTPStatus.CONFLICT, "already attached\n")
+        return None
+
+    async def _handler(self, ws):
+        """重放初始化消息，然后在客户端与上游之间双向转发"""
+        if self._attached.is_set():
+            await ws.close(1013, "already attached")
+            return
+        self._attached.set()
+        remove_handoff(self.path, self.token)
+        if self._drainer is not None:
+            self._drainer.cancel()
+            await asyncio.gather(self._drainer, return_exceptions=True)
+        try:
+            for message in self.init_frames:
+                await ws.send(message)
+            pumps = {asyncio.ensure_future(self._relay(self._upstream, ws)),
+                     asyncio.ensure_future(self._relay(ws, self._upstream))}
+            _, pending = await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+            for pump in pending:
+                pump.cancel()
+            await ws.close()
+        finally:
+            self._finished.set()
+
+    async def _relay(self, source, target):
+        """把 source 收到的每一帧原样发给 target，任一端断开时结束"""
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            async for message in source:
+                await target.send(message)
+                self.frames_relayed += 1
+        except ConnectionClosed:
+            pass
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="AutoGLM 预热会话保温进程")
+    parser.add_argument("command", choices=["keep"], help="keep: 预热一个会话并等待命令行接入")
+    parser.add_argument("path", help="交接文件路径")
+    parser.add_argument("--ttl", type=float, default=300, help="等待客户端接入的最长时间（秒，默认 300）")
+    args = parser.parse_args()
+
+    from autoglm_client import AutoGLMConfig
+
+    config = AutoGLMConfig.from_env()
+    try:
+        config.validate()
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    start = time.time()
+    print(f"♨️  [{time.strftime('%H:%M:%S')}] 预热会话: {config.url} -> {args.path}", file=sys.stderr)
+    try:
+        reason = asyncio.run(WarmKeeper(config, args.path, args.ttl).run())
+    except Exception as e:
+        print(f"❌ 预热失败: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"👋 [{time.strftime('%H:%M:%S')}] {reason}（运行 {time.time() - start:.0f}s）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+AutoGLM 批量执行日志（write-ahead journal）
+把每条指令的状态变化（queued / sent / finished / failed）按 JSONL 追加写入日志文件，
+由后台线程批量 fsync。中断后用同一日志重新运行时，已结束的指令直接跳过，
+只重新执行排队中或执行到一半的指令。
+
+日志行格式:
+    {"ts": 1700000000.0, "event": "queued", "key": "q1", "instruction": "..."}
+    {"ts": ..., "event": "sent", "key": "q1", "msg_id": "..."}
+    {"ts": ..., "event": "finished", "key": "q1", "record": {...结果行...}}
+    {"ts": ..., "event": "failed", "key": "q1", "status": "timeout", "error": "..."}
+"""
+
+import os
+import json
+import time
+import threading
+
+# 表示指令已结束的事件
+TERMINAL_EVENTS = ("finished", "failed")
+
+
+class BatchJournal:
+    """
+    追加写的批量执行日志
+
+    以输入项的 id 为键，只在内存中保留每个键的最后一个事件。每条记录立即写入操作系统缓冲区，
+    进程崩溃不会丢失；fsync 批量进行（累计 sync_every 条或每隔 sync_interval 秒），
+    主机掉电最多丢失最近一个同步周期内的状态变化（这些指令会被重新执行）。
+    """
+
+    def __init__(self, path: str, sync_interval: float = 1.0, sync_every: int = 100):
+        """
+        Args:
+            path: 日志文件路径，已存在时读入其中的状态并继续追加
+            sync_interval: 后台 fsync 的间隔（秒）
+            sync_every: 累计多少条未同步记录时立即 fsync
+        """
+        self.path = path
+        self.sync_interval = sync_interval
+        self.sync_every = sync_every
+        self.states = {}  # 键 -> 最后一个事件名
+        self.corrupt = 0  # 无法解析的行数（通常是崩溃时写了一半的最后一行）
+        self.syncs = 0
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._needs_newline:
+            self._file.write('\n')
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._sync_loop, name="autoglm-journal", daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        """读入已有日志，恢复每个键的最后状态"""
+        self._needs_newline = False
+        try:
+            f = open(self.path, encoding='utf-8', errors='replace')
+        except FileNotFoundError:
+            return
+        with f:
+            line = ''
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.states[entry['key']] = entry['event']
+                except (ValueError, KeyError, TypeError):
+                    if line.strip():
+                        self.corrupt += 1
+            self._needs_newline = bool(line) and not line.endswith('\n')
+
+    def state(self, key) -> str:
+        """键的最后一个事件，未出现过时返回 None"""
+        return self.states.get(str(key))
+
+    def is_done(self, key, retry_failed: bool = False) -> bool:
+        """指令是否已结束（retry_failed 时只有 finished 算结束）"""
+        state = self.state(key)
+        return state == "finished" or (state == "failed" and not retry_failed)
+
+    def append(self, event: str, key, **fields):
+        """追加一条事件"""
+        key = str(key)
+        line = json.dumps({"ts": time.time(), "event": event, "key": key, **fields}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.states[key] = event
+            self._dirty += 1
+            if self._dirty >= self.sync_every:
+                self._sync_locked()
+
+    def queued(self, key, instruction: str):
+        """指令进入队列"""
+        self.append("queued", key, instruction=instruction)
+
+    def sent(self, key, msg_id: str):
+        """指令已发给 VM"""
+        self.append("sent", key, msg_id=msg_id)
+
+    def finished(self, key, record: dict):
+        """指令执行成功，保存完整结果行"""
+        self.append("finished", key, record=record)
+
+    def failed(self, key, status: str, error: str = None):
+        """指令超时或出错"""
+        self.append("failed", key, status=status, error=error)
+
+    def sync(self):
+        """把缓冲的记录写入磁盘并 fsync"""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self):
+        """同步（调用方持有锁）"""
+        if not self._dirty or self._file.closed:
+            return
+        os.fsync(self._file.fileno())
+        self._dirty = 0
+        self.syncs += 1
+
+    def _sync_loop(self):
+        """后台线程：定期同步"""
+        while not self._closed.wait(self.sync_interval):
+            self.sync()
+
+    def stats(self) -> dict:
+        """各状态的键数量与同步次数"""
+        counts = {"finished": 0, "failed": 0, "pending": 0}
+        for event in self.states.values():
+            counts[event if event in TERMINAL_EVENTS else "pending"] += 1
+        counts["syncs"] = self.syncs
+        counts["corrupt"] = self.corrupt
+        return counts
+
+    def close(self):
+        """同步剩余记录并关闭文件"""
+        self._closed.set()
+        self._thread.join()
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
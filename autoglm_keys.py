@@ -0,0 +1,283 @@
+"""
+AutoGLM 多 API Key 轮换
+每个 Key 有独立的令牌桶（每分钟指令数）与最大并发会话数；建立会话时选择仍有余量的 Key，
+服务端拒绝（401 / 403）或限流（429、关闭码 1008 / 1013）时对该 Key 指数退避，并统计各 Key 的用量。
+
+配置（环境变量）:
+    AUTO_GLM_API_KEYS=key1,key2:30:4     # 逗号分隔，每项为 key[:每分钟指令数[:最大会话数]]
+    AUTO_GLM_KEY_RPM=60                  # 未单独指定时的每分钟指令数（0 或未设置表示不限）
+    AUTO_GLM_KEY_SESSIONS=2              # 未单独指定时的最大会话数（0 或未设置表示不限）
+"""
+
+import os
+import math
+import time
+import asyncio
+
+# 限流类的 WebSocket 关闭码：1008 策略违规、1013 稍后重试
+THROTTLE_CLOSE_CODES = (1008, 1013)
+
+
+class TokenBucket:
+    """令牌桶：按 rate（个/秒）补充，最多积累 capacity 个"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, float(math.ceil(rate)))
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, now: float = None) -> float:
+        """
+        取一个令牌
+
+        Returns:
+            0 表示成功取到；否则为还需等待的秒数（未取走令牌）
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def available(self, now: float = None) -> float:
+        """当前可用令牌数"""
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens
+
+
+class ApiKey:
+    """单个 API Key 的配额与用量"""
+
+    def __init__(self, key: str, rpm: float = None, max_sessions: int = None,
+                 backoff_base: float = 5.0, backoff_max: float = 300.0):
+        """
+        Args:
+            key: API Key
+            rpm: 每分钟最多发送的指令数，None 表示不限
+            max_sessions: 同时打开的最大会话数，None 表示不限
+            backoff_base: 首次被拒绝 / 限流后的退避秒数，连续失败时翻倍
+            backoff_max: 退避上限（秒）
+        """
+        self.key = key
+        self.rpm = rpm
+        self.max_sessions = max_sessions
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rpm / 60) if rpm else None
+        self.sessions = 0  # 当前占用的会话数
+        self.opened = 0  # 累计建立的会话数
+        self.instructions = 0  # 累计发送的指令数
+        self.throttled = 0  # 被限流次数
+        self.rejected = 0  # 被拒绝次数
+        self.waited = 0.0  # 因令牌不足累计等待的秒数
+        self.backoff_until = 0.0
+        self._failures = 0  # 连续失败次数
+
+    @property
+    def label(self) -> str:
+        """用于显示的脱敏 Key"""
+        return f"{self.key[:6]}…{self.key[-4:]}" if len(self.key) > 12 else self.key[:3] + "…"
+
+    def headroom(self, now: float) -> float:
+        """剩余余量（0 表示当前不可用），越大越优先"""
+        if now < self.backoff_until:
+            return 0.0
+        if self.max_sessions is not None and self.sessions >= self.max_sessions:
+            return 0.0
+        session_room = 1 - self.sessions / self.max_sessions if self.max_sessions else 1.0
+        token_room = min(self.bucket.available(now) / self.bucket.capacity, 1.0) if self.bucket else 1.0
+        return max(session_room * (0.5 + 0.5 * token_room), 1e-6)
+
+    def penalize(self, reason: str):
+        """被拒绝或限流：指数退避"""
+        if reason == 'throttled':
+            self.throttled += 1
+        else:
+            self.rejected += 1
+        delay = min(self.backoff_base * 2 ** self._failures, self.backoff_max)
+        self._failures += 1
+        self.backoff_until = time.monotonic() + delay
+
+    def stats(self, now: float = None) -> dict:
+        """用量统计"""
+        now = time.monotonic() if now is None else now
+        return {
+            "key": self.label,
+            "sessions": self.sessions,
+            "max_sessions": self.max_sessions,
+            "rpm": self.rpm,
+            "opened": self.opened,
+            "instructions": self.instructions,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "waited": self.waited,
+            "backoff": max(self.backoff_until - now, 0.0),
+        }
+
+
+class KeyPool:
+    """
+    API Key 池
+
+    acquire 在建立连接前选出余量最大的 Key 并占用一个会话名额，连接断开后 release；
+    throttle 在每次发送指令前从该 Key 的令牌桶取令牌，不足时等待。
+    只在单个事件循环中使用。
+    """
+
+    def __init__(self, keys: list):
+        if not keys:
+            raise ValueError("至少需要一个 API Key")
+        self.keys = keys
+
+    @classmethod
+    def parse(cls, spec: str, rpm: float = None, max_sessions: int = None) -> "KeyPool":
+        """
+        解析 "key1,key2:30:4" 形式的配置
+
+        Args:
+            spec: 逗号分隔的 key[:每分钟指令数[:最大会话数]]
+            rpm: 未单独指定时的每分钟指令数
+            max_sessions: 未单独指定时的最大会话数
+        """
+        keys = []
+        for entry in spec.split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            parts = entry.split(':')
+            key_rpm = float(parts[1]) if len(parts) > 1 and parts[1] else rpm
+            key_sessions = int(parts[2]) if len(parts) > 2 and parts[2] else max_sessions
+            keys.append(ApiKey(parts[0], key_rpm or None, key_sessions or None))
+        return cls(keys)
+
+    @classmethod
+    def from_env(cls) -> "KeyPool":
+        """从 AUTO_GLM_API_KEYS 等环境变量读取，未设置时返回 None"""
+        spec = os.getenv("AUTO_GLM_API_KEYS")
+        if not spec:
+            return None
+        return cls.parse(spec, float(os.getenv("AUTO_GLM_KEY_RPM", "0")),
+                         int(os.getenv("AUTO_GLM_KEY_SESSIONS", "0")))
+
+    def share(self, parts: int, index: int = 0) -> "KeyPool":
+        """
+        按 parts 份切分配额（多进程时每个进程一份），返回第 index 份
+
+        会话上限按整数切分，除不尽的会话依次分给不同的份（不同 Key 的余数错开分配），
+        各份之和不超过原上限，会话上限小于 parts 时部分份分不到该 Key（上限为 0，不会选用）。
+        每分钟指令数按分到的会话比例切分，未限制会话数时均分。
+
+        Returns:
+            新的 KeyPool，用量统计从零开始
+        """
+        keys = []
+        offset = 0  # 前面各 Key 的余数已分到的份，下一个 Key 的余数从其后开始分
+        for k in self.keys:
+            sessions = None
+            rpm = k.rpm / parts if k.rpm else None
+            if k.max_sessions:
+                base, extra = divmod(k.max_sessions, parts)
+                sessions = base + (1 if (index - offset) % parts < extra else 0)
+                offset = (offset + extra) % parts
+                if k.rpm and sessions:
+                    rpm = k.rpm * sessions / k.max_sessions
+            keys.append(ApiKey(k.key, rpm, sessions, k.backoff_base, k.backoff_max))
+        return KeyPool(keys)
+
+    @property
+    def capacity(self) -> int:
+        """所有 Key 的并发会话总数，任一 Key 不限时返回 None"""
+        if any(k.max_sessions is None for k in self.keys):
+            return None
+        return sum(k.max_sessions for k in self.keys)
+
+    def pick(self) -> ApiKey:
+        """选出余量最大的可用 Key（余量相同时取占用会话较少的），没有时返回 None（不占用名额）"""
+        now = time.monotonic()
+        best = max(self.keys, key=lambda k: (k.headroom(now), -k.sessions, -k.opened))
+        return best if best.headroom(now) > 0 else None
+
+    async def acquire(self, timeout: float = None) -> ApiKey:
+        """
+        占用一个会话名额，所有 Key 都没有余量时等待
+
+        Returns:
+            选中的 Key；超时抛出 ConnectionError
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            key = self.pick()
+            if key is not None:
+                key.sessions += 1
+                key.opened += 1
+                return key
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                raise ConnectionError("所有 API Key 均已达到并发上限或处于退避中")
+            wait = min((k.backoff_until - now for k in self.keys if k.backoff_until > now), default=0.5)
+            wait = min(max(wait, 0.05), 0.5)
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            await asyncio.sleep(wait)
+
+    def release(self, key: ApiKey, success: bool = True):
+        """释放会话名额；success 表示该连接曾正常建立，清零连续失败计数"""
+        key.sessions = max(key.sessions - 1, 0)
+        if success:
+            key._failures = 0
+
+    async def throttle(self, key: ApiKey):
+        """发送指令前取令牌，不足时等待"""
+        if key.bucket is not None:
+            while True:
+                wait = key.bucket.try_take()
+                if not wait:
+                    break
+                key.waited += wait
+                await asyncio.sleep(wait)
+        key.instructions += 1
+
+    def report_error(self, key: ApiKey, error: Exception):
+        """根据握手失败的 HTTP 状态码判断是否对 Key 退避"""
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None)
+        if status == 429:
+            key.penalize('throttled')
+        elif status in (401, 403):
+            key.penalize('rejected')
+
+    def report_close(self, key: ApiKey, code: int) -> bool:
+        """
+        连接被服务端以限流类关闭码断开时退避
+
+        Returns:
+            是否为限流类关闭（此时 release 不应清零连续失败计数，退避才能逐次翻倍）
+        """
+        if code in THROTTLE_CLOSE_CODES:
+            key.penalize('throttled')
+            return True
+        return False
+
+    def stats(self) -> list:
+        """各 Key 的用量统计"""
+        now = time.monotonic()
+        return [k.stats(now) for k in self.keys]
+
+    def format_lines(self) -> list:
+        """可读的用量行"""
+        lines = []
+        for s in self.stats():
+            limit = f"{s['sessions']}/{s['max_sessions'] or '∞'} 会话"
+            rpm = f"{s['rpm']:g}/分" if s['rpm'] else "不限速"
+            line = (f"{s['key']}: {limit}，{rpm}，累计会话 {s['opened']}、指令 {s['instructions']}，"
+                    f"限流 {s['throttled']}，拒绝 {s['rejected']}")
+            if s['backoff'] > 0:
+                line += f"，退避中 {s['backoff']:.0f}s"
+            lines.append(line)
+        return lines
@@ -0,0 +1,201 @@
+"""
+AutoGLM 连接存活检测与自适应任务期限
+根据心跳到达间隔和 ping 往返时间判断连接是否存活，
+并根据相似指令的历史耗时与动作数推算每条指令的等待期限和停滞判定时间
+"""
+
+import re
+import time
+from collections import OrderedDict, deque
+
+from autoglm_metrics import percentile
+
+# 归一化时去掉的空白与标点
+_NOISE_RE = re.compile(r"[\s　,，.。!！?？;；:：、~～\"'“”‘’()（）\[\]【】]+")
+
+
+def normalize_instruction(instruction: str) -> str:
+    """归一化指令文本：去掉空白与标点并统一小写，用于判断“相同/相似”指令"""
+    return _NOISE_RE.sub('', instruction).lower()
+
+
+class LivenessMonitor:
+    """
+    连接存活检测
+
+    记录每帧到达时间、心跳间隔（指数加权平均）和 ping 往返时间。
+    连续 miss_limit 个心跳周期没有收到任何消息，或 ping 超时未回应，即判定连接失效。
+    """
+
+    def __init__(self, miss_limit: int = 3, ping_interval: float = 5.0, ping_timeout: float = 10.0,
+                 heartbeat_interval: float = None, alpha: float = 0.2):
+        """
+        Args:
+            miss_limit: 允许连续错过的心跳周期数
+            ping_interval: 客户端 ping 间隔（秒），0 表示不发送
+            ping_timeout: ping 等待 pong 的超时（秒）
+            heartbeat_interval: 已知的心跳间隔（秒），未知时从实际到达间隔估计
+            alpha: 指数加权平均系数
+        """
+        self.miss_limit = miss_limit
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.alpha = alpha
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeats = 0
+        self.rtt = None  # 最近一次 ping 往返时间（秒）
+        self.rtt_avg = None
+        self.failures = 0  # 判定失效的次数
+        self.last_frame_at = None
+        self.last_heartbeat_at = None
+
+    def reset(self):
+        """新连接建立时重置计时（保留心跳间隔与 RTT 估计）"""
+        self.last_frame_at = time.monotonic()
+        self.last_heartbeat_at = None
+
+    def on_frame(self, heartbeat: bool = False):
+        """收到一帧消息"""
+        now = time.monotonic()
+        self.last_frame_at = now
+        if not heartbeat:
+            return
+        if self.last_heartbeat_at is not None:
+            self.heartbeat_interval = self._ewma(self.heartbeat_interval, now - self.last_heartbeat_at)
+        self.last_heartbeat_at = now
+        self.heartbeats += 1
+
+    def on_pong(self, rtt: float):
+        """收到 pong"""
+        self.rtt = rtt
+        self.rtt_avg = self._ewma(self.rtt_avg, rtt)
+
+    @property
+    def silence_limit(self):
+        """允许的最长静默时间（秒），心跳间隔未知时为 None"""
+        if not self.heartbeat_interval:
+            return None
+        return self.heartbeat_interval * self.miss_limit
+
+    def check(self):
+        """检查连接是否失效，失效时返回原因，否则返回 None"""
+        limit = self.silence_limit
+        if limit is None or self.last_frame_at is None:
+            return None
+        silent = time.monotonic() - self.last_frame_at
+        if silent > limit:
+            return f"{silent:.1f} 秒未收到任何消息（超过 {self.miss_limit} 个心跳周期）"
+        return None
+
+    def stats(self) -> dict:
+        """存活检测统计"""
+        return {
+            "heartbeat_interval": self.heartbeat_interval,
+            "heartbeats": self.heartbeats,
+            "last_frame_age": (time.monotonic() - self.last_frame_at) if self.last_frame_at else None,
+            "rtt": self.rtt,
+            "rtt_avg": self.rtt_avg,
+            "failures": self.failures,
+        }
+
+    def _ewma(self, current, sample: float) -> float:
+        return sample if current is None else current + self.alpha * (sample - current)
+
+
+class DeadlineEstimator:
+    """
+    自适应任务期限
+
+    按“完全相同的归一化指令 -> 指令前缀 -> 全部指令”逐级查找历史样本，
+    样本足够时用耗时与动作数的 p90 推算期限，用动作间隔的 p99 推算停滞判定时间；
+    没有足够样本时退回默认期限。
+    前缀与全部指令只是粗略的相似，由它们推算的期限只会延长、不会低于默认期限，也不做停滞判定，
+    避免几条短任务让无关的长任务被误判超时。
+    """
+
+    GLOBAL_KEY = '*'
+
+    def __init__(self, default: float = 120, min_deadline: float = 15, max_deadline: float = 600,
+                 margin: float = 1.5, stall_factor: float = 3.0, min_stall: float = 10,
+                 min_samples: int = 3, prefix_len: int = 4, history: int = 200, max_keys: int = 4096):
+        """
+        Args:
+            default: 样本不足时的期限（秒），也是前缀 / 全部指令推算期限的下限
+            min_deadline / max_deadline: 推算期限的上下限（秒）
+            margin: 在历史分位数基础上放宽的倍数
+            stall_factor: 停滞判定时间相对历史最长动作间隔 p99 的倍数
+            min_stall: 停滞判定时间下限（秒）
+            min_samples: 使用某一级历史所需的最少样本数
+            prefix_len: 相似指令使用的前缀长度（字符）
+            history: 每一级保留的样本数
+            max_keys: 最多保留的历史分组数，超出时淘汰最久未使用的
+        """
+        self.default = default
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self.margin = margin
+        self.stall_factor = stall_factor
+        self.min_stall = min_stall
+        self.min_samples = min_samples
+        self.prefix_len = prefix_len
+        self.history = history
+        self.max_keys = max_keys
+        self._samples = OrderedDict()  # key -> deque[(duration, action_count, max_gap)]，按最近使用排序
+
+    def _keys(self, instruction: str):
+        normalized = normalize_instruction(instruction)
+        return (f"={normalized}", f"^{normalized[:self.prefix_len]}", self.GLOBAL_KEY)
+
+    def observe(self, instruction: str, duration: float, action_count: int, max_gap: float):
+        """记录一次成功完成的任务"""
+        sample = (duration, action_count, max_gap)
+        for key in self._keys(instruction):
+            bucket = self._samples.get(key)
+            if bucket is None:
+                bucket = self._samples[key] = deque(maxlen=self.history)
+            else:
+                self._samples.move_to_end(key)
+            bucket.append(sample)
+        while len(self._samples) > self.max_keys:
+            self._samples.popitem(last=False)
+
+    def observe_task(self, record):
+        """从已完成的 TaskRecord 中记录样本"""
+        if record.status != 'finished' or record.duration is None:
+            return
+        times = [record.sent_at] + record.action_times
+        max_gap = max((b - a for a, b in zip(times, times[1:])), default=0.0)
+        self.observe(record.instruction, record.duration, len(record.actions), max_gap)
+
+    def _samples_for(self, instruction: str):
+        """
+        Returns:
+            (样本, 是否为完全相同指令的样本)；样本不足时为 (None, False)
+        """
+        for key in self._keys(instruction):
+            bucket = self._samples.get(key)
+            if bucket is not None and len(bucket) >= self.min_samples:
+                self._samples.move_to_end(key)
+                return bucket, key[0] == '='
+        return None, False
+
+    def deadline(self, instruction: str) -> float:
+        """指令的等待期限（秒）"""
+        samples, exact = self._samples_for(instruction)
+        if samples is None:
+            return self.default
+        durations = sorted(s[0] for s in samples)
+        counts = sorted(s[1] for s in samples)
+        # 每个动作的典型耗时 × 动作数 p90，防止动作多的任务被过早判超时
+        per_action = percentile(sorted(s[0] / max(s[1], 1) for s in samples), 0.5)
+        estimate = max(percentile(durations, 0.9), percentile(counts, 0.9) * per_action) * self.margin
+        floor = self.min_deadline if exact else max(self.default, self.min_deadline)
+        return min(max(estimate, floor), max(self.max_deadline, floor))
+
+    def stall_timeout(self, instruction: str):
+        """两个动作之间允许的最长间隔（秒），没有相同指令的足够样本时返回 None（不做停滞判定）"""
+        samples, exact = self._samples_for(instruction)
+        if not exact:
+            return None
+        gaps = sorted(s[2] for s in samples)
+        return min(max(percentile(gaps, 0.99) * self.stall_factor, self.min_stall), self.deadline(instruction))
@@ -0,0 +1,152 @@
+"""
+AutoGLM 指令延迟统计
+从任务时间线中采集排队到首个动作、动作间隔、端到端耗时等样本，计算 p50/p90/p99，
+并导出为 JSON 或 Prometheus 文本格式
+"""
+
+import json
+import math
+from collections import deque
+
+# 统计的分位数
+QUANTILES = (0.5, 0.9, 0.99)
+
+# 指标名 -> 说明
+LATENCY_METRICS = {
+    "queue_to_first_action": "指令入队到收到第一个动作的耗时（秒）",
+    "echo_latency": "指令发送到收到 client_test 回执的耗时（秒）",
+    "inter_action_gap": "相邻两个动作之间的间隔（秒）",
+    "end_to_end": "指令入队到任务结束（finish / task_done）的耗时（秒）",
+    "result_delay": "任务结束到收到 result 消息的耗时（秒）",
+    "clock_skew": "本地接收时间减去服务端 timestamp 的差值（秒），包含网络延迟",
+}
+
+
+def percentile(sorted_values, q: float) -> float:
+    """对已排序的样本做线性插值求分位数"""
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * q
+    lower = math.floor(pos)
+    upper = math.ceil(pos)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+class LatencyMetrics:
+    """
+    延迟样本收集器
+
+    每个指标只保留最近 max_samples 个样本，内存占用有上限；
+    sum/count 为全量累计值，与 Prometheus summary 语义一致。
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self.samples = {name: deque(maxlen=max_samples) for name in LATENCY_METRICS}
+        self.sums = dict.fromkeys(LATENCY_METRICS, 0.0)
+        self.counts = dict.fromkeys(LATENCY_METRICS, 0)
+        self.task_status = {}  # status -> 任务数量
+
+    def observe(self, name: str, value: float):
+        """记录一个样本"""
+        if value is None:
+            return
+        self.samples[name].append(value)
+        self.sums[name] += value
+        self.counts[name] += 1
+
+    def observe_task(self, record):
+        """从结束的任务记录（TaskRecord）中提取各项样本"""
+        self.task_status[record.status] = self.task_status.get(record.status, 0) + 1
+        queued_at = record.queued_at or record.sent_at
+        if record.echo_at and record.sent_at:
+            self.observe("echo_latency", record.echo_at - record.sent_at)
+        if record.action_times and queued_at:
+            self.observe("queue_to_first_action", record.action_times[0] - queued_at)
+        for prev, cur in zip(record.action_times, record.action_times[1:]):
+            self.observe("inter_action_gap", cur - prev)
+        if record.status == 'finished' and record.finished_at and queued_at:
+            self.observe("end_to_end", record.finished_at - queued_at)
+
+    def observe_result(self, record):
+        """任务结束后才到达的 result 消息"""
+        if record.result_at and record.finished_at:
+            self.observe("result_delay", max(record.result_at - record.finished_at, 0.0))
+
+    def merge(self, other: "LatencyMetrics"):
+        """合并另一个收集器的样本（用于多会话汇总）"""
+        for name in LATENCY_METRICS:
+            self.samples[name].extend(other.samples[name])
+            self.sums[name] += other.sums[name]
+            self.counts[name] += other.counts[name]
+        for status, count in other.task_status.items():
+            self.task_status[status] = self.task_status.get(status, 0) + count
+
+    @classmethod
+    def aggregate(cls, collectors) -> "LatencyMetrics":
+        """汇总多个收集器"""
+        collectors = list(collectors)
+        total = cls(max(c.max_samples for c in collectors) if collectors else 10000)
+        for collector in collectors:
+            total.merge(collector)
+        return total
+
+    def summary(self) -> dict:
+        """各指标的分位数、均值和样本数"""
+        result = {}
+        for name in LATENCY_METRICS:
+            values = sorted(self.samples[name])
+            count = self.counts[name]
+            entry = {"count": count, "mean": (self.sums[name] / count) if count else None}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = percentile(values, q)
+            result[name] = entry
+        return result
+
+    def to_dict(self) -> dict:
+        """导出为字典"""
+        return {"tasks": dict(self.task_status), "latency": self.summary()}
+
+    def to_json(self) -> str:
+        """导出为 JSON 文本"""
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, prefix: str = "autoglm", labels: dict = None) -> str:
+        """导出为 Prometheus 文本格式（summary 类型）"""
+        base_labels = ",".join(f'{k}="{v}"' for k, v in (labels or {}).items())
+        lines = []
+        task_metric = f"{prefix}_tasks_total"
+        lines.append(f"# HELP {task_metric} 按状态统计的任务数量")
+        lines.append(f"# TYPE {task_metric} counter")
+        for status, count in sorted(self.task_status.items()):
+            label_text = ",".join(filter(None, [base_labels, f'status="{status}"']))
+            lines.append(f"{task_metric}{{{label_text}}} {count}")
+        for name, help_text in LATENCY_METRICS.items():
+            metric = f"{prefix}_{name}_seconds"
+            values = sorted(self.samples[name])
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                value = percentile(values, q)
+                label_text = ",".join(filter(None, [base_labels, f'quantile="{q}"']))
+                lines.append(f"{metric}{{{label_text}}} {'NaN' if value is None else f'{value:.6f}'}")
+            suffix = f"{{{base_labels}}}" if base_labels else ""
+            lines.append(f"{metric}_sum{suffix} {self.sums[name]:.6f}")
+            lines.append(f"{metric}_count{suffix} {self.counts[name]}")
+        return "\n".join(lines) + "\n"
+
+    def format_lines(self) -> list:
+        """生成用于终端显示的摘要行"""
+        lines = []
+        if self.task_status:
+            lines.append("任务: " + "，".join(f"{k} {v}" for k, v in sorted(self.task_status.items())))
+        for name, entry in self.summary().items():
+            if not entry["count"]:
+                continue
+            lines.append(
+                f"{name}: p50 {entry['p50']:.3f}s / p90 {entry['p90']:.3f}s / "
+                f"p99 {entry['p99']:.3f}s (n={entry['count']})"
+            )
+        return lines
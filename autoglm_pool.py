@@ -0,0 +1,252 @@
+"""
+AutoGLM 会话池
+预先建立多个已完成 VM 初始化的会话并保持热备，把排队的指令分发给空闲的 VM 并发执行
+"""
+
+import time
+import asyncio
+
+from autoglm_liveness import DeadlineEstimator
+from autoglm_metrics import LatencyMetrics
+from autoglm_session import AutoGLMSession, TaskRecord
+
+
+class _PoolJob:
+    """排队中的指令"""
+
+    def __init__(self, instruction: str, timeout: float, result_grace: float, future: asyncio.Future,
+                 use_cache: bool = True, on_start=None):
+        self.instruction = instruction
+        self.timeout = timeout
+        self.result_grace = result_grace
+        self.future = future
+        self.use_cache = use_cache
+        self.on_start = on_start
+        self.queued_at = time.time()
+        self.connect_failures = 0  # 取到该指令的会话建立连接失败的次数
+
+
+class AutoGLMSessionPool:
+    """
+    AutoGLM 会话池
+
+    每个会话对应一个 worker 协程，从共享队列中取指令执行，因此指令总是交给
+    当前空闲的 VM。会话断开后 worker 会重新建立连接并等待 VM 就绪；
+    任务超时或停滞时会话自行回收（换用新的 VM），避免卡住的 VM 拖慢后续指令。
+    所有会话共享同一个 DeadlineEstimator，历史耗时在会话替换后仍然保留。
+    会话无法建立时指令放回队列交给其他 VM；同一条指令累计 max_connect_attempts 次遇到无法建立的会话，
+    或 worker 连续 max_connect_attempts 次建立失败后，取到的指令以 error 结束（每条仍先尝试建立一次），
+    服务端不可达时队列会很快清空而不是无限重试。
+    指定 cache 时，命中缓存的指令在入队前直接返回，不占用 VM。
+    """
+
+    def __init__(self, url: str, headers: dict = None, size: int = 4,
+                 connect_timeout: float = 10, ready_timeout: float = 60,
+                 max_connect_attempts: int = 3, **session_callbacks):
+        """
+        Args:
+            url: WebSocket 地址
+            headers: 请求头（认证信息）
+            size: 会话数量
+            connect_timeout: 建立连接超时（秒）
+            ready_timeout: 等待 VM 就绪超时（秒）
+            max_connect_attempts: 单条指令最多经历几次会话建立失败，超过后以 error 结束
+            session_callbacks: 透传给每个 AutoGLMSession 的参数（on_message 等回调、reconnect 策略、
+                deadlines 等）
+        """
+        if size < 1:
+            raise ValueError("会话池大小至少为 1")
+        self.url = url
+        self.headers = headers or {}
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.ready_timeout = ready_timeout
+        self.max_connect_attempts = max_connect_attempts
+        self.last_connect_error = None  # 最近一次会话建立失败的原因
+        self.session_callbacks = session_callbacks
+        self.deadlines = session_callbacks.setdefault('deadlines', DeadlineEstimator())
+        self.sessions = [None] * size
+        self.busy = [False] * size
+        self.completed = 0
+        self.failed = 0
+        self.recycled = 0  # 因任务超时 / 停滞而回收的会话数
+        self._retired_metrics = LatencyMetrics()  # 已替换会话的延迟统计
+        self._queue = asyncio.Queue()
+        self._workers = []
+        self._closing = False
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self) -> int:
+        """
+        并发建立所有会话并等待 VM 就绪，然后启动 worker
+
+        Returns:
+            就绪的会话数量；全部失败时抛出 ConnectionError
+        """
+        results = await asyncio.gather(
+            *(self._open_session(i) for i in range(self.size)),
+            return_exceptions=True
+        )
+        ready = sum(1 for r in results if r is True)
+        if ready == 0:
+            raise ConnectionError("会话池中没有可用的虚拟机")
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.size)]
+        return ready
+
+    def submit_nowait(self, instruction: str, timeout: float = None,
+                      result_grace: float = 0, use_cache: bool = True, on_start=None) -> asyncio.Future:
+        """
+        指令入队，返回在任务结束时得到 TaskRecord 的 Future
+
+        timeout 为 None 时按历史自适应；use_cache=False 时跳过结果缓存；
+        on_start(record) 在指令发给 VM 后调用（命中缓存时不调用）
+        """
+        if self._closing:
+            raise RuntimeError("会话池已关闭")
+        future = asyncio.get_running_loop().create_future()
+        cache = self.session_callbacks.get('cache')
+        if use_cache and cache is not None:
+            entry = cache.get(instruction)
+            if entry is not None:
+                self.completed += 1
+                future.set_result(TaskRecord.from_cache(instruction, entry))
+                return future
+        self._queue.put_nowait(_PoolJob(instruction, timeout, result_grace, future, use_cache, on_start))
+        return future
+
+    async def submit(self, instruction: str, timeout: float = None,
+                     result_grace: float = 0, use_cache: bool = True, on_start=None) -> TaskRecord:
+        """指令入队并等待执行结束"""
+        return await self.submit_nowait(instruction, timeout, result_grace, use_cache, on_start)
+
+    def cancel(self, msg_id: str, reason: str = '已取消') -> bool:
+        """按 msg_id（可为前缀）取消任务，执行该任务的会话随即回收；找不到返回 False"""
+        for session in self.sessions:
+            task = session.get_task(msg_id) if session is not None else None
+            if task is not None:
+                session.cancel_task(task, reason)
+                return True
+        return False
+
+    def stats(self) -> dict:
+        """会话池状态：大小、就绪/空闲/忙碌数量、队列深度与累计任务数（指定 keys 时含各 Key 用量）"""
+        ready = sum(1 for s in self.sessions if s is not None and s.vm_ready)
+        busy = sum(self.busy)
+        stats = {
+            "size": self.size,
+            "ready": ready,
+            "idle": max(ready - busy, 0),
+            "busy": busy,
+            "queue_depth": self._queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "recycled": self.recycled,
+        }
+        keys = self.session_callbacks.get('keys')
+        if keys is not None:
+            stats["keys"] = keys.stats()
+        return stats
+
+    def metrics(self) -> LatencyMetrics:
+        """汇总所有会话（含已替换会话）的延迟统计"""
+        current = [s.metrics for s in self.sessions if s is not None]
+        return LatencyMetrics.aggregate([self._retired_metrics] + current)
+
+    async def close(self):
+        """停止 worker，取消排队中的指令并关闭所有会话"""
+        self._closing = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            if not job.future.done():
+                job.future.cancel()
+        await asyncio.gather(
+            *(s.close() for s in self.sessions if s is not None),
+            return_exceptions=True
+        )
+
+    async def _open_session(self, index: int) -> bool:
+        """建立第 index 个会话并等待 VM 就绪"""
+        session = AutoGLMSession(self.url, self.headers, **self.session_callbacks)
+        self.sessions[index] = session
+        await session.connect(self.connect_timeout)
+        if not await session.wait_ready(self.ready_timeout):
+            await session.close()
+            self.last_connect_error = "等待虚拟机就绪超时"
+            return False
+        return True
+
+    async def _ensure_session(self, index: int) -> bool:
+        """保证第 index 个会话可用，断开时重新建立"""
+        session = self.sessions[index]
+        if session is not None and session.connected and session.vm_ready:
+            return True
+        if session is not None and (session.reconnecting or session.recycling):
+            # 会话正在自行重连或回收，等待新的 VM 就绪
+            if await session.wait_ready(self.ready_timeout):
+                return True
+        if session is not None:
+            await self._retire_session(index)
+        try:
+            return await self._open_session(index)
+        except Exception as e:
+            self.last_connect_error = str(e) or type(e).__name__
+            return False
+
+    async def _retire_session(self, index: int):
+        """关闭第 index 个会话并保留其延迟统计，下次取指令时重新建立"""
+        session = self.sessions[index]
+        self.sessions[index] = None
+        await session.close()
+        self._retired_metrics.merge(session.metrics)
+
+    async def _worker(self, index: int):
+        """从队列中取指令，在第 index 个会话上执行"""
+        failures = 0  # 本 worker 连续建立会话失败的次数
+        while True:
+            job = await self._queue.get()
+            if job.future.done():
+                continue
+            if not await self._ensure_session(index):
+                failures += 1
+                job.connect_failures += 1
+                if job.connect_failures >= self.max_connect_attempts or failures >= self.max_connect_attempts:
+                    record = TaskRecord(job.instruction, '')
+                    record.finish('error', f"会话建立失败: {self.last_connect_error}")
+                    self.failed += 1
+                    if not job.future.done():
+                        job.future.set_result(record)
+                    continue
+                # 本会话暂不可用，把指令放回队列交给其他 VM，稍后再重试连接
+                self._queue.put_nowait(job)
+                await asyncio.sleep(self.connect_timeout)
+                continue
+            failures = 0
+            self.busy[index] = True
+            try:
+                # 入队时已查过缓存，这里只需在完成后写入
+                record = await self.sessions[index].run_instruction(
+                    job.instruction, job.timeout, job.result_grace, job.queued_at,
+                    use_cache=job.use_cache, cache_lookup=False, on_start=job.on_start)
+            except Exception as e:
+                record = TaskRecord(job.instruction, '')
+                record.finish('error', str(e))
+            finally:
+                self.busy[index] = False
+            if record.status == 'finished':
+                self.completed += 1
+            else:
+                self.failed += 1
+            if record.status == 'timeout':
+                # 会话已自行回收（VM 可能仍卡在该任务上），下一条指令等新的 VM 就绪后发送
+                self.recycled += 1
+            if not job.future.done():
+                job.future.set_result(record)
@@ -0,0 +1,245 @@
+"""
+AutoGLM 终端渲染器
+接收线程只把解码后的事件放入有界队列，由独立的渲染线程负责格式化与输出，
+终端或管道输出变慢时不会阻塞消息接收和心跳处理
+"""
+
+import sys
+import time
+import threading
+from collections import deque
+
+
+class Console:
+    """
+    单写者终端输出
+
+    只在渲染线程中使用。支持普通行与可原地刷新（\\r 覆盖）的进度行：
+    连续相同 key 的进度累计次数显示为 (xN)，重绘频率受 max_fps 限制。
+    """
+
+    def __init__(self, stream=None, max_fps: float = 10):
+        self.stream = stream
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0
+        self._progress_key = None
+        self._progress_text = ''
+        self._progress_count = 0
+        self._progress_dirty = False
+        self._last_draw = 0.0
+        self._last_width = 0
+
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未绘制的进度更新"""
+        return self._progress_dirty
+
+    def _out(self):
+        return self.stream or sys.stdout
+
+    def write(self, text: str = '', end: str = '\n'):
+        """输出一行（会先结束当前进度行）"""
+        out = self._out()
+        if self._progress_key is not None:
+            self._draw_progress(out)
+            # 文本自带换行时无需额外换行，保持与原逐行输出一致的版式
+            if not text.startswith('\n'):
+                out.write('\n')
+            self._reset_progress()
+        out.write(text + end)
+        out.flush()
+
+    def progress(self, key: str, text: str, count: int = 1):
+        """更新进度行；与当前进度行 key 相同时累计次数"""
+        if key != self._progress_key:
+            if self._progress_key is not None:
+                self._draw_progress(self._out())
+                self._out().write('\n')
+            self._progress_key = key
+            self._progress_count = 0
+            self._last_draw = 0.0
+            self._last_width = 0
+        self._progress_text = text
+        self._progress_count += count
+        self._progress_dirty = True
+        self.flush_progress()
+
+    def flush_progress(self, force: bool = False) -> float:
+        """
+        按帧率限制重绘进度行
+
+        Returns:
+            距离下一次允许重绘的秒数；没有待重绘内容时返回 None
+        """
+        if not self._progress_dirty:
+            return None
+        wait = self._last_draw + self.min_interval - time.monotonic()
+        if wait > 0 and not force:
+            return wait
+        out = self._out()
+        self._draw_progress(out)
+        out.flush()
+        return None
+
+    def _draw_progress(self, out):
+        if not self._progress_dirty:
+            return
+        text = self._progress_text
+        if self._progress_count > 1:
+            text = f"{text} (x{self._progress_count})"
+        out.write('\r' + text.ljust(self._last_width))
+        self._last_width = len(text)
+        self._last_draw = time.monotonic()
+        self._progress_dirty = False
+
+    def _reset_progress(self):
+        self._progress_key = None
+        self._progress_text = ''
+        self._progress_count = 0
+        self._progress_dirty = False
+        self._last_width = 0
+
+
+class _RenderItem:
+    """队列中的一项：待渲染的事件或一段文本"""
+
+    __slots__ = ('event', 'text', 'end', 'key', 'count', 'droppable')
+
+    def __init__(self, event=None, text=None, end='\n', key=None, droppable=False):
+        self.event = event
+        self.text = text
+        self.end = end
+        self.key = key
+        self.count = 1
+        self.droppable = droppable
+
+
+class Renderer:
+    """
+    有界渲染队列 + 渲染线程
+
+    队列策略:
+      - 合并：与队尾 coalesce key 相同的事件直接合并进队尾（只保留最新事件并累加次数）
+      - 丢弃：队列满时丢弃最早的可丢弃事件；若新事件本身可丢弃且队列中没有可丢弃项，则丢弃新事件
+      - 关键事件（结果、完成、初始化、普通文本）永不丢弃，可短暂超出上限
+    """
+
+    def __init__(self, handler, max_pending: int = 1000, max_fps: float = 10, stream=None):
+        """
+        Args:
+            handler: handler(event, count) 在渲染线程中渲染一个事件，count 为合并的次数
+            max_pending: 队列上限
+            max_fps: 进度行最大重绘帧率
+            stream: 输出流，默认 sys.stdout
+        """
+        self.handler = handler
+        self.max_pending = max_pending
+        self.console = Console(stream, max_fps)
+        self.dropped = 0
+        self.coalesced = 0
+        self._reported_dropped = 0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="autoglm-renderer", daemon=True)
+        self._thread.start()
+
+    def post(self, event, key: str = None, droppable: bool = False):
+        """提交一个待渲染事件（任意线程调用，不阻塞）"""
+        self._enqueue(_RenderItem(event=event, key=key, droppable=droppable))
+
+    def write(self, text: str = '', end: str = '\n'):
+        """提交一段文本；在渲染线程内调用时直接输出"""
+        if threading.current_thread() is self._thread:
+            self.console.write(text, end)
+            return
+        self._enqueue(_RenderItem(text=text, end=end))
+
+    def drain(self, timeout: float = 2.0) -> bool:
+        """等待队列中的内容全部输出（用于显示输入提示符前），超时返回 False"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._busy or self.console.dirty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 2.0):
+        """输出剩余内容后停止渲染线程"""
+        self.drain(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """队列统计"""
+        with self._cond:
+            return {"pending": len(self._pending), "dropped": self.dropped, "coalesced": self.coalesced}
+
+    def _enqueue(self, item: _RenderItem):
+        with self._cond:
+            pending = self._pending
+            if item.key is not None and pending and pending[-1].key == item.key:
+                tail = pending[-1]
+                tail.event = item.event
+                tail.count += 1
+                self.coalesced += 1
+                return
+            if len(pending) >= self.max_pending and not self._evict_one():
+                if item.droppable:
+                    self.dropped += 1
+                    return
+            pending.append(item)
+            self._cond.notify_all()
+
+    def _evict_one(self) -> bool:
+        """丢弃最早的可丢弃项，成功返回 True"""
+        for i, queued in enumerate(self._pending):
+            if queued.droppable:
+                del self._pending[i]
+                self.dropped += 1
+                return True
+        return False
+
+    def _run(self):
+        """渲染线程主循环"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    wait = self.console.flush_progress()
+                    if wait is None:
+                        self._cond.notify_all()
+                        self._cond.wait()
+                    else:
+                        self._cond.wait(wait)
+                if not self._pending and self._closed:
+                    self.console.flush_progress(force=True)
+                    return
+                batch = list(self._pending)
+                self._pending.clear()
+                self._busy = True
+            try:
+                for item in batch:
+                    self._render(item)
+                self._report_drops()
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _render(self, item: _RenderItem):
+        try:
+            if item.text is not None:
+                self.console.write(item.text, item.end)
+            else:
+                self.handler(item.event, item.count)
+        except Exception as e:
+            self.console.write(f"\n❌ 渲染出错: {e}")
+
+    def _report_drops(self):
+        if self.dropped != self._reported_dropped:
+            self.console.write(f"\n  ⚠️  输出过快，已跳过 {self.dropped - self._reported_dropped} 条显示消息")
+            self._reported_dropped = self.dropped
@@ -0,0 +1,129 @@
+"""
+AutoGLM 原始消息环形缓冲区
+始终保留最近 N 帧未解码的原始字节，按帧数和字节数双重限制，存储空间在创建时一次性分配。
+写入只做一次内存拷贝；解码、过滤与格式化都推迟到有人查看时才进行。
+"""
+
+import time
+from array import array
+
+from autoglm_events import decode_frame
+
+
+class FrameRing:
+    """
+    预分配的原始帧环形缓冲区（单写者：只在接收线程中 append）
+
+    字节区是一块固定大小的 bytearray，帧按顺序循环写入；空间不足或帧数达到上限时
+    淘汰最早的帧。单帧超过 max_bytes / 4 时只保留前面部分并计入 truncated。
+    """
+
+    def __init__(self, max_frames: int = 2000, max_bytes: int = 4 * 1024 * 1024):
+        """
+        Args:
+            max_frames: 最多保留的帧数
+            max_bytes: 原始字节总量上限
+        """
+        self.max_frames = max_frames
+        self.capacity = max_bytes
+        self.max_frame_bytes = max(max_bytes // 4, 1)
+        self.total = 0  # 累计写入帧数
+        self.truncated = 0  # 被截断的帧数
+        self._data = bytearray(max_bytes)
+        self._start = array('Q', bytes(8 * max_frames))
+        self._length = array('I', bytes(4 * max_frames))  # 缓冲区中保存的长度
+        self._size = array('I', bytes(4 * max_frames))  # 原始长度
+        self._time = array('d', bytes(8 * max_frames))
+        self._head = 0  # 最早一帧的槽位
+        self._count = 0
+        self._pos = 0  # 下一帧的写入位置
+
+    def __len__(self):
+        return self._count
+
+    def append(self, message, received_at: float = None):
+        """写入一帧原始消息（文本按 UTF-8 保存）"""
+        data = message.encode('utf-8') if isinstance(message, str) else message
+        size = len(data)
+        n = min(size, self.max_frame_bytes)
+        pos = self._pos
+        wrapped = pos + n > self.capacity
+        if wrapped:
+            # 尾部放不下时回到开头，尾部剩余的旧帧一并淘汰，保持先进先出
+            tail, pos = pos, 0
+        start, length = self._start, self._length
+        while self._count:
+            slot = self._head
+            s = start[slot]
+            if (self._count == self.max_frames or (wrapped and s >= tail)
+                    or (s < pos + n and s + max(length[slot], 1) > pos)):
+                self._head = (slot + 1) % self.max_frames
+                self._count -= 1
+            else:
+                break
+        self._data[pos:pos + n] = memoryview(data)[:n] if n < size else data
+        slot = (self._head + self._count) % self.max_frames
+        start[slot] = pos
+        length[slot] = n
+        self._size[slot] = size
+        self._time[slot] = time.time() if received_at is None else received_at
+        self._count += 1
+        self._pos = pos + n
+        self.total += 1
+        if n < size:
+            self.truncated += 1
+
+    def snapshot(self, last: int = None) -> list:
+        """
+        复制出缓冲区中的帧（从旧到新）
+
+        Args:
+            last: 只取最近的若干帧
+
+        Returns:
+            [(接收时间, 原始长度, 原始字节)]，被截断的帧原始长度大于字节长度
+        """
+        count = self._count if last is None else min(last, self._count)
+        first = self._head + self._count - count
+        frames = []
+        for i in range(count):
+            slot = (first + i) % self.max_frames
+            s = self._start[slot]
+            frames.append((self._time[slot], self._size[slot], bytes(self._data[s:s + self._length[slot]])))
+        return frames
+
+    def stats(self) -> dict:
+        """缓冲区统计"""
+        used = sum(self._length[(self._head + i) % self.max_frames] for i in range(self._count))
+        return {
+            "frames": self._count,
+            "bytes": used,
+            "max_frames": self.max_frames,
+            "capacity": self.capacity,
+            "total": self.total,
+            "truncated": self.truncated,
+        }
+
+
+def filter_frames(frames, msg_type: str = None, msg_id: str = None):
+    """
+    解码并过滤 snapshot() 得到的帧
+
+    先在原始字节中查找过滤值，只有可能匹配的帧才解码。
+
+    Yields:
+        (接收时间, 原始长度, 原始字节, 事件)
+    """
+    type_key = msg_type.encode('utf-8') if msg_type else None
+    id_key = msg_id.encode('utf-8') if msg_id else None
+    for received_at, size, raw in frames:
+        if type_key and type_key not in raw:
+            continue
+        if id_key and id_key not in raw:
+            continue
+        event = decode_frame(raw)
+        if msg_type and event.msg_type != msg_type:
+            continue
+        if msg_id and not (event.msg_id or '').startswith(msg_id):
+            continue
+        yield received_at, size, raw, event
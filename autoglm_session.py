@@ -0,0 +1,820 @@
+"""
+AutoGLM Phone API 异步会话引擎
+基于 asyncio 的 WebSocket 会话，单个事件循环即可同时驱动大量会话
+"""
+
+import asyncio
+import json
+import time
+import uuid
+import random
+from collections import OrderedDict, deque
+
+from autoglm_events import decode_frame, Echo, Heartbeat, InitProgress, Notify, Result, TaskAction
+from autoglm_liveness import DeadlineEstimator, LivenessMonitor
+from autoglm_metrics import LatencyMetrics
+
+
+def create_instruction_message(instruction: str) -> dict:
+    """
+    创建指令消息
+
+    Args:
+        instruction: 要执行的任务指令
+
+    Returns:
+        消息字典
+    """
+    return {
+        "timestamp": int(time.time() * 1000),
+        "conversation_id": "",
+        "msg_type": "client_test",
+        "msg_id": str(uuid.uuid4()),
+        "data": {
+            "biz_type": "test_agent",
+            "instruction": instruction
+        }
+    }
+
+
+class ReconnectPolicy:
+    """断线重连策略：带抖动的指数退避，以及中断任务的恢复方式"""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 ready_timeout: float = 60, resume_window: float = 5.0, task_retries: int = 1):
+        """
+        Args:
+            max_attempts: 每次断线最多重连次数
+            base_delay: 第一次重连的基准等待时间（秒），之后逐次翻倍
+            max_delay: 单次等待上限（秒）
+            ready_timeout: 重连后等待 VM 就绪的时间（秒）
+            resume_window: 重连后等待服务端继续上报中断任务的时间（秒），超时则按重试策略重新提交
+            task_retries: 每条指令默认的重新提交次数（可在 run_instruction 中单独指定）
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.ready_timeout = ready_timeout
+        self.resume_window = resume_window
+        self.task_retries = task_retries
+
+    def delay(self, attempt: int) -> float:
+        """第 attempt 次（从 1 开始）重连前的等待时间，在 [上限/2, 上限] 内随机抖动"""
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(cap / 2, cap)
+
+
+class TaskRecord:
+    """单条指令的执行记录"""
+
+    def __init__(self, instruction: str, msg_id: str, seq: int = 0):
+        self.instruction = instruction
+        self.msg_id = msg_id
+        self.seq = seq  # 会话内的提交序号（从 1 开始）
+        self.conversation_id = None  # 服务端消息中的 conversation_id
+        self.status = 'pending'  # pending / queued / running / finished / timeout / error / cancelled
+        self.actions = []  # data_agent 动作序列
+        self.result = None  # result 消息中的 data
+        self.error = None
+        # 时间线（time.time() 秒）
+        self.queued_at = None  # 入队时间，未经队列时为 None
+        self.sent_at = None
+        self.echo_at = None  # 收到 client_test 回执
+        self.action_times = []  # 每个动作的接收时间，与 actions 一一对应
+        self.finished_at = None
+        self.result_at = None
+        self.server_timestamps = []  # 该任务相关消息的服务端 timestamp（毫秒）
+        # 断线恢复
+        self.attempts = 0  # 发送次数（含重新提交）
+        self.retries_left = 0  # 剩余重新提交次数
+        self.interruptions = 0  # 执行中遇到断线的次数
+        # 结果缓存
+        self.use_cache = True  # 完成后是否写入缓存
+        self.cached = False  # 是否直接由缓存返回
+        self.listener = None  # listener(record, event)：收到本任务的事件时调用
+        self.last_seen_at = None  # 最近一次收到 msg_id 与本任务相同的消息的时间
+        self.activity = asyncio.Event()  # 收到本任务相关消息
+        self.started = asyncio.Event()  # 已从队列中取出并发送（或在发送前结束）
+        self.done = asyncio.Event()  # 任务结束信号（完成、超时或出错）
+        self.result_event = asyncio.Event()  # 收到 result 消息信号
+
+    @classmethod
+    def from_cache(cls, instruction: str, entry: dict, seq: int = 0) -> 'TaskRecord':
+        """用缓存条目构造一条已完成的任务记录"""
+        record = cls(instruction, str(uuid.uuid4()), seq)
+        record.status = 'finished'
+        record.result = entry['result']
+        record.cached = True
+        record.sent_at = record.finished_at = record.result_at = time.time()
+        record.started.set()
+        record.done.set()
+        record.result_event.set()
+        return record
+
+    @property
+    def duration(self):
+        """任务耗时（秒），未结束时返回 None"""
+        if self.sent_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.sent_at
+
+    def finish(self, status: str, error: str = None):
+        """结束任务，重复调用时保留第一次的状态"""
+        if self.done.is_set():
+            return
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self.started.set()
+        self.done.set()
+
+    def timeline(self) -> dict:
+        """任务时间线（各节点相对发送时间的偏移，秒）"""
+        base = self.sent_at
+        if base is None:
+            return {}
+
+        def offset(t):
+            return None if t is None else t - base
+
+        return {
+            "queued": offset(self.queued_at),
+            "echo": offset(self.echo_at),
+            "first_action": offset(self.action_times[0]) if self.action_times else None,
+            "actions": [t - base for t in self.action_times],
+            "finished": offset(self.finished_at),
+            "result": offset(self.result_at),
+            "server_timestamps": self.server_timestamps,
+        }
+
+    def to_dict(self) -> dict:
+        """转换为可 JSON 序列化的字典"""
+        return {
+            "msg_id": self.msg_id,
+            "seq": self.seq,
+            "conversation_id": self.conversation_id,
+            "instruction": self.instruction,
+            "status": self.status,
+            "actions": self.actions,
+            "result": self.result,
+            "error": self.error,
+            "sent_at": self.sent_at,
+            "finished_at": self.finished_at,
+            "duration": self.duration,
+            "attempts": self.attempts,
+            "interruptions": self.interruptions,
+            "cached": self.cached,
+            "timeline": self.timeline(),
+        }
+
+
+class AutoGLMSession:
+    """
+    AutoGLM 异步会话
+
+    负责连接、协议状态跟踪（VM 就绪、任务完成）和指令执行，不做任何终端输出。
+    显示逻辑通过 on_open / on_message / on_error / on_close / on_reconnect 回调接入，
+    回调在事件循环线程中同步调用。
+
+    指定 reconnect 策略后，非主动关闭的断线会自动重连；执行中的任务在重连后
+    先等待服务端继续上报（按 msg_id 关联），未恢复则按剩余重试次数重新提交。
+
+    liveness 根据心跳间隔与 ping 往返判断连接是否失效，失效时强制断开（进入重连流程）；
+    deadlines 根据相似指令的历史耗时推算任务期限与停滞判定时间，可在多个会话间共享。
+
+    指令可以连续提交：VM 同一时间只执行一个任务，其余任务在会话内排队，
+    上一个任务结束后立即发送下一个。每个任务的状态保存在各自的 TaskRecord 中，
+    按 msg_id 登记在 tasks 里（保留最近 task_history 条），消息按 msg_id 关联到对应任务。
+
+    指定 cache（ResultCache）后，命中的指令直接返回缓存结果，不发送给 VM；
+    完成并收到 result 的任务写入缓存。指定 recorder（TraceWriter）后，收到的每一帧原始消息都会被录制；
+    指定 ring（FrameRing）后，最近的原始消息保留在内存环形缓冲区中，供事后查看；
+    指定 action_store（ActionStore）后，结束的任务的动作序列按列写入，供离线分析。
+
+    指定 keys（KeyPool）后，每次建立连接时选用仍有余量的 API Key（覆盖 headers 中的 Authorization），
+    断开时归还名额；发送指令前按该 Key 的令牌桶限速。
+
+    协议没有停止任务的消息，执行中的任务被取消或超时后，VM 可能仍在执行它，
+    因此会话会被回收：关闭当前连接、重新连接并等待新的 VM 就绪，期间排队的指令暂不发送。
+    """
+
+    def __init__(self, url: str, headers: dict = None,
+                 on_open=None, on_message=None, on_error=None, on_close=None,
+                 reconnect: ReconnectPolicy = None, on_reconnect=None,
+                 liveness: LivenessMonitor = None, deadlines: DeadlineEstimator = None,
+                 task_history: int = 200, cache=None, recorder=None, ring=None, keys=None,
+                 action_store=None):
+        self.url = url
+        self.headers = headers or {}
+        self.on_open = on_open
+        self.on_message = on_message  # on_message(session, message, event)
+        self.on_error = on_error
+        self.on_close = on_close
+        self.on_reconnect = on_reconnect  # on_reconnect(session, attempt, delay)
+        self.reconnect = reconnect
+        self.ws = None
+        self.connected = False
+        self.connecting = False  # 正在建立连接（期间提交的指令先排队）
+        self.vm_ready = False
+        self.current_task = None  # 正在执行的任务
+        self.last_task = None  # 最近一次发送的任务
+        self.tasks = OrderedDict()  # msg_id -> TaskRecord（排队、执行中与最近结束的任务）
+        self.task_history = task_history
+        self.cache = cache
+        self.recorder = recorder
+        self.ring = ring
+        self.keys = keys
+        self.action_store = action_store
+        self.api_key = None  # 当前连接使用的 ApiKey（指定 keys 时）
+        self._queue = deque()  # 排队等待发送的任务
+        self._result_pending = None  # 已完成但尚未收到 result 的最近任务
+        self._task_seq = 0
+        self.metrics = LatencyMetrics()  # 本会话的延迟统计
+        self.reconnecting = False
+        self.reconnect_count = 0  # 成功重连次数
+        self.recycles = 0  # 因任务取消 / 超时而回收会话的次数
+        self.downtime = 0.0  # 累计断线时长（秒）
+        self.connected_at = None  # 最近一次建立连接的时间（time.time()）
+        self.liveness = liveness or LivenessMonitor()
+        self.deadlines = deadlines or DeadlineEstimator()
+        self._down_since = None
+        self._closing = False  # 主动关闭中，不再重连
+        self._recycling = False  # 回收中：旧连接关闭、新 VM 就绪前不发送排队的指令
+        self._ready_event = asyncio.Event()
+        self._closed_event = asyncio.Event()  # 会话终止（主动关闭或放弃重连）
+        self._reader = None
+        self._reconnector = None
+        self._monitor = None
+        self._recycler = None
+
+    @property
+    def closed(self) -> bool:
+        """会话是否已终止（重连中不算终止）"""
+        return self._closed_event.is_set()
+
+    @property
+    def recycling(self) -> bool:
+        """是否正在回收会话（等待新的 VM）"""
+        return self._recycling
+
+    def connection_stats(self) -> dict:
+        """连接统计：重连次数与累计断线时长"""
+        downtime = self.downtime
+        if self._down_since is not None:
+            downtime += time.monotonic() - self._down_since
+        return {
+            "connected": self.connected,
+            "reconnecting": self.reconnecting,
+            "reconnects": self.reconnect_count,
+            "recycles": self.recycles,
+            "downtime": downtime,
+            "api_key": self.api_key.label if self.api_key is not None else None,
+            "liveness": self.liveness.stats(),
+        }
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self, timeout: float = 10):
+        """
+        建立 WebSocket 连接并启动接收任务，失败时抛出异常
+
+        连接建立期间即可提交指令（先在会话中排队，VM 就绪后发送）；
+        连接失败时排队的指令保留，调用方可以重试 connect，或 close（排队的指令以 error 结束）。
+        """
+        key = None
+        headers = self.headers
+        self.connecting = True
+        try:
+            # websockets 导入较慢，推迟到第一次连接时（命令行可以先显示提示符）
+            from websockets.asyncio.client import connect as ws_connect
+
+            if self.keys is not None:
+                key = await self.keys.acquire(timeout)
+                headers = {**self.headers, "Authorization": f"Bearer {key.key}"}
+            # 关闭库自带的 keepalive，由 _monitor_loop 负责 ping 与存活判定
+            self.ws = await asyncio.wait_for(
+                ws_connect(self.url, additional_headers=headers, max_size=None,
+                           ping_interval=None),
+                timeout
+            )
+        except Exception as e:
+            if key is not None:
+                self.keys.release(key, success=False)
+                self.keys.report_error(key, e)
+            self._emit(self.on_error, e)
+            raise
+        finally:
+            self.connecting = False
+        self.api_key = key
+        self.connected = True
+        self.connected_at = time.time()
+        self.liveness.reset()
+        self._closed_event.clear()
+        self._emit(self.on_open)
+        self._reader = asyncio.create_task(self._read_loop())
+        self._monitor = asyncio.create_task(self._monitor_loop(self.ws))
+
+    async def wait_ready(self, timeout: float = 60) -> bool:
+        """等待 VM 初始化完成，超时或连接断开返回 False"""
+        return await self._wait_until(self._ready_event, timeout)
+
+    async def wait_closed(self):
+        """等待会话终止（主动关闭或放弃重连）"""
+        await self._closed_event.wait()
+
+    async def send_instruction(self, instruction: str, queued_at: float = None,
+                               retries: int = None, use_cache: bool = True,
+                               cache_lookup: bool = True, listener=None) -> TaskRecord:
+        """
+        提交指令，返回对应的任务记录（不等待完成）
+
+        VM 空闲时立即发送，否则排在会话队列中，前一个任务结束后自动发送；
+        可以用 record.started 等待发送，用 record.done 等待结束。
+        命中结果缓存时直接返回已完成的记录（record.cached 为 True）；use_cache=False 时跳过缓存，
+        cache_lookup=False 时不查询缓存、只在完成后写入（调用方已查过缓存）。
+        listener(record, event) 在收到该任务的事件（心跳除外）时调用，发送前即已登记，不会漏掉回执。
+        """
+        if use_cache and cache_lookup and self.cache is not None:
+            entry = self.cache.get(instruction)
+            if entry is not None:
+                self._task_seq += 1
+                record = TaskRecord.from_cache(instruction, entry, self._task_seq)
+                record.queued_at = queued_at or record.sent_at
+                self._register_task(record)
+                return record
+        if self.closed or not (self.connected or self.connecting or self.reconnecting):
+            raise ConnectionError("未连接到服务器，无法发送指令")
+        self._task_seq += 1
+        record = TaskRecord(instruction, str(uuid.uuid4()), self._task_seq)
+        record.queued_at = queued_at or time.time()
+        record.use_cache = use_cache
+        record.listener = listener
+        if retries is None and self.reconnect is not None:
+            retries = self.reconnect.task_retries
+        record.retries_left = retries or 0
+        record.status = 'queued'
+        self._register_task(record)
+        self._queue.append(record)
+        self._dispatch_next()
+        if record.status == 'running':
+            # 立即发送的任务等发送完成再返回，发送失败时在这里抛出
+            await record.started.wait()
+            if record.status == 'error':
+                raise ConnectionError(record.error)
+        return record
+
+    def get_task(self, key) -> TaskRecord:
+        """按 msg_id（可为前缀）或提交序号查找任务，找不到返回 None"""
+        if isinstance(key, int):
+            return next((t for t in self.tasks.values() if t.seq == key), None)
+        record = self.tasks.get(key)
+        if record is None and key:
+            matches = [t for msg_id, t in self.tasks.items() if msg_id.startswith(key)]
+            record = matches[0] if len(matches) == 1 else None
+        return record
+
+    @property
+    def pending(self) -> int:
+        """排队中的任务数"""
+        return len(self._queue)
+
+    def _register_task(self, record: TaskRecord):
+        """登记任务，超出 task_history 时丢弃最早的已结束任务"""
+        self.tasks[record.msg_id] = record
+        while len(self.tasks) > self.task_history:
+            oldest = next(iter(self.tasks.values()))
+            if not oldest.done.is_set():
+                break
+            self.tasks.popitem(last=False)
+
+    def _dispatch_next(self):
+        """VM 空闲时立即发送队首任务（在事件循环线程中同步调用）"""
+        if self.current_task is not None and not self.current_task.done.is_set():
+            return
+        if not self.connected or not self.vm_ready or self._recycling:
+            # 重连 / 回收完成、VM 就绪后再发送
+            return
+        while self._queue:
+            record = self._queue.popleft()
+            if record.done.is_set():
+                continue
+            # 必须在发送前登记为当前任务，避免回执先于登记到达
+            self.current_task = record
+            self.last_task = record
+            record.status = 'running'
+            record.sent_at = time.time()
+            asyncio.ensure_future(self._start_task(record))
+            return
+
+    async def _start_task(self, record: TaskRecord):
+        """发送队首任务（指定 keys 时先按当前 Key 的令牌桶限速）"""
+        try:
+            if self.api_key is not None:
+                await self.keys.throttle(self.api_key)
+                record.sent_at = time.time()
+            await self._send_task(record)
+        except Exception as e:
+            self._finish_task(record, 'error', f'发送失败: {e}')
+        finally:
+            record.started.set()
+
+    async def _send_task(self, record: TaskRecord, msg: dict = None):
+        """发送（或重新提交）任务，重新提交时沿用原 msg_id 以便关联"""
+        if msg is None:
+            msg = create_instruction_message(record.instruction)
+            msg['msg_id'] = record.msg_id
+        record.attempts += 1
+        await self.ws.send(json.dumps(msg))
+
+    async def run_instruction(self, instruction: str, timeout: float = None,
+                              result_grace: float = 0, queued_at: float = None,
+                              retries: int = None, use_cache: bool = True,
+                              cache_lookup: bool = True, on_start=None, listener=None) -> TaskRecord:
+        """
+        发送指令并等待任务结束
+
+        Args:
+            instruction: 要执行的任务指令
+            timeout: 等待 finish 动作或 task_done 通知的最长时间（秒），None 时按历史自适应
+            result_grace: 任务完成后继续等待 result 消息的时间（秒）
+            queued_at: 指令入队时间，用于统计排队耗时
+            retries: 断线未恢复时重新提交的次数，默认取重连策略中的 task_retries
+            use_cache: 是否使用结果缓存（查询与写入）
+            cache_lookup: 是否查询缓存（为 False 时只写入）
+            on_start: 指令发出（得到 msg_id）后调用 on_start(record)
+            listener: 收到该任务的事件时调用 listener(record, event)
+
+        Returns:
+            任务记录，status 为 finished / timeout / error / cancelled
+        """
+        if timeout is None:
+            timeout = self.deadlines.deadline(instruction)
+        record = await self.send_instruction(instruction, queued_at, retries, use_cache, cache_lookup,
+                                             listener)
+        if on_start is not None:
+            on_start(record)
+        if not await self.wait_task(record, timeout):
+            self.cancel_task(record, f'{timeout:.0f} 秒内未完成', 'timeout')
+        if result_grace and record.status == 'finished' and record.result is None:
+            await self._wait_until(record.result_event, result_grace)
+        return record
+
+    async def wait_task(self, record: TaskRecord, timeout: float = None) -> bool:
+        """
+        等待任务结束，超时、停滞或连接断开返回 False
+
+        Args:
+            record: 任务记录
+            timeout: 最长等待时间（秒），None 时按历史自适应
+
+        历史样本足够时还会做停滞判定：超过停滞时间没有新动作则以 timeout 结束任务，
+        不必等满整个期限。重连期间不做停滞判定。排队时间不计入期限。
+        """
+        if not await self._wait_until(record.started, None):
+            return False
+        if timeout is None:
+            timeout = self.deadlines.deadline(record.instruction)
+        stall = self.deadlines.stall_timeout(record.instruction)
+        end = time.monotonic() + timeout
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return False
+            if await self._wait_until(record.done, min(remaining, stall) if stall else remaining):
+                return True
+            if self.closed:
+                return False
+            if stall and not self.reconnecting:
+                progress = [record.sent_at, record.last_seen_at, self.connected_at] + record.action_times[-1:]
+                idle = time.time() - max(t for t in progress if t is not None)
+                if idle >= stall:
+                    self.cancel_task(record, f'{idle:.0f} 秒没有新动作，判定任务停滞', 'timeout')
+                    return False
+
+    def cancel_task(self, record: TaskRecord, reason: str = '已取消', status: str = 'cancelled') -> bool:
+        """
+        取消任务（在事件循环线程中调用）
+
+        排队中的任务直接移出队列；执行中的任务以 status 结束并回收会话，
+        新的 VM 就绪后再发送下一条排队的指令。
+
+        Returns:
+            是否触发了会话回收
+        """
+        if record.done.is_set():
+            return False
+        if record.status == 'queued':
+            try:
+                self._queue.remove(record)
+            except ValueError:
+                pass
+        self._finish_task(record, status, reason)
+        return self._recycling
+
+    def expire_task(self, record: TaskRecord, reason: str = None):
+        """把仍未结束的任务记为超时（与取消相同，执行中的任务会回收会话）"""
+        self.cancel_task(record, reason, 'timeout')
+
+    async def close(self):
+        """关闭连接并等待接收任务退出（不再重连）"""
+        self._closing = True
+        for task in (self._reconnector, self._monitor, self._recycler):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+        self._mark_closed('连接已关闭')
+
+    async def _wait_until(self, event: asyncio.Event, timeout: float) -> bool:
+        """等待事件触发，连接断开或超时提前返回"""
+        if event.is_set():
+            return True
+        waiters = {
+            asyncio.ensure_future(event.wait()),
+            asyncio.ensure_future(self._closed_event.wait()),
+        }
+        _, pending = await asyncio.wait(waiters, timeout=timeout,
+                                        return_when=asyncio.FIRST_COMPLETED)
+        for waiter in pending:
+            waiter.cancel()
+        return event.is_set()
+
+    async def _read_loop(self):
+        """接收循环"""
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            async for message in self.ws:
+                self.handle_message(message)
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            self._emit(self.on_error, e)
+        finally:
+            self._handle_disconnect()
+
+    async def _monitor_loop(self, ws):
+        """存活检测：定期 ping 并检查静默时间，判定失效时强制断开（触发重连）"""
+        from websockets.exceptions import ConnectionClosed
+
+        liveness = self.liveness
+        while self.ws is ws and self.connected:
+            await asyncio.sleep(liveness.ping_interval or 1.0)
+            if self.ws is not ws or not self.connected:
+                return
+            reason = liveness.check()
+            if reason is None and liveness.ping_interval:
+                sent = time.monotonic()
+                try:
+                    pong = await ws.ping()
+                    await asyncio.wait_for(pong, liveness.ping_timeout)
+                    liveness.on_pong(time.monotonic() - sent)
+                except asyncio.TimeoutError:
+                    reason = f"ping {liveness.ping_timeout:g} 秒无响应"
+                except ConnectionClosed:
+                    return
+            if reason is not None:
+                liveness.failures += 1
+                self._emit(self.on_error, TimeoutError(f"连接失效: {reason}"))
+                # 失效的连接无法完成关闭握手，直接中止传输层
+                ws.transport.abort()
+                return
+
+    def handle_message(self, message):
+        """解码一帧消息（只解析一次），更新协议状态后把事件交给 on_message 回调"""
+        received_at = time.time()
+        if self.ring is not None:
+            self.ring.append(message, received_at)
+        if self.recorder is not None:
+            self.recorder.write(message)
+        event = decode_frame(message)
+        self.liveness.on_frame(isinstance(event, Heartbeat))
+        self._update_state(event, received_at)
+        self._emit(self.on_message, message, event)
+        return event
+
+    def _update_state(self, event, received_at: float):
+        """根据事件更新 VM 与任务状态，并记录时间线"""
+        # 优先按 msg_id 关联到具体任务，没有关联的消息归属当前任务
+        task = self.tasks.get(event.msg_id) if event.msg_id else None
+        if task is not None:
+            task.last_seen_at = received_at
+            task.activity.set()
+            if event.conversation_id and task.conversation_id is None:
+                task.conversation_id = event.conversation_id
+        elif isinstance(event, Result):
+            # result 在 finish 之后到达，下一个任务可能已经开始执行
+            task = self._result_pending or self.current_task
+        else:
+            task = self.current_task
+        if event.timestamp is not None:
+            self.metrics.observe("clock_skew", received_at - event.timestamp / 1000)
+            if task is not None and not isinstance(event, Heartbeat):
+                task.server_timestamps.append(event.timestamp)
+        if task is not None and task.listener is not None and not isinstance(event, Heartbeat):
+            try:
+                task.listener(task, event)
+            except Exception as e:
+                self._emit(self.on_error, e)
+
+        if isinstance(event, TaskAction):
+            if task is None or not event.params or task.done.is_set():
+                return
+            task.actions.append(event.params)
+            task.action_times.append(received_at)
+            if event.is_finish:
+                self._finish_task(task, 'finished')
+        elif isinstance(event, InitProgress):
+            if event.ready:
+                self.vm_ready = True
+                self._ready_event.set()
+                self._dispatch_next()
+        elif isinstance(event, Echo):
+            if task is not None and task.echo_at is None:
+                task.echo_at = received_at
+        elif isinstance(event, Notify):
+            if task is not None and event.task_done and task.status == 'running':
+                self._finish_task(task, 'finished')
+        elif isinstance(event, Result):
+            if task is None or task.result is not None:
+                return
+            if task is self._result_pending:
+                self._result_pending = None
+            task.result = event.payload
+            task.result_at = received_at
+            task.result_event.set()
+            if task.done.is_set():
+                self.metrics.observe_result(task)
+                self._cache_result(task)
+
+    def _handle_disconnect(self):
+        """连接断开后的状态清理，按策略启动重连"""
+        if not self.connected:
+            return
+        self.connected = False
+        self.vm_ready = False
+        self._ready_event.clear()
+        code = self.ws.close_code if self.ws is not None else None
+        reason = self.ws.close_reason if self.ws is not None else None
+        if self.api_key is not None:
+            throttled = self.keys.report_close(self.api_key, code)
+            self.keys.release(self.api_key, success=not throttled)
+            self.api_key = None
+        if self._recycling and not self._closing:
+            # 回收时主动关闭的旧连接，由 _recycle 重新连接
+            return
+        self._emit(self.on_close, code, reason)
+
+        if self._closing or self.reconnect is None:
+            self._mark_closed('连接已关闭')
+            return
+        task = self.current_task
+        if task is not None and not task.done.is_set():
+            task.interruptions += 1
+        self._start_reconnect()
+
+    def _start_reconnect(self):
+        """启动重连循环（重连过程中再次断开由正在运行的重连循环继续处理）"""
+        if not self.reconnecting:
+            self.reconnecting = True
+            self._down_since = time.monotonic()
+            self._reconnector = asyncio.create_task(self._reconnect_loop())
+
+    async def _recycle(self, timeout: float = 10):
+        """回收会话：关闭可能仍在执行旧任务的连接，重新连接并等待新的 VM"""
+        ws = self.ws
+        try:
+            await asyncio.wait_for(ws.close(), 2)
+        except Exception:
+            ws.transport.abort()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+        if self._closing:
+            return
+        try:
+            await self.connect(timeout)
+        except Exception as e:
+            self._recycling = False
+            if self.reconnect is not None:
+                self._start_reconnect()
+            else:
+                self._mark_closed(f'回收会话失败: {e}')
+            return
+        self._recycling = False
+
+    async def _reconnect_loop(self):
+        """带抖动指数退避的重连循环"""
+        policy = self.reconnect
+        for attempt in range(1, policy.max_attempts + 1):
+            delay = policy.delay(attempt)
+            self._emit(self.on_reconnect, attempt, delay)
+            await asyncio.sleep(delay)
+            if self._closing:
+                return
+            try:
+                await self.connect()
+            except Exception:
+                continue
+            if not await self.wait_ready(policy.ready_timeout):
+                if self.connected:
+                    await self.ws.close()
+                continue
+            self.reconnecting = False
+            self.reconnect_count += 1
+            self.downtime += time.monotonic() - self._down_since
+            self._down_since = None
+            await self._recover_task()
+            self._dispatch_next()
+            return
+        self.reconnecting = False
+        self.downtime += time.monotonic() - self._down_since
+        self._down_since = None
+        self._mark_closed(f'重连 {policy.max_attempts} 次均失败')
+
+    async def _recover_task(self):
+        """重连后恢复被中断的任务：服务端仍在上报则继续等待，否则按重试策略重新提交"""
+        task = self.current_task
+        if task is None or task.done.is_set():
+            return
+        reconnected_at = time.time()
+        task.activity.clear()
+        await self._wait_until(task.activity, self.reconnect.resume_window)
+        if task.done.is_set() or (task.last_seen_at or 0) >= reconnected_at:
+            return
+        if task.retries_left <= 0:
+            self._finish_task(task, 'error', '连接中断，任务未恢复')
+            return
+        task.retries_left -= 1
+        try:
+            await self._send_task(task)
+        except Exception as e:
+            self._finish_task(task, 'error', f'重新提交失败: {e}')
+
+    def _mark_closed(self, reason: str):
+        """会话终止：唤醒所有等待者，执行中与排队中的任务以 error 结束"""
+        self._closed_event.set()
+        if self.current_task is not None:
+            self._finish_task(self.current_task, 'error', reason)
+        while self._queue:
+            self._finish_task(self._queue.popleft(), 'error', reason)
+
+    def _finish_task(self, task: TaskRecord, status: str, error: str = None):
+        """结束任务并计入延迟统计（只统计一次）"""
+        if task.done.is_set():
+            return
+        task.finish(status, error)
+        self.metrics.observe_task(task)
+        self.deadlines.observe_task(task)
+        self._store_actions(task)
+        if task.result_at is not None:
+            self.metrics.observe_result(task)
+            self._cache_result(task)
+        elif status == 'finished':
+            self._result_pending = task
+        if task is not self.current_task:
+            return
+        if status in ('timeout', 'cancelled') and self.connected and not self._recycling:
+            # VM 可能仍在执行该任务，回收会话后再发送下一条
+            self._recycling = True
+            self.recycles += 1
+            self._recycler = asyncio.ensure_future(self._recycle())
+        else:
+            self._dispatch_next()
+
+    def _cache_result(self, task: TaskRecord):
+        """把成功完成且收到 result 的任务写入缓存，缓存出错不影响任务本身"""
+        if self.cache is None or not task.use_cache or task.cached or task.status != 'finished':
+            return
+        if isinstance(task.result, dict) and task.result.get('result_type') == 'error':
+            return
+        try:
+            self.cache.put(task.instruction, task.result, len(task.actions))
+        except Exception as e:
+            self._emit(self.on_error, e)
+
+    def _store_actions(self, task: TaskRecord):
+        """把结束的任务的动作序列写入动作存储，写入出错不影响任务本身"""
+        if self.action_store is None:
+            return
+        try:
+            self.action_store.add_task(task)
+        except Exception as e:
+            self._emit(self.on_error, e)
+
+    def _emit(self, callback, *args):
+        """调用回调，回调异常不影响会话本身"""
+        if callback is None:
+            return
+        try:
+            callback(self, *args)
+        except Exception as e:
+            if callback is not self.on_error and self.on_error is not None:
+                self._emit(self.on_error, e)
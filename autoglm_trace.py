@@ -0,0 +1,325 @@
+"""
+AutoGLM 会话录制与回放
+把收到的每一帧原始消息连同单调时钟接收时间追加写入压缩的 trace 文件，
+并维护块偏移索引，可按帧号或时间快速定位；回放时按 1x / Nx / 最快速度重新送入消息处理流程。
+
+文件格式（小端）:
+    trace 文件: 文件头 <8s magic, d 墙钟起点, d 单调时钟起点>，之后是若干块：
+        块头 <I 压缩长度, I 帧数, d 首帧时间>，块体为 zlib 压缩的帧序列：
+        每帧 <d 相对时间, B 类型(0 文本 / 1 字节), I 长度> + 内容
+    索引文件（trace 路径 + '.idx'）: 文件头 <8s magic>，每块一条 <Q 块偏移, Q 首帧序号, d 首帧时间>
+
+用法:
+    python autoglm_trace.py info session.trace
+    python autoglm_trace.py replay session.trace --speed 10
+    python autoglm_trace.py replay session.trace --speed 0 --quiet   # 最快速度，只统计处理吞吐
+"""
+
+import os
+import sys
+import time
+import zlib
+import struct
+import bisect
+import argparse
+from collections import Counter
+
+TRACE_MAGIC = b"AGLMTRC1"
+INDEX_MAGIC = b"AGLMIDX1"
+_HEADER = struct.Struct('<8sdd')
+_BLOCK = struct.Struct('<IId')
+_FRAME = struct.Struct('<dBI')
+_INDEX = struct.Struct('<QQd')
+
+_KIND_TEXT = 0
+_KIND_BYTES = 1
+
+
+class TraceWriter:
+    """
+    trace 写入器（追加写，只在单个线程中使用）
+
+    帧先缓存在内存块中，块满（帧数或字节数）或距块首帧超过 flush_interval 秒时
+    压缩写入文件并追加一条索引，进程崩溃最多丢失一个未写出的块。
+    """
+
+    def __init__(self, path: str, block_frames: int = 256, block_bytes: int = 64 * 1024,
+                 flush_interval: float = 1.0, level: int = 6):
+        """
+        Args:
+            path: trace 文件路径（已存在时覆盖）
+            block_frames: 每块最多帧数
+            block_bytes: 每块未压缩数据上限（字节）
+            flush_interval: 块内首帧之后最长多少秒写出
+            level: zlib 压缩级别
+        """
+        self.path = path
+        self.block_frames = block_frames
+        self.block_bytes = block_bytes
+        self.flush_interval = flush_interval
+        self.level = level
+        self.frames = 0
+        self.bytes_in = 0  # 原始消息字节数
+        self.bytes_out = 0  # 写入文件的字节数（含块头）
+        self.mono_start = time.monotonic()
+        self._file = open(path, 'wb')
+        self._index = open(path + '.idx', 'wb')
+        self._file.write(_HEADER.pack(TRACE_MAGIC, time.time(), self.mono_start))
+        self._index.write(INDEX_MAGIC)
+        self._buffer = bytearray()
+        self._block_count = 0
+        self._block_ts = 0.0
+        self._block_started = 0.0
+
+    def write(self, message, received_at: float = None):
+        """
+        记录一帧
+
+        Args:
+            message: 原始文本或字节
+            received_at: time.monotonic() 接收时间，默认取当前时间
+        """
+        now = time.monotonic() if received_at is None else received_at
+        if isinstance(message, str):
+            kind, payload = _KIND_TEXT, message.encode('utf-8')
+        else:
+            kind, payload = _KIND_BYTES, bytes(message)
+        ts = now - self.mono_start
+        if self._block_count == 0:
+            self._block_ts = ts
+            self._block_started = now
+        self._buffer += _FRAME.pack(ts, kind, len(payload))
+        self._buffer += payload
+        self._block_count += 1
+        self.frames += 1
+        self.bytes_in += len(payload)
+        if (self._block_count >= self.block_frames or len(self._buffer) >= self.block_bytes
+                or now - self._block_started >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """把当前块压缩写出并追加索引"""
+        if self._block_count == 0:
+            return
+        compressed = zlib.compress(bytes(self._buffer), self.level)
+        offset = self._file.tell()
+        self._file.write(_BLOCK.pack(len(compressed), self._block_count, self._block_ts))
+        self._file.write(compressed)
+        self._file.flush()
+        self._index.write(_INDEX.pack(offset, self.frames - self._block_count, self._block_ts))
+        self._index.flush()
+        self.bytes_out += _BLOCK.size + len(compressed)
+        self._buffer.clear()
+        self._block_count = 0
+
+    def stats(self) -> dict:
+        """录制统计"""
+        return {"path": self.path, "frames": self.frames, "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+    def close(self):
+        """写出剩余帧并关闭文件"""
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        self._index.close()
+
+
+class TraceReader:
+    """
+    trace 读取器
+
+    优先读取索引文件；索引缺失或落后于 trace（例如录制中途崩溃）时扫描块头补齐，
+    扫描只读块头、跳过块体，不需要解压。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file_size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"{path} 不是 trace 文件")
+        magic, self.wall_start, self.mono_start = _HEADER.unpack(header)
+        if magic != TRACE_MAGIC:
+            raise ValueError(f"{path} 不是 trace 文件")
+        self.blocks = []  # [(块偏移, 首帧序号, 首帧时间)]
+        self.frame_count = 0
+        self._load_index()
+        self._scan_blocks()
+        self._block_frames = [b[1] for b in self.blocks]
+        self._block_times = [b[2] for b in self.blocks]
+
+    def _load_index(self):
+        """读取索引文件（只接受块偏移在文件范围内的条目）"""
+        try:
+            with open(self.path + '.idx', 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        if not data.startswith(INDEX_MAGIC):
+            return
+        body = data[len(INDEX_MAGIC):]
+        for pos in range(0, len(body) - _INDEX.size + 1, _INDEX.size):
+            offset, first_frame, first_ts = _INDEX.unpack_from(body, pos)
+            if offset >= self.file_size:
+                break
+            self.blocks.append((offset, first_frame, first_ts))
+
+    def _scan_blocks(self):
+        """从最后一个已索引块开始扫描块头，补齐索引与总帧数；截断的尾块被忽略"""
+        with open(self.path, 'rb') as f:
+            if self.blocks:
+                offset, first_frame, _ = self.blocks.pop()
+            else:
+                offset, first_frame = _HEADER.size, 0
+            while True:
+                f.seek(offset)
+                head = f.read(_BLOCK.size)
+                if len(head) < _BLOCK.size:
+                    break
+                length, count, first_ts = _BLOCK.unpack(head)
+                end = offset + _BLOCK.size + length
+                if end > self.file_size:
+                    break
+                self.blocks.append((offset, first_frame, first_ts))
+                first_frame += count
+                offset = end
+        self.frame_count = first_frame
+
+    def _read_block(self, f, index: int):
+        """解压第 index 块，逐帧产出 (相对时间, 消息)"""
+        f.seek(self.blocks[index][0])
+        length, count, _ = _BLOCK.unpack(f.read(_BLOCK.size))
+        data = zlib.decompress(f.read(length))
+        pos = 0
+        for _ in range(count):
+            ts, kind, size = _FRAME.unpack_from(data, pos)
+            pos += _FRAME.size
+            payload = data[pos:pos + size]
+            pos += size
+            yield ts, (payload.decode('utf-8') if kind == _KIND_TEXT else payload)
+
+    def frames(self, start_frame: int = 0, start_time: float = None):
+        """
+        按顺序产出 (相对时间秒, 原始消息)
+
+        Args:
+            start_frame: 从第几帧开始（从 0 计）
+            start_time: 从相对时间不早于该值的第一帧开始（优先于 start_frame）
+        """
+        if not self.blocks:
+            return
+        if start_time is not None:
+            block = max(bisect.bisect_right(self._block_times, start_time) - 1, 0)
+            skip = None
+        else:
+            block = max(bisect.bisect_right(self._block_frames, start_frame) - 1, 0)
+            skip = start_frame - self.blocks[block][1]
+        with open(self.path, 'rb') as f:
+            for index in range(block, len(self.blocks)):
+                for ts, message in self._read_block(f, index):
+                    if skip:
+                        skip -= 1
+                        continue
+                    if start_time is not None and ts < start_time:
+                        continue
+                    yield ts, message
+
+    def __iter__(self):
+        return self.frames()
+
+    def __len__(self):
+        return self.frame_count
+
+
+def replay(frames, handler, speed: float = 1.0) -> int:
+    """
+    回放帧序列
+
+    Args:
+        frames: (相对时间, 消息) 可迭代对象，通常为 TraceReader.frames()
+        handler: handler(message) 处理一帧，例如 AutoGLMSession.handle_message
+        speed: 回放倍速，1 为原速；<= 0 表示不等待、以最快速度回放
+
+    Returns:
+        回放的帧数
+    """
+    count = 0
+    base_ts = None
+    started = time.monotonic()
+    for ts, message in frames:
+        if speed > 0:
+            if base_ts is None:
+                base_ts = ts
+            # 以回放起点为基准计算目标时间，避免逐帧 sleep 误差累积
+            delay = (ts - base_ts) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        handler(message)
+        count += 1
+    return count
+
+
+def _show_info(reader: TraceReader):
+    """显示 trace 概况"""
+    from autoglm_events import decode_frame
+
+    types = Counter()
+    last_ts = 0.0
+    for ts, message in reader:
+        last_ts = ts
+        types[decode_frame(message).msg_type] += 1
+    size = reader.file_size
+    started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(reader.wall_start))
+    print(f"📼 {reader.path}")
+    print(f"   开始时间: {started}，时长 {last_ts:.1f}s")
+    print(f"   帧数: {reader.frame_count}，块数: {len(reader.blocks)}，文件 {size / 1024:.1f} KB")
+    for msg_type, count in types.most_common():
+        print(f"   • {msg_type}: {count}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="AutoGLM 会话 trace 查看与回放")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="显示 trace 概况")
+    info.add_argument("trace")
+    play = sub.add_parser("replay", help="把 trace 回放到交互式客户端的显示流程")
+    play.add_argument("trace")
+    play.add_argument("--speed", type=float, default=1.0, help="回放倍速（默认 1，<= 0 表示最快）")
+    play.add_argument("--start", type=float, default=None, help="从第几秒开始回放")
+    play.add_argument("--quiet", action="store_true", help="不显示，只统计消息处理吞吐")
+    args = parser.parse_args()
+
+    reader = TraceReader(args.trace)
+    if args.command == "info":
+        _show_info(reader)
+        return
+
+    from autoglm_session import AutoGLMSession
+
+    client = None
+    if args.quiet:
+        session = AutoGLMSession(args.trace)
+    else:
+        from autoglm_client import AutoGLMConfig
+        from interactive_autoglm import AutoGLMInteractiveClient
+        client = AutoGLMInteractiveClient(AutoGLMConfig())  # 回放不连接服务端，也不写缓存与录制
+        session = AutoGLMSession(args.trace, on_message=client.on_message)
+    start = time.perf_counter()
+    try:
+        count = replay(reader.frames(start_time=args.start), session.handle_message, args.speed)
+    except KeyboardInterrupt:
+        print("\n👋 用户中断", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        if client is not None:
+            client.renderer.close()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    print(f"📊 回放 {count} 帧，耗时 {elapsed:.2f}s（{rate:.0f} 帧/秒）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+AutoGLM Phone API 批量执行入口
+从文件或标准输入逐行读取 JSONL 指令，通过会话池并发执行，每完成一条即输出一行 JSONL 结果
+
+输入格式（每行一个 JSON 对象，"cache": false 表示该条不使用结果缓存）:
+    {"id": "q1", "instruction": "在美团搜索附近的火锅店", "timeout": 90}
+
+输出格式（每行一个 JSON 对象）:
+    {"id": "q1", "instruction": "...", "status": "finished", "result": {...},
+     "actions": [...], "error": null, "msg_id": "...", "timings": {...}}
+
+指定 --journal 时，各指令的状态变化写入日志；中断后以相同参数重新运行，
+已结束的指令（按 id 识别）被跳过，只重新执行未完成的部分。
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from autoglm_actions import ActionStore
+from autoglm_cache import ResultCache
+from autoglm_client import AutoGLMConfig
+from autoglm_dashboard import Dashboard, run_pool_dashboard
+from autoglm_journal import BatchJournal
+from autoglm_keys import KeyPool
+from autoglm_pool import AutoGLMSessionPool
+from autoglm_session import ReconnectPolicy, TaskRecord
+
+
+def parse_instruction_line(line: str, line_no: int, default_timeout: float) -> dict:
+    """
+    解析一行输入
+
+    Args:
+        line: 输入行（JSON 对象，或纯文本指令）
+        line_no: 行号，用于生成缺省 id
+        default_timeout: 未指定 timeout 时使用的超时时间，None 表示按历史自适应
+
+    Returns:
+        包含 id / instruction / timeout / cache 的字典；格式错误时抛出 ValueError
+    """
+    line = line.strip()
+    if line.startswith('{'):
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第 {line_no} 行不是合法的 JSON: {e}")
+    else:
+        item = {"instruction": line}
+
+    instruction = item.get('instruction')
+    if not isinstance(instruction, str) or not instruction.strip():
+        raise ValueError(f"第 {line_no} 行缺少 instruction")
+    return {
+        "id": item.get('id', line_no),
+        "instruction": instruction.strip(),
+        "timeout": float(item['timeout']) if item.get('timeout') else default_timeout,
+        "cache": item.get('cache', True) is not False,
+    }
+
+
+def build_result_record(item: dict, record: TaskRecord, queued_at: float) -> dict:
+    """把任务记录整理为输出的结果行"""
+    queued_at = record.queued_at or queued_at
+    sent_at = record.sent_at
+    finished_at = record.finished_at or time.time()
+    return {
+        "id": item['id'],
+        "instruction": item['instruction'],
+        "status": record.status,
+        "result": record.result,
+        "actions": record.actions,
+        "error": record.error,
+        "msg_id": record.msg_id,
+        "cached": record.cached,
+        "timings": {
+            "queued_at": queued_at,
+            "sent_at": sent_at,
+            "finished_at": finished_at,
+            "queue_wait": (sent_at - queued_at) if sent_at else None,
+            "duration": record.duration,
+            "total": finished_at - queued_at,
+            "timeline": record.timeline(),
+        },
+    }
+
+
+def build_error_record(item_id, instruction, error: str) -> dict:
+    """输入无法执行时的结果行"""
+    return {
+        "id": item_id,
+        "instruction": instruction,
+        "status": "error",
+        "result": None,
+        "actions": [],
+        "error": error,
+        "msg_id": None,
+        "cached": False,
+        "timings": None,
+    }
+
+
+class BatchRunner:
+    """批量执行器：限制同时在途的指令数量，结果按完成顺序流式写出"""
+
+    def __init__(self, pool: AutoGLMSessionPool, output, timeout: float = None,
+                 result_grace: float = 5, max_pending: int = None,
+                 journal: BatchJournal = None, retry_failed: bool = False):
+        self.pool = pool
+        self.output = output
+        self.timeout = timeout
+        self.result_grace = result_grace
+        # 读入速度不超过执行速度，避免大语料一次性全部载入内存
+        self.max_pending = max_pending or pool.size * 2
+        self.journal = journal
+        self.retry_failed = retry_failed
+        self.counts = {"finished": 0, "timeout": 0, "error": 0}
+        self.skipped = 0  # 日志中已结束而跳过的指令数
+
+    def write_record(self, record: dict):
+        """写出一行结果并立即刷新"""
+        self.counts[record['status']] = self.counts.get(record['status'], 0) + 1
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+
+    def finish_record(self, key, record: dict):
+        """写出结果行，再把结束状态记入日志（崩溃在两者之间时该条会被重新执行）"""
+        self.write_record(record)
+        if self.journal is None:
+            return
+        if record['status'] == 'finished':
+            self.journal.finished(key, record)
+        else:
+            self.journal.failed(key, record['status'], record['error'])
+
+    async def run_item(self, item: dict, slots: asyncio.Semaphore):
+        """执行一条指令并写出结果"""
+        queued_at = time.time()
+        journal = self.journal
+        on_start = None
+        if journal is not None:
+            journal.queued(item['id'], item['instruction'])
+            on_start = lambda record: journal.sent(item['id'], record.msg_id)
+        try:
+            record = await self.pool.submit(item['instruction'], item['timeout'], self.result_grace,
+                                            item['cache'], on_start)
+            self.finish_record(item['id'], build_result_record(item, record, queued_at))
+        except Exception as e:
+            self.finish_record(item['id'], build_error_record(item['id'], item['instruction'], str(e)))
+        finally:
+            slots.release()
+
+    def is_done(self, key) -> bool:
+        """日志中该指令是否已结束"""
+        return self.journal is not None and self.journal.is_done(key, self.retry_failed)
+
+    async def run(self, lines) -> dict:
+        """
+        执行输入中的全部指令
+
+        Args:
+            lines: 可迭代的输入行（在线程中读取，不阻塞事件循环）
+
+        Returns:
+            各状态的计数
+        """
+        slots = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+        iterator = iter(lines)
+        line_no = 0
+        while True:
+            line = await asyncio.to_thread(next, iterator, None)
+            if line is None:
+                break
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                item = parse_instruction_line(line, line_no, self.timeout)
+            except ValueError as e:
+                key = f"line:{line_no}"
+                if self.is_done(key):
+                    self.skipped += 1
+                else:
+                    self.finish_record(key, build_error_record(line_no, line.strip(), str(e)))
+                continue
+            if self.is_done(item['id']):
+                self.skipped += 1
+                continue
+            await slots.acquire()
+            task = asyncio.create_task(self.run_item(item, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        return self.counts
+
+
+async def run_batch(lines, output, url: str, headers: dict, concurrency: int = 1,
+                    timeout: float = None, result_grace: float = 5, reconnect: int = 0,
+                    cache: ResultCache = None, journal: BatchJournal = None,
+                    retry_failed: bool = False, keys: KeyPool = None,
+                    action_store: ActionStore = None, dashboard: Dashboard = None) -> dict:
+    """
+    建立会话池并执行批量任务，返回各状态计数（跳过的指令数记为 skipped）
+
+    指定 dashboard 时各会话的状态显示在全屏面板中，提示信息也写入面板。
+    """
+    policy = ReconnectPolicy(max_attempts=reconnect) if reconnect > 0 else None
+    pool = AutoGLMSessionPool(url, headers, size=concurrency, reconnect=policy, cache=cache,
+                              keys=keys, action_store=action_store)
+    runner = BatchRunner(pool, output, timeout=timeout, result_grace=result_grace,
+                         journal=journal, retry_failed=retry_failed)
+    notice = dashboard.log if dashboard is not None else (lambda text: print(text, file=sys.stderr))
+    sampler = None
+    if dashboard is not None:
+        started = time.time()
+
+        def header():
+            stats = pool.stats()
+            c = runner.counts
+            return (f"会话 {stats['ready']}/{stats['size']}  执行中 {stats['busy']}  排队 {stats['queue_depth']}  "
+                    f"完成 {c['finished']}  超时 {c['timeout']}  错误 {c['error']}  跳过 {runner.skipped}  "
+                    f"已运行 {time.time() - started:.0f}s")
+
+        sampler = asyncio.create_task(run_pool_dashboard(dashboard, pool, header))
+    try:
+        async with pool:
+            notice(f"✅ 会话池就绪: {pool.stats()['ready']}/{concurrency}")
+            counts = await runner.run(lines)
+            return {**counts, "skipped": runner.skipped}
+    finally:
+        if sampler is not None:
+            sampler.cancel()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="AutoGLM 批量执行：JSONL 指令输入，JSONL 结果输出")
+    parser.add_argument("input", nargs="?", default="-", help="指令文件路径，'-' 表示标准输入（默认）")
+    parser.add_argument("-o", "--output", default="-", help="结果文件路径，'-' 表示标准输出（默认）")
+    parser.add_argument("-c", "--concurrency", type=int, default=None,
+                        help="并发虚拟机数量（默认 1；设置 AUTO_GLM_API_KEYS 时为各 Key 会话上限之和）")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="单条指令默认超时秒数（默认按相似指令的历史耗时自适应，无历史时 120）")
+    parser.add_argument("--result-grace", type=float, default=5,
+                        help="任务完成后等待 result 消息的秒数（默认 5）")
+    parser.add_argument("--reconnect", type=int, default=0,
+                        help="断线自动重连的最大次数，中断的任务会恢复或重新提交（默认 0，不重连）")
+    parser.add_argument("--cache", metavar="PATH",
+                        help="结果缓存 SQLite 文件，重复的指令直接返回缓存结果（默认不缓存）")
+    parser.add_argument("--cache-ttl", type=float, default=24 * 3600, help="缓存有效期秒数（默认 86400）")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="执行日志文件：记录每条指令的状态，中断后重新运行时跳过已结束的指令")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="配合 --journal：重新执行日志中超时或出错的指令")
+    parser.add_argument("--actions", metavar="DIR",
+                        help="把各任务的动作序列写入列式存储目录，可用 autoglm_actions.py 分析")
+    parser.add_argument("--dashboard", action="store_true",
+                        help="在标准错误输出显示全屏面板：每个会话一行（需要终端，结果请用 -o 写入文件）")
+    args = parser.parse_args()
+
+    config = AutoGLMConfig.from_env()
+    try:
+        config.validate()
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    keys = config.keys
+
+    infile = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    outfile = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    cache = ResultCache(args.cache, ttl=args.cache_ttl) if args.cache else None
+    journal = BatchJournal(args.journal) if args.journal else None
+    store = ActionStore(args.actions) if args.actions else None
+    dashboard = None
+    if args.dashboard:
+        if sys.stderr.isatty() and not (args.output == "-" and sys.stdout.isatty()):
+            dashboard = Dashboard("AutoGLM 批量执行")
+        else:
+            print("⚠️  --dashboard 需要标准错误输出为终端、结果写入文件（-o），已改为普通输出", file=sys.stderr)
+    concurrency = args.concurrency or (keys.capacity if keys is not None else None) or 1
+    if journal is not None and journal.states:
+        stats = journal.stats()
+        print(f"📒 从日志恢复: 已完成 {stats['finished']}，失败 {stats['failed']}，"
+              f"未完成 {stats['pending']}", file=sys.stderr)
+    start = time.time()
+    if dashboard is not None:
+        dashboard.start()
+    try:
+        counts = asyncio.run(run_batch(infile, outfile, config.url, config.headers, concurrency,
+                                       args.timeout, args.result_grace, args.reconnect, cache,
+                                       journal, args.retry_failed, keys, store, dashboard))
+    except KeyboardInterrupt:
+        print("\n👋 用户中断", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        if dashboard is not None:
+            dashboard.close()
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+        if cache is not None:
+            # 汇总在关闭数据库之前读取
+            cache_stats = cache.stats()
+            cache.close()
+        if journal is not None:
+            journal.close()
+        if store is not None:
+            store.close()
+
+    elapsed = time.time() - start
+    print(f"📊 完成 {counts['finished']}，超时 {counts['timeout']}，错误 {counts['error']}，"
+          f"耗时 {elapsed:.1f}s", file=sys.stderr)
+    if counts['skipped']:
+        print(f"⏭️  日志中已结束而跳过 {counts['skipped']} 条", file=sys.stderr)
+    if keys is not None:
+        for line in keys.format_lines():
+            print(f"🔑 {line}", file=sys.stderr)
+    if dashboard is not None:
+        stats = dashboard.stats()
+        print(f"🖥️  面板: 绘制 {stats['frames']} 帧，重绘单元格 {stats['cells']}，输出 {stats['bytes'] / 1024:.1f} KB",
+              file=sys.stderr)
+    if store is not None:
+        print(f"🗂️  动作存储: 累计任务 {store.tasks}，动作 {store.actions}（{store.path}）", file=sys.stderr)
+    if cache is not None:
+        print(f"🗄️  缓存命中 {cache_stats['hits']}，未命中 {cache_stats['misses']}，"
+              f"淘汰 {cache_stats['evictions']}", file=sys.stderr)
+    sys.exit(0 if counts['timeout'] == 0 and counts['error'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
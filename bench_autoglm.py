@@ -0,0 +1,244 @@
+"""
+AutoGLM 消息处理热路径微基准
+在合成消息（或录制的 trace）上测量解码、会话状态更新、on_message 与各显示分支的耗时和单帧内存分配，
+终端输出写入空设备。结果为 JSON，可与保存的基线比较以发现性能回退。
+
+用法:
+    python bench_autoglm.py -o baseline.json               # 生成基线
+    python bench_autoglm.py --baseline baseline.json       # 与基线比较，变慢超过阈值时退出码为 1
+    python bench_autoglm.py --trace session.trace          # 额外测量录制的真实流量
+    python bench_autoglm.py --filter display --quick       # 只跑名称包含 display 的项目，减少迭代次数
+"""
+
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import tracemalloc
+
+from autoglm_client import AutoGLMConfig
+from autoglm_events import decode_frame, JSON_BACKEND
+from autoglm_render import Console
+from autoglm_session import AutoGLMSession
+from interactive_autoglm import AutoGLMInteractiveClient
+from mock_autoglm_server import SAMPLE_ACTIONS
+
+
+def make_frame(msg_type: str, data: dict = None, msg_id: str = None) -> str:
+    """构造一帧与服务端格式相同的原始消息"""
+    return json.dumps({
+        "timestamp": int(time.time() * 1000),
+        "conversation_id": "bench-conversation",
+        "msg_type": msg_type,
+        "msg_id": msg_id or str(uuid.uuid4()),
+        "data": data or {},
+    }, ensure_ascii=False)
+
+
+def task_frame(params: dict) -> str:
+    """server_task 消息，data_agent 为嵌套的 JSON 字符串"""
+    return make_frame("server_task", {"biz_type": "agent_action",
+                                      "data_agent": json.dumps(params, ensure_ascii=False)})
+
+
+def synthetic_frames() -> dict:
+    """每种 msg_type 与每个 data_agent 动作分支各一帧"""
+    frames = {
+        "heartbeat": make_frame("heartbeat"),
+        "server_init": make_frame("server_init", {"biz_type": "init_service"}),
+        "server_session": make_frame("server_session", {"biz_type": "init_session", "vm_state": "vm_successful"}),
+        "client_test": make_frame("client_test", {"biz_type": "test_agent", "instruction": "在美团搜索附近的火锅店"}),
+        "server_notify": make_frame("server_notify", {"biz_type": "notify_task", "query_status": "task_doing"}),
+        "server_notify.task_done": make_frame("server_notify", {"biz_type": "notify_task", "query_status": "task_done"}),
+        "result.text": make_frame("result", {"result_type": "text", "content": "已完成: 在美团搜索附近的火锅店"}),
+        "result.image": make_frame("result", {"result_type": "image", "url": "https://example.com/a.png"}),
+        "unknown": make_frame("server_other", {"biz_type": "other", "value": 1}),
+        "malformed": '{"msg_type": "server_task", "data": ',
+    }
+    seen = set()
+    for params in SAMPLE_ACTIONS + [{"action": "finish"}, {"action": "scroll"}, {}]:
+        action = params.get("action", "none")
+        if action not in seen:
+            seen.add(action)
+            frames[f"server_task.{action}"] = task_frame(params)
+    return frames
+
+
+class _NullStream:
+    """丢弃所有输出的流"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class _InlineRenderer:
+    """在当前线程同步渲染的 Renderer 替身，排除线程调度对测量的影响"""
+
+    def __init__(self, handler, stream):
+        self.handler = handler
+        self.console = Console(stream, max_fps=0)
+
+    def post(self, event, key=None, droppable=False):
+        self.handler(event, 1)
+
+    def write(self, text='', end='\n'):
+        self.console.write(text, end)
+
+    def drain(self, timeout=None):
+        return True
+
+    def close(self, timeout=None):
+        pass
+
+
+def make_client(debug: bool = False) -> AutoGLMInteractiveClient:
+    """输出到空设备、同步渲染的客户端"""
+    client = AutoGLMInteractiveClient(AutoGLMConfig(ring_frames=0))  # 不连接服务端，无需 API Key
+    client.renderer = _InlineRenderer(client._render_frame, _NullStream())
+    client.debug_mode = debug
+    return client
+
+
+def measure(func, number: int, repeat: int = 5) -> dict:
+    """
+    测量 func 的单次耗时（repeat 轮取最快一轮）与单次调用的内存分配峰值
+
+    Returns:
+        {"ns_per_op", "ops_per_sec", "alloc_peak_bytes"}
+    """
+    func()  # 预热
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    ns = best / number
+
+    samples = min(number, 200)
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(samples):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return {
+        "ns_per_op": round(ns, 1),
+        "ops_per_sec": round(1e9 / ns, 1) if ns else None,
+        "alloc_peak_bytes": peaks[len(peaks) // 2],
+    }
+
+
+def build_benchmarks(trace: str = None) -> dict:
+    """名称 -> (函数, 单轮迭代次数)"""
+    frames = synthetic_frames()
+    client = make_client()
+    debug_client = make_client(debug=True)
+    bare = AutoGLMSession("bench://")
+    handled = AutoGLMSession("bench://", on_message=client.on_message)
+    debugged = AutoGLMSession("bench://", on_message=debug_client.on_message)
+    benchmarks = {}
+
+    for name, frame in frames.items():
+        benchmarks[f"decode.{name}"] = (lambda f=frame: decode_frame(f), 20000)
+        benchmarks[f"session.{name}"] = (lambda f=frame: bare.handle_message(f), 20000)
+        benchmarks[f"on_message.{name}"] = (lambda f=frame: handled.handle_message(f), 5000)
+        benchmarks[f"debug.{name}"] = (lambda f=frame: debugged.handle_message(f), 1000)
+
+    big_dict = {"items": [{"title": f"第 {i} 条攻略", "content": "云南" * 50} for i in range(2000)]}
+    for label, value in (("1k", {"text": "x" * 1000}), ("200k", big_dict),
+                         ("1m_str", "长" * 1_000_000)):
+        benchmarks[f"summarize.{label}"] = (lambda v=value: client._summarize_value(v), 20)
+
+    for label, size in (("1k", 1000), ("100k", 100_000), ("5m", 5_000_000)):
+        event = decode_frame(make_frame("result", {"result_type": "text", "content": "结" * size}))
+        benchmarks[f"display_result.text_{label}"] = (lambda e=event: client._display_result(e), 20)
+    event = decode_frame(make_frame("result", {"result_type": "summary", "items": big_dict["items"]}))
+    benchmarks["display_result.generic_200k"] = (lambda e=event: client._display_result(e), 20)
+
+    if trace:
+        from autoglm_trace import TraceReader
+        recorded = [message for _, message in TraceReader(trace)]
+
+        def replay_all(session=handled):
+            for message in recorded:
+                session.handle_message(message)
+
+        benchmarks["trace.session"] = (lambda: [bare.handle_message(m) for m in recorded], 1)
+        benchmarks["trace.on_message"] = (replay_all, 1)
+    return benchmarks
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """返回比基线慢超过 threshold（比例）的项目 [(名称, 基线 ns, 当前 ns)]"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base and current["ns_per_op"] > base["ns_per_op"] * (1 + threshold):
+            regressions.append((name, base["ns_per_op"], current["ns_per_op"]))
+    return regressions
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="AutoGLM 消息处理热路径微基准")
+    parser.add_argument("-o", "--output", default="-", help="结果 JSON 文件，'-' 表示标准输出（默认）")
+    parser.add_argument("--baseline", help="与之比较的基线 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="判定为回退的变慢比例（默认 0.25，即慢 25%%）")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的项目")
+    parser.add_argument("--trace", help="额外回放录制的 trace 文件")
+    parser.add_argument("--quick", action="store_true", help="迭代次数减为 1/10，用于快速检查")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (func, number) in build_benchmarks(args.trace).items():
+        if args.filter not in name:
+            continue
+        if args.quick:
+            number = max(number // 10, 1)
+        results[name] = measure(func, number, repeat=3 if args.quick else 5)
+        print(f"  {name:<40} {results[name]['ns_per_op'] / 1000:>10.2f} µs  "
+              f"{results[name]['alloc_peak_bytes']:>10} B", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_backend": JSON_BACKEND,
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f"❌ 回退: {name} {before / 1000:.2f} µs -> {after / 1000:.2f} µs "
+                  f"(+{(after / before - 1) * 100:.0f}%)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"✅ 与基线相比无回退（阈值 {args.threshold:.0%}）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,580 @@
+"""
+AutoGLM Phone API 多进程批量执行
+把 JSONL 指令语料分发给多个 worker 进程，每个进程各自持有一个会话池并发执行，
+结果与延迟统计流回父进程，合并为一份 JSONL 输出。JSON 解码、时间线统计与结果整理分摊到多个进程，
+不再受单进程 GIL 限制。
+
+- 反压: 每个 worker 同时在途的指令不超过 --max-inflight，输入按执行速度读取
+- 崩溃重启: worker 进程异常退出后自动拉起新进程，其在途指令重新分发（最多 --max-attempts 次）
+- 统计: 每个 worker 的完成数、失败数、重启次数与吞吐，以及全部 worker 合并后的延迟分位数
+
+用法:
+    python fanout_autoglm.py corpus.jsonl -o results.jsonl -w 4 -s 8
+    python fanout_autoglm.py corpus.jsonl -w 8 -s 4 --metrics fanout.json
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import asyncio
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+
+from autoglm_client import AutoGLMConfig
+from autoglm_metrics import LatencyMetrics
+from batch_autoglm import parse_instruction_line, build_result_record, build_error_record
+
+# 输入结束标记
+_EOF = object()
+
+
+def _worker_main(worker_id: int, generation: int, url: str, headers: dict, sessions: int,
+                 jobs, results, options: dict):
+    """worker 进程入口：Ctrl+C 由父进程统一处理"""
+    try:
+        asyncio.run(_worker_run(worker_id, generation, url, headers, sessions, jobs, results, options))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_run(worker_id: int, generation: int, url: str, headers: dict, sessions: int,
+                      jobs, results, options: dict):
+    """
+    worker 进程主循环：建立会话池，从 jobs 取指令执行，结果与统计写入 results
+
+    发往父进程的消息均为元组，第二、三项为 worker 编号与进程代数:
+        ("ready", id, gen, pid, 就绪会话数)
+        ("result", id, gen, 序号, 结果行)
+        ("stats", id, gen, 会话池状态, LatencyMetrics)
+        ("done", id, gen, 会话池状态, LatencyMetrics)
+        ("fatal", id, gen, 错误信息)
+    """
+    from autoglm_actions import ActionStore
+    from autoglm_cache import ResultCache
+    from autoglm_pool import AutoGLMSessionPool
+    from autoglm_session import ReconnectPolicy
+
+    parent = multiprocessing.parent_process()
+    reconnect = options.get('reconnect', 0)
+    policy = ReconnectPolicy(max_attempts=reconnect) if reconnect > 0 else None
+    cache = ResultCache(options['cache'], ttl=options['cache_ttl']) if options.get('cache') else None
+    # 各 worker 写入各自的子目录，分析时一起读入
+    store = (ActionStore(os.path.join(options['actions'], f"worker-{worker_id}"))
+             if options.get('actions') else None)
+    pool = AutoGLMSessionPool(url, headers, size=sessions, reconnect=policy, cache=cache,
+                              keys=options.get('keys'), action_store=store)
+    try:
+        try:
+            ready = await pool.start()
+        except Exception as e:
+            results.put(("fatal", worker_id, generation, str(e)))
+            await pool.close()
+            sys.exit(1)
+        results.put(("ready", worker_id, generation, multiprocessing.current_process().pid, ready))
+
+        async def run_item(seq: int, item: dict):
+            queued_at = time.time()
+            try:
+                record = await pool.submit(item['instruction'], item['timeout'],
+                                           options.get('result_grace', 5), item['cache'])
+                line = build_result_record(item, record, queued_at)
+            except Exception as e:
+                line = build_error_record(item['id'], item['instruction'], str(e))
+            results.put(("result", worker_id, generation, seq, line))
+
+        async def report():
+            while True:
+                await asyncio.sleep(options.get('stats_interval', 2.0))
+                results.put(("stats", worker_id, generation, pool.stats(), pool.metrics()))
+
+        reporter = asyncio.create_task(report())
+        tasks = set()
+        while True:
+            try:
+                job = await asyncio.to_thread(jobs.get, True, 1.0)
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    break
+                continue
+            if job is None:
+                break
+            task = asyncio.create_task(run_item(*job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        reporter.cancel()
+        results.put(("done", worker_id, generation, pool.stats(), pool.metrics()))
+    finally:
+        await pool.close()
+        if cache is not None:
+            cache.close()
+        if store is not None:
+            store.close()
+
+
+class _WorkerHandle:
+    """父进程中一个 worker 槽位的状态（进程崩溃重启后沿用同一槽位）"""
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.generation = 0
+        self.process = None
+        self.jobs = None
+        self.pid = None
+        self.ready = 0  # 就绪会话数
+        self.inflight = set()  # 已分发、尚未返回结果的序号
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        self.dead = False  # 重启次数用尽，不再分发
+        self.done = False  # 已收到 done 消息
+        self.started_at = None
+        self.pool_stats = {}
+        self.metrics = {}  # 进程代数 -> 最近一次上报的 LatencyMetrics
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def stats(self) -> dict:
+        """该 worker 的吞吐统计"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        finished = self.completed + self.failed
+        return {
+            "worker": self.worker_id,
+            "pid": self.pid,
+            "completed": self.completed,
+            "failed": self.failed,
+            "inflight": len(self.inflight),
+            "restarts": self.restarts,
+            "elapsed": elapsed,
+            "rate": finished / elapsed if elapsed > 0 else None,
+            "pool": self.pool_stats,
+        }
+
+
+class FanoutCoordinator:
+    """
+    多进程批量执行协调器
+
+    输入由读取线程解析后放入有界队列；主循环把指令分给在途数最少的 worker，
+    收集结果按完成顺序写出。worker 进程异常退出时，其在途指令重新排队，
+    由重启后的进程或其他 worker 执行；同一序号的结果只写出一次。
+    """
+
+    def __init__(self, url: str, headers: dict = None, workers: int = 2, sessions: int = 2,
+                 max_inflight: int = None, timeout: float = None, result_grace: float = 5,
+                 reconnect: int = 0, cache: str = None, cache_ttl: float = 24 * 3600,
+                 max_restarts: int = 3, max_attempts: int = 2, stats_interval: float = 2.0,
+                 progress_interval: float = 10.0, keys=None, actions: str = None):
+        """
+        Args:
+            url: WebSocket 地址
+            headers: 请求头（认证信息）
+            workers: worker 进程数
+            sessions: 每个 worker 的会话池大小
+            max_inflight: 每个 worker 同时在途的指令数上限，默认 sessions * 2
+            timeout: 单条指令默认超时，None 表示按历史自适应
+            result_grace: 任务完成后等待 result 消息的秒数
+            reconnect: 会话断线自动重连的最大次数
+            cache: 结果缓存 SQLite 文件（各 worker 共享）
+            cache_ttl: 缓存有效期（秒）
+            max_restarts: 每个 worker 槽位最多重启次数
+            max_attempts: 单条指令因 worker 崩溃最多执行的次数
+            stats_interval: worker 上报统计的间隔（秒）
+            progress_interval: 进度行的输出间隔（秒），0 表示不输出
+            keys: KeyPool，多个 API Key 的配额按 worker 数切分给各进程（各份之和不超过原配额）
+            actions: 动作序列存储目录，每个 worker 写入其下的 worker-<编号> 子目录
+        """
+        if workers < 1 or sessions < 1:
+            raise ValueError("worker 数与会话数至少为 1")
+        if keys is not None and keys.capacity is not None and keys.capacity < workers:
+            raise ValueError(f"API Key 的会话上限之和（{keys.capacity}）小于 worker 数（{workers}），"
+                             f"请减少 worker 数")
+        self.url = url
+        self.headers = headers or {}
+        self.sessions = sessions
+        self.max_inflight = max_inflight or sessions * 2
+        self.timeout = timeout
+        self.max_restarts = max_restarts
+        self.max_attempts = max_attempts
+        self.progress_interval = progress_interval
+        self.options = {
+            "result_grace": result_grace,
+            "reconnect": reconnect,
+            "cache": cache,
+            "cache_ttl": cache_ttl,
+            "stats_interval": stats_interval,
+            "actions": actions,
+        }
+        self.handles = [_WorkerHandle(i) for i in range(workers)]
+        # 每个 worker 槽位一份 Key 配额（重启后沿用）
+        self._key_shares = [keys.share(workers, i) if keys is not None else None for i in range(workers)]
+        self.counts = {"finished": 0, "timeout": 0, "error": 0}
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._items = {}  # 序号 -> [输入项, 已执行次数, 所在 worker]
+        self._retry = deque()  # 等待重新分发的序号
+        self._next_seq = 0
+        self._input = None
+        self._eof = False
+        self._output = None
+        self._started = None
+        self._last_progress = 0.0
+
+    # ---------- worker 进程管理 ----------
+
+    def _spawn(self, handle: _WorkerHandle):
+        """为槽位启动一个新的 worker 进程"""
+        handle.generation += 1
+        handle.jobs = self._ctx.Queue()
+        handle.ready = 0
+        handle.done = False
+        keys = self._key_shares[handle.worker_id]
+        sessions = self.sessions
+        if keys is not None and keys.capacity is not None:
+            # 会话池不超过本份配额，避免等不到名额的会话拖慢启动
+            sessions = min(sessions, keys.capacity)
+        handle.process = self._ctx.Process(
+            target=_worker_main,
+            args=(handle.worker_id, handle.generation, self.url, self.headers, sessions,
+                  handle.jobs, self._results, {**self.options, "keys": keys}),
+            name=f"autoglm-worker-{handle.worker_id}",
+            daemon=True,
+        )
+        handle.process.start()
+        handle.pid = handle.process.pid
+        if handle.started_at is None:
+            handle.started_at = time.monotonic()
+
+    def _check_workers(self):
+        """发现异常退出的 worker：在途指令重新排队，按次数限制重启"""
+        for handle in self.handles:
+            if handle.dead or handle.done or handle.process is None or handle.alive:
+                continue
+            code = handle.process.exitcode
+            handle.process.join()
+            self._drain_results()  # 进程退出前已发出的结果先处理
+            lost = sorted(handle.inflight)
+            handle.inflight.clear()
+            print(f"⚠️  worker {handle.worker_id}（pid {handle.pid}）异常退出，退出码 {code}，"
+                  f"在途指令 {len(lost)} 条", file=sys.stderr)
+            for seq in lost:
+                entry = self._items[seq]
+                entry[2] = None
+                if entry[1] >= self.max_attempts:
+                    self._finish(seq, build_error_record(
+                        entry[0]['id'], entry[0]['instruction'],
+                        f"worker 进程崩溃，已执行 {entry[1]} 次"))
+                else:
+                    self._retry.appendleft(seq)
+            if handle.restarts >= self.max_restarts:
+                handle.dead = True
+                print(f"❌ worker {handle.worker_id} 重启次数已用尽", file=sys.stderr)
+                continue
+            handle.restarts += 1
+            self._spawn(handle)
+
+    # ---------- 分发与结果 ----------
+
+    def _read_input(self, lines):
+        """读取线程：逐行解析输入放入有界队列，队列满时阻塞（输入侧反压）"""
+        line_no = 0
+        for line in lines:
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                item = parse_instruction_line(line, line_no, self.timeout)
+            except ValueError as e:
+                item = build_error_record(line_no, line.strip(), str(e))
+            self._input.put(item)
+        self._input.put(_EOF)
+
+    def _next_item(self):
+        """取下一条待分发的 (序号, 输入项)；没有时返回 None"""
+        while self._retry:
+            seq = self._retry.popleft()
+            if seq in self._items:
+                return seq
+        while not self._eof:
+            try:
+                item = self._input.get_nowait()
+            except queue.Empty:
+                return None
+            if item is _EOF:
+                self._eof = True
+                return None
+            if 'status' in item:  # 解析失败的行直接写出
+                self._write(item)
+                continue
+            seq = self._next_seq
+            self._next_seq += 1
+            self._items[seq] = [item, 0, None]
+            return seq
+        return None
+
+    def _dispatch(self):
+        """把待执行的指令分给在途数最少、且未达上限的 worker"""
+        while True:
+            candidates = [h for h in self.handles
+                          if not h.dead and h.alive and len(h.inflight) < self.max_inflight]
+            if not candidates:
+                return
+            seq = self._next_item()
+            if seq is None:
+                return
+            handle = min(candidates, key=lambda h: len(h.inflight))
+            entry = self._items[seq]
+            entry[1] += 1
+            entry[2] = handle.worker_id
+            handle.inflight.add(seq)
+            handle.jobs.put((seq, entry[0]))
+
+    def _handle(self, message: tuple):
+        """处理一条 worker 消息"""
+        kind, worker_id, generation = message[:3]
+        handle = self.handles[worker_id]
+        if kind == "ready":
+            if generation == handle.generation:
+                handle.pid, handle.ready = message[3], message[4]
+        elif kind == "result":
+            seq, record = message[3], message[4]
+            handle.inflight.discard(seq)
+            if seq not in self._items:
+                return  # 崩溃后重新分发的指令已由其他进程完成
+            if record['status'] == 'finished':
+                handle.completed += 1
+            else:
+                handle.failed += 1
+            self._finish(seq, record)
+        elif kind in ("stats", "done"):
+            if generation == handle.generation:
+                handle.pool_stats = message[3]
+            handle.metrics[generation] = message[4]
+            if kind == "done" and generation == handle.generation:
+                handle.done = True
+        elif kind == "fatal":
+            print(f"⚠️  worker {worker_id} 会话池启动失败: {message[3]}", file=sys.stderr)
+
+    def _drain_results(self):
+        """处理结果队列中已到达的全部消息"""
+        while True:
+            try:
+                message = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self._handle(message)
+
+    def _finish(self, seq: int, record: dict):
+        """写出一条指令的最终结果"""
+        del self._items[seq]
+        self._write(record)
+
+    def _write(self, record: dict):
+        """写出一行结果并立即刷新"""
+        self.counts[record['status']] = self.counts.get(record['status'], 0) + 1
+        self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._output.flush()
+
+    def _fail_remaining(self, error: str):
+        """没有可用的 worker 时，剩余指令全部写为错误"""
+        for seq in list(self._items):
+            item = self._items[seq][0]
+            self._finish(seq, build_error_record(item['id'], item['instruction'], error))
+        self._retry.clear()
+        while not self._eof:
+            item = self._input.get()
+            if item is _EOF:
+                self._eof = True
+            elif 'status' in item:
+                self._write(item)
+            else:
+                self._write(build_error_record(item['id'], item['instruction'], error))
+
+    def _progress(self, force: bool = False):
+        """定期输出整体进度"""
+        now = time.monotonic()
+        if not force and (not self.progress_interval or now - self._last_progress < self.progress_interval):
+            return
+        self._last_progress = now
+        elapsed = now - self._started
+        done = sum(self.counts.values())
+        inflight = sum(len(h.inflight) for h in self.handles)
+        rate = done / elapsed if elapsed > 0 else 0
+        print(f"⏳ 已完成 {done}，在途 {inflight}，{rate:.1f} 条/秒", file=sys.stderr)
+
+    # ---------- 对外接口 ----------
+
+    def run(self, lines, output) -> dict:
+        """
+        执行输入中的全部指令
+
+        Args:
+            lines: 可迭代的输入行（在独立线程中读取）
+            output: 结果输出流
+
+        Returns:
+            各状态的计数
+        """
+        self._output = output
+        self._started = time.monotonic()
+        self._last_progress = self._started
+        self._input = queue.Queue(maxsize=self.max_inflight * len(self.handles))
+        reader = threading.Thread(target=self._read_input, args=(lines,),
+                                  name="autoglm-fanout-input", daemon=True)
+        reader.start()
+        for handle in self.handles:
+            self._spawn(handle)
+        try:
+            while True:
+                self._dispatch()
+                if self._eof and not self._items:
+                    break
+                if all(h.dead for h in self.handles):
+                    self._fail_remaining("没有可用的 worker 进程")
+                    break
+                try:
+                    self._handle(self._results.get(timeout=0.2))
+                    self._drain_results()
+                except queue.Empty:
+                    pass
+                self._check_workers()
+                self._progress()
+            self._shutdown()
+        except BaseException:
+            self._terminate()
+            raise
+        return self.counts
+
+    def _shutdown(self, timeout: float = 30):
+        """通知 worker 退出并收集最后一次统计"""
+        for handle in self.handles:
+            if handle.alive:
+                handle.jobs.put(None)
+        deadline = time.monotonic() + timeout
+        while any(h.alive for h in self.handles) and time.monotonic() < deadline:
+            try:
+                self._handle(self._results.get(timeout=0.2))
+            except queue.Empty:
+                pass
+        self._drain_results()
+        self._terminate()
+
+    def _terminate(self):
+        """结束仍在运行的 worker 进程"""
+        for handle in self.handles:
+            if handle.alive:
+                handle.process.terminate()
+            if handle.process is not None:
+                handle.process.join(5)
+
+    def worker_stats(self) -> list:
+        """每个 worker 的吞吐统计"""
+        return [h.stats() for h in self.handles]
+
+    def key_stats(self) -> dict:
+        """各 API Key 在所有 worker 中的累计用量（按脱敏 Key 汇总）"""
+        totals = {}
+        for handle in self.handles:
+            for stats in handle.pool_stats.get('keys', []):
+                entry = totals.setdefault(stats['key'], dict.fromkeys(
+                    ("sessions", "opened", "instructions", "throttled", "rejected"), 0))
+                for name in entry:
+                    entry[name] += stats[name]
+        return totals
+
+    def metrics(self) -> LatencyMetrics:
+        """合并所有 worker（含已崩溃进程最后一次上报）的延迟统计"""
+        return LatencyMetrics.aggregate(m for h in self.handles for m in h.metrics.values())
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="AutoGLM 多进程批量执行：JSONL 指令输入，JSONL 结果输出")
+    parser.add_argument("input", nargs="?", default="-", help="指令文件路径，'-' 表示标准输入（默认）")
+    parser.add_argument("-o", "--output", default="-", help="结果文件路径，'-' 表示标准输出（默认）")
+    parser.add_argument("-w", "--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="worker 进程数（默认 CPU 核数）")
+    parser.add_argument("-s", "--sessions", type=int, default=2, help="每个 worker 的并发虚拟机数量（默认 2）")
+    parser.add_argument("--max-inflight", type=int, default=None,
+                        help="每个 worker 同时在途的指令数上限（默认会话数的 2 倍）")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="单条指令默认超时秒数（默认按相似指令的历史耗时自适应，无历史时 120）")
+    parser.add_argument("--result-grace", type=float, default=5,
+                        help="任务完成后等待 result 消息的秒数（默认 5）")
+    parser.add_argument("--reconnect", type=int, default=0, help="断线自动重连的最大次数（默认 0，不重连）")
+    parser.add_argument("--cache", metavar="PATH", help="结果缓存 SQLite 文件（各 worker 共享，默认不缓存）")
+    parser.add_argument("--cache-ttl", type=float, default=24 * 3600, help="缓存有效期秒数（默认 86400）")
+    parser.add_argument("--actions", metavar="DIR",
+                        help="把各任务的动作序列写入列式存储目录（每个 worker 一个子目录），"
+                             "可用 autoglm_actions.py 分析")
+    parser.add_argument("--max-restarts", type=int, default=3, help="每个 worker 最多重启次数（默认 3）")
+    parser.add_argument("--max-attempts", type=int, default=2,
+                        help="单条指令因 worker 崩溃最多执行的次数（默认 2）")
+    parser.add_argument("--progress", type=float, default=10, help="进度行输出间隔秒数，0 表示不输出（默认 10）")
+    parser.add_argument("--metrics", metavar="FILE", help="把每个 worker 的吞吐与合并后的延迟统计写入 JSON 文件")
+    args = parser.parse_args()
+
+    config = AutoGLMConfig.from_env()
+    try:
+        config.validate()
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        coordinator = FanoutCoordinator(
+            config.url, config.headers, workers=args.workers, sessions=args.sessions,
+            max_inflight=args.max_inflight, timeout=args.timeout, result_grace=args.result_grace,
+            reconnect=args.reconnect, cache=args.cache, cache_ttl=args.cache_ttl,
+            max_restarts=args.max_restarts, max_attempts=args.max_attempts,
+            progress_interval=args.progress, keys=config.keys, actions=args.actions,
+        )
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    infile = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    outfile = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    print(f"🚀 启动 {args.workers} 个 worker，每个 {args.sessions} 个会话", file=sys.stderr)
+    start = time.time()
+    try:
+        counts = coordinator.run(infile, outfile)
+    except KeyboardInterrupt:
+        print("\n👋 用户中断", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    elapsed = time.time() - start
+    total = sum(counts.values())
+    print(f"📊 完成 {counts['finished']}，超时 {counts['timeout']}，错误 {counts['error']}，"
+          f"耗时 {elapsed:.1f}s（{total / elapsed if elapsed else 0:.1f} 条/秒）", file=sys.stderr)
+    for stats in coordinator.worker_stats():
+        rate = f"{stats['rate']:.2f} 条/秒" if stats['rate'] is not None else "-"
+        print(f"   • worker {stats['worker']}: 完成 {stats['completed']}，失败 {stats['failed']}，"
+              f"重启 {stats['restarts']}，{rate}", file=sys.stderr)
+    for key, stats in coordinator.key_stats().items():
+        print(f"   🔑 {key}: 会话 {stats['opened']}，指令 {stats['instructions']}，"
+              f"限流 {stats['throttled']}，拒绝 {stats['rejected']}", file=sys.stderr)
+    metrics = coordinator.metrics()
+    for line in metrics.format_lines():
+        print(f"   {line}", file=sys.stderr)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            json.dump({"counts": counts, "elapsed": elapsed, "workers": coordinator.worker_stats(),
+                       "keys": coordinator.key_stats(), "metrics": metrics.to_dict()}, f, ensure_ascii=False, indent=2)
+        print(f"📁 统计已写入: {args.metrics}", file=sys.stderr)
+    sys.exit(0 if counts['timeout'] == 0 and counts['error'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
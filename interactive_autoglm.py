@@ -3,205 +3,352 @@ AutoGLM Phone API 交互式命令行客户端
 支持在命令行发送指令并实时查看消息调用结果
 """
 
-import os
-import json
 import time
-import uuid
+import asyncio
 import threading
-import websocket
-from dotenv import load_dotenv
+from itertools import islice
 
-# 加载环境变量
-load_dotenv()
+from autoglm_events import (
+    decode_frame, Echo, GenericMessage, Heartbeat, InitProgress, Malformed, Notify, Result, TaskAction
+)
+from autoglm_client import AutoGLMClient, AutoGLMConfig
+from autoglm_format import ResultSpill, clip_text, summarize
+from autoglm_handoff import WarmHandoff
+from autoglm_render import Renderer
+from autoglm_ring import filter_frames
 
-# 从环境变量获取 API Key
-API_KEY = os.getenv("AUTO_GLM_API_KEY")
-if not API_KEY:
-    raise ValueError("未找到 API Key，请在 .env 文件中设置 AUTO_GLM_API_KEY")
+# 终端显示的字符预算：结果正文、调试模式的单帧 JSON、普通字段值；逐个显示的字段数上限
+RESULT_MAX_CHARS = 4000
+DEBUG_MAX_CHARS = 8000
+FIELD_MAX_CHARS = 200
+MAX_FIELDS = 20
 
-# WebSocket URL
-URL = "wss://autoglm-api.zhipuai.cn/openapi/v1/autoglm/developer"
-
-# 请求头
-HEADERS = {
-    "Authorization": f"Bearer {API_KEY}"
+# 事件类型 -> 渲染方法（Echo 回执不显示）
+EVENT_RENDERERS = {
+    Heartbeat: '_display_heartbeat',
+    InitProgress: '_display_init_message',
+    TaskAction: '_display_task_message',
+    Notify: '_display_notify_message',
+    Result: '_display_result',
+    GenericMessage: '_display_simple_message',
+    Malformed: '_display_malformed',
 }
 
 
+class _DebugView:
+    """调试模式下待显示原始 JSON 的事件"""
+
+    __slots__ = ('event',)
+
+    def __init__(self, event):
+        self.event = event
+
+
 class AutoGLMInteractiveClient:
-    """AutoGLM 交互式客户端"""
+    """
+    AutoGLM 交互式客户端
+
+    连接与协议处理由无界面的 AutoGLMClient 完成，本类在后台线程运行其事件循环，
+    作为 client.events() 的一个使用者负责终端显示，并提供交互式命令循环。
+
+    提示符在启动后立即出现，连接与 VM 初始化在后台进行；此时输入的指令先在会话中排队，
+    VM 就绪后立即发送。指定 handoff 时优先接入上一次退出时预热的会话。
+    """
     
-    def __init__(self):
-        self.ws = None
-        self.connected = False
-        self.vm_ready = False  # VM 初始化完成标志
+    def __init__(self, config: AutoGLMConfig = None, spill: ResultSpill = None,
+                 handoff: WarmHandoff = None, started: float = None):
+        """
+        Args:
+            config: 客户端配置，None 时从环境变量（及 .env）读取
+            spill: 超大结果写入文件（ResultSpill），None 时只截断显示
+            handoff: 预热会话交接（WarmHandoff），None 时每次启动都新建会话
+            started: 启动计时起点（time.perf_counter()），启动耗时都相对于此；None 时取创建时刻
+        """
+        self.config = config or AutoGLMConfig.from_env()
+        self.loop = None  # 后台线程中运行的事件循环
+        self.client = AutoGLMClient(
+            self.config,
+            on_open=self.on_open,
+            on_error=self.on_error,
+            on_close=self.on_close,
+            on_reconnect=self.on_reconnect
+        )
+        self.session = self.client.session
+        self.spill = spill
+        self.renderer = Renderer(self._render_frame)  # 所有终端输出都经由渲染线程
         self.msg_counter = 0
-        self.lock = threading.Lock()
-        self.print_lock = threading.Lock()  # 专门用于同步打印输出
-        self.current_task = None  # 当前执行的任务
-        self.task_finished = True  # 任务是否完成
-        self.last_action = None  # 上一次操作类型，用于合并相同操作
-        self.action_count = 0  # 相同操作计数
+        self.current_task = None  # 交互循环正在等待的任务（TaskRecord），各任务状态由会话按 msg_id 保存
+        self.current_stream = None  # current_task 对应的 TaskStream
+        self.queued_ids = set()  # 排队提交的任务 msg_id，开始执行时提示
+        self.vm_announced = False  # 是否已显示虚拟机就绪
         self.waiting_input = False  # 是否正在等待用户输入
         self.debug_mode = False  # 调试模式，显示详细 JSON 信息
-        
-    def create_message(self, instruction: str) -> dict:
-        """创建指令消息"""
-        self.msg_counter += 1
-        return {
-            "timestamp": int(time.time() * 1000),
-            "conversation_id": "",
-            "msg_type": "client_test",
-            "msg_id": str(uuid.uuid4()),
-            "data": {
-                "biz_type": "test_agent",
-                "instruction": instruction
-            }
-        }
-    
-    def on_message(self, ws, message):
-        """收到消息时的回调"""
+        self.handoff = handoff
+        self.attached = False  # 是否接入了预热会话
+        self.started = started if started is not None else time.perf_counter()
+        self.startup = {}  # 启动耗时（秒）：prompt / vm_ready / first_action
+        self._warmup = None  # 后台连接与 VM 初始化（concurrent.futures.Future）
+        
+    @property
+    def connected(self) -> bool:
+        """是否已建立连接"""
+        return self.session.connected
+
+    @property
+    def vm_ready(self) -> bool:
+        """VM 是否初始化完成"""
+        return self.session.vm_ready
+
+    @property
+    def starting(self) -> bool:
+        """是否仍在后台连接或等待 VM 初始化"""
+        return self._warmup is not None and not self._warmup.done()
+
+    @property
+    def task_finished(self) -> bool:
+        """当前任务是否完成"""
+        task = self.current_task
+        return task is None or task.done.is_set()
+
+    def _run_coro(self, coro, timeout: float = None):
+        """在后台事件循环中执行协程并阻塞等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def _start_loop(self):
+        """在后台线程启动事件循环"""
+        self.loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=self.loop.run_forever)
+        loop_thread.daemon = True
+        loop_thread.start()
+        # 终端显示只是客户端事件流的一个订阅者
+        asyncio.run_coroutine_threadsafe(self._pump_events(), self.loop)
+
+    async def _pump_events(self):
+        """把客户端的事件流交给 on_message 显示"""
+        async for event in self.client.events():
+            self.on_message(self.session, None, event)
+
+    def connect(self, timeout: float = 10) -> bool:
+        """建立连接，失败返回 False"""
         try:
-            data = json.loads(message)
-            msg_type = data.get('msg_type', 'unknown')
-            
-            # 调试模式：显示原始 JSON
-            if self.debug_mode:
-                self._safe_print(f"\n[📨 {msg_type}] 原始消息:")
-                self._safe_print(json.dumps(data, ensure_ascii=False, indent=2))
-                self._safe_print("-" * 60)
-                # debug 模式下也要检测任务完成状态
-                self._check_task_completion(msg_type, data)
-                return
-            
-            # 根据消息类型显示不同的格式
-            if msg_type == 'heartbeat':
-                # 心跳消息简化显示
-                with self.lock:
-                    self._safe_print(f"\n[💓 心跳] {data.get('timestamp')}")
-            elif msg_type == 'result':
-                # 结果消息 - 提取关键信息以可读格式显示
-                self._display_result(data)
+            self._run_coro(self.session.connect(timeout))
+        except Exception:
+            return False
+        return True
+
+    async def _warm_up(self, timeout: float = 10, ready_timeout: float = 60) -> bool:
+        """
+        后台建立连接并等待 VM 就绪（优先接入预热会话），失败时关闭会话，已排队的指令以 error 结束
+
+        Returns:
+            VM 是否就绪
+        """
+        ready = False
+        try:
+            info = await self.handoff.attach(self.session) if self.handoff is not None else None
+            if info is not None:
+                self.attached = True
+                self._safe_print(f"♨️  已接入预热会话（{time.time() - info['created']:.0f} 秒前预热）")
             else:
-                # 其他消息 - 简化显示
-                self._display_simple_message(data, msg_type)
-        except json.JSONDecodeError:
-            self._safe_print(f"\n[📩 原始消息] {message}")
+                await self.session.connect(timeout)
+            ready = await self.session.wait_ready(ready_timeout)
+            if not ready and not self.session.closed:
+                self._safe_print("\n❌ 服务初始化超时，按回车退出")
+        except Exception:
+            if not self.session.closed:
+                self._safe_print("\n❌ 连接失败，按回车退出")
+        if not ready:
+            await self.client.close()
+            return False
+        self.startup['vm_ready'] = time.perf_counter() - self.started
+        self._safe_print(f"⏱️  启动后 {self.startup['vm_ready']:.2f}s 虚拟机就绪")
+        return True
+
+    def wait_vm_ready(self, timeout: float = 60) -> bool:
+        """等待 VM 初始化完成，超时返回 False"""
+        return self._run_coro(self.session.wait_ready(timeout))
+
+    def wait_task_finished(self, timeout: float = None) -> bool:
+        """等待当前任务完成（finish 动作或 task_done 通知），超时或停滞返回 False；timeout 为 None 时按历史自适应"""
+        task = self.current_task
+        if task is None:
+            return True
+        if self.current_stream is None or timeout is not None:
+            if self._run_coro(self.session.wait_task(task, timeout)):
+                return True
+            # 与取消相同：超时的任务以 timeout 结束，执行中的 VM 被回收，后续排队的指令在新 VM 上执行
+            self._call_in_loop(self.session.expire_task, task, '等待超时')
+            return False
+        # 期限与停滞判定由客户端的 run_instruction 完成
+        return self._run_coro(self.current_stream.wait()).status == 'finished'
+
+    def cancel_task(self, key: str = None) -> bool:
+        """
+        取消任务：默认取消交互循环正在等待的任务（或会话中正在执行的任务）
+
+        Args:
+            key: 序号（#n）或 msg_id（前缀）
+
+        Returns:
+            是否取消了任务
+        """
+        if key:
+            lookup = int(key[1:]) if key.startswith('#') and key[1:].isdigit() else key
+            task = self._call_in_loop(self.session.get_task, lookup)
+        else:
+            task = self.current_task if not self.task_finished else self.session.current_task
+        if task is None or task.done.is_set():
+            self._safe_print(f"❌ 没有可取消的任务{f': {key}' if key else ''}")
+            return False
+        recycling = self._call_in_loop(self.session.cancel_task, task, '用户取消')
+        self.queued_ids.discard(task.msg_id)
+        self._safe_print(f"\n🛑 已取消任务 #{task.seq}: {task.instruction[:40]}")
+        if recycling:
+            self._safe_print("♻️  协议不支持停止指令，正在回收虚拟机（重新建立会话）...")
+        return True
     
-    def _check_task_completion(self, msg_type: str, data: dict):
-        """检查任务是否完成（用于 debug 模式）"""
-        if msg_type != 'server_task':
+    def on_message(self, ws, message, event=None):
+        """
+        收到消息时的回调（在接收线程中执行）
+
+        这里只把已解码的事件放入渲染队列，格式化与输出由渲染线程完成，
+        终端输出慢时不会拖慢消息接收。
+        """
+        if event is None:
+            event = decode_frame(message)
+
+        if isinstance(event, TaskAction) and 'first_action' not in self.startup:
+            self.startup['first_action'] = time.perf_counter() - self.started
+            self._safe_print(f"\n⏱️  启动后 {self.startup['first_action']:.2f}s 收到首个动作")
+
+        if self.debug_mode:
+            # 调试输出量大，允许在积压时丢弃
+            self.renderer.post(_DebugView(event), droppable=True)
             return
-        
-        msg_data = data.get('data', {})
-        data_agent_str = msg_data.get('data_agent', '{}')
-        
-        try:
-            data_agent = json.loads(data_agent_str) if isinstance(data_agent_str, str) else data_agent_str
-        except json.JSONDecodeError:
+
+        key, droppable = None, False
+        if isinstance(event, Heartbeat):
+            key, droppable = 'heartbeat', True
+        elif isinstance(event, TaskAction) and not event.is_finish:
+            droppable = True
+            if event.coalescible:
+                key = f'action:{event.action}'
+        elif isinstance(event, Echo):
+            # 指令发送确认已在 send_instruction 时显示，回执不重复显示；排队的指令提示开始执行
+            if event.msg_id in self.queued_ids:
+                self.queued_ids.discard(event.msg_id)
+                task = self.session.get_task(event.msg_id)
+                if task is not None:
+                    self._safe_print(f"\n[▶️  开始执行 #{task.seq}] {task.instruction}")
             return
-        
-        action = data_agent.get('action', '')
-        
-        if action == 'finish':
-            with self.lock:
-                self.task_finished = True
+        self.renderer.post(event, key=key, droppable=droppable)
+
+    def _render_frame(self, event, count: int = 1):
+        """渲染一个事件（在渲染线程中执行），count 为队列中合并的事件数"""
+        if isinstance(event, _DebugView):
+            self._display_debug(event.event)
+            return
+        method = EVENT_RENDERERS.get(type(event))
+        if method is not None:
+            getattr(self, method)(event, count)
+
+    def _display_debug(self, event):
+        """调试模式：显示原始 JSON"""
+        if isinstance(event, Malformed):
+            raw = event.raw if isinstance(event.raw, str) else repr(event.raw[:DEBUG_MAX_CHARS])
+            self._safe_print(f"\n[📩 原始消息] {clip_text(raw, DEBUG_MAX_CHARS)}")
+            return
+        self._safe_print(f"\n[📨 {event.msg_type}] 原始消息:")
+        self._safe_print(summarize(event.frame, DEBUG_MAX_CHARS, indent=2))
+        self._safe_print("-" * 60)
+        # debug 模式下也要提示任务完成状态
+        self._check_task_completion(event)
+
+    def _check_task_completion(self, event):
+        """检查任务是否完成（用于 debug 模式）"""
+        if isinstance(event, TaskAction) and event.is_finish:
             self._safe_print("\n✅ 任务执行完毕")
             self._safe_print(f"{'-'*60}")
             self._safe_print(f"💡 提示: 输入下一条指令，或输入 'quit' 退出")
             self._safe_print(f"{'-'*60}")
     
-    def _safe_print(self, *args, **kwargs):
-        """线程安全的打印"""
-        with self.print_lock:
-            print(*args, **kwargs)
+    def _safe_print(self, *args, sep: str = ' ', end: str = '\n', **kwargs):
+        """线程安全的打印：交给渲染线程按顺序输出"""
+        self.renderer.write(sep.join(str(a) for a in args), end)
     
-    def _display_result(self, data: dict):
+    def _display_heartbeat(self, event: Heartbeat, count: int = 1):
+        """心跳消息简化显示"""
+        self._safe_print(f"\n[💓 心跳] {event.timestamp}")
+
+    def _display_malformed(self, event: Malformed, count: int = 1):
+        """无法解析的原始消息（超长或二进制消息只显示开头）"""
+        raw = event.raw if isinstance(event.raw, str) else repr(event.raw[:DEBUG_MAX_CHARS])
+        self._safe_print(f"\n[📩 原始消息] {clip_text(raw, DEBUG_MAX_CHARS)}")
+
+    def _display_result(self, event: Result, count: int = 1):
         """以可读格式显示执行结果"""
-        result_data = data.get('data', {})
-        result_type = result_data.get('result_type', 'unknown')
+        result_data = event.payload
+        result_type = event.result_type
         
         self._safe_print(f"\n{'='*60}")
         self._safe_print(f"[✅ 执行结果] 类型: {result_type}")
         self._safe_print(f"{'='*60}")
         
-        # 根据结果类型提取关键信息
-        if result_type == 'text':
+        # 根据结果类型提取关键信息（显示开销有上限，超大结果可写入文件）
+        content = result_data.get('content') if result_type == 'text' else None
+        body = content if isinstance(content, str) else result_data  # 文本结果只写正文
+        if self.spill is not None and self.spill.oversized(body):
+            path = self.spill.write(event.msg_id, body)
+            self._safe_print(f"📎 结果过大，已写入文件: {path}")
+            if body is content:
+                self._safe_print(f"📄 内容开头:\n{clip_text(content, FIELD_MAX_CHARS, 5)}")
+        elif result_type == 'text':
             content = result_data.get('content', '')
-            self._safe_print(f"📄 内容:\n{content}")
+            if isinstance(content, str):
+                self._safe_print(f"📄 内容:\n{clip_text(content, RESULT_MAX_CHARS)}")
+            else:
+                self._safe_print(f"📄 内容: {summarize(content, RESULT_MAX_CHARS)}")
         elif result_type == 'image':
             image_url = result_data.get('url', '')
-            self._safe_print(f"🖼️  图片地址: {image_url}")
+            self._safe_print(f"🖼️  图片地址: {self._clip_field(image_url)}")
         elif result_type == 'error':
             error_msg = result_data.get('error', '未知错误')
-            self._safe_print(f"❌ 错误: {error_msg}")
+            self._safe_print(f"❌ 错误: {self._clip_field(error_msg)}")
         else:
-            # 通用处理 - 显示 data 中的所有字段
-            for key, value in result_data.items():
-                if key == 'result_type':
-                    continue
-                if isinstance(value, str) and len(value) > 200:
-                    self._safe_print(f"📋 {key}:\n{value[:200]}...")
-                else:
-                    self._safe_print(f"📋 {key}: {value}")
+            # 通用处理 - 逐个显示 data 中的字段（最多 MAX_FIELDS 个）
+            fields = {key: value for key, value in islice(result_data.items(), MAX_FIELDS + 1)
+                      if key != 'result_type'}
+            self._print_fields(fields, "📋 ", len(result_data) - ('result_type' in result_data))
         
         # 显示消息元信息
         self._safe_print(f"{'='*60}")
-        self._safe_print(f"🕐 时间戳: {data.get('timestamp')}")
-        self._safe_print(f"🆔 消息ID: {data.get('msg_id', 'N/A')}")
+        self._safe_print(f"🕐 时间戳: {event.timestamp}")
+        self._safe_print(f"🆔 消息ID: {event.msg_id or 'N/A'}")
         self._safe_print(f"{'='*60}")
         self._safe_print(f"\n💡 提示: 输入指令继续，或输入 'quit' 退出")
     
-    def _display_simple_message(self, data: dict, msg_type: str):
+    def _display_simple_message(self, event: GenericMessage, count: int = 1):
         """简化显示其他消息"""
-        msg_data = data.get('data', {})
-        
-        # 检查是否是初始化相关消息，如果是则简化显示
-        if msg_type in ('server_init', 'server_session'):
-            self._display_init_message(msg_type, msg_data)
-            return
-        
-        # 客户端发送确认消息 - 服务端回执，不重复显示
-        if msg_type == 'client_test':
-            # 指令发送确认已在 send_instruction 时显示，这里只重置任务状态
-            with self.lock:
-                self.task_finished = False
-            return
-        
-        # 服务端任务消息
-        if msg_type == 'server_task':
-            self._display_task_message(msg_data)
-            return
-        
-        # server_notify 消息简化显示
-        if msg_type == 'server_notify':
-            self._display_notify_message(msg_data)
-            return
-        
-        # 其他消息简化显示
-        self._safe_print(f"\n[📩 {msg_type}]")
-        msg_id = data.get('msg_id', 'N/A')
-        timestamp = data.get('timestamp')
+        msg_data = event.frame.get('data')
+        self._safe_print(f"\n[📩 {event.msg_type}]")
+        msg_id = event.msg_id or 'N/A'
+        timestamp = event.timestamp
         
         if msg_data:
             if isinstance(msg_data, dict):
-                for key, value in msg_data.items():
-                    if isinstance(value, (dict, list)):
-                        summary = self._summarize_value(value)
-                        self._safe_print(f"  • {key}: {summary}")
-                    else:
-                        self._safe_print(f"  • {key}: {value}")
+                self._print_fields(msg_data, "  • ", len(msg_data))
             else:
-                self._safe_print(f"  • 数据: {msg_data}")
+                self._safe_print(f"  • 数据: {self._clip_field(msg_data)}")
         
         self._safe_print(f"  • 消息ID: {msg_id}")
         if timestamp:
             self._safe_print(f"  • 时间戳: {timestamp}")
     
-    def _display_init_message(self, msg_type: str, msg_data: dict):
+    def _display_init_message(self, event: InitProgress, count: int = 1):
         """显示初始化消息（简洁格式）"""
-        biz_type = msg_data.get('biz_type', '')
-        vm_state = msg_data.get('vm_state', '')
+        msg_type = event.msg_type
+        biz_type = event.biz_type
+        vm_state = event.vm_state
         
         # 根据消息类型显示进度
         if msg_type == 'server_init':
@@ -210,62 +357,34 @@ class AutoGLMInteractiveClient:
             if biz_type == 'init_vm':
                 self._safe_print(f"  🔄 正在启动虚拟机...")
             elif biz_type == 'init_session':
-                if vm_state == 'vm_successful':
-                    with self.lock:
-                        if not self.vm_ready:
-                            self.vm_ready = True
-                            self._safe_print(f"  ✅ 虚拟机就绪")
+                if event.ready:
+                    if not self.vm_announced:
+                        self.vm_announced = True
+                        self._safe_print(f"  ✅ 虚拟机就绪")
                 else:
                     self._safe_print(f"  🔄 虚拟机状态: {vm_state}")
     
-    def _display_task_message(self, msg_data: dict):
-        """显示任务执行消息"""
-        biz_type = msg_data.get('biz_type', '')
-        data_agent_str = msg_data.get('data_agent', '{}')
-        
-        try:
-            data_agent = json.loads(data_agent_str) if isinstance(data_agent_str, str) else data_agent_str
-        except json.JSONDecodeError:
-            data_agent = {}
-        
-        action = data_agent.get('action', '')
-        
-        # 合并连续相同的操作
-        if action and action == self.last_action and action in ('tap', 'click', 'wait'):
-            self.action_count += 1
-            # 使用回车符覆盖上一行显示计数
-            print(f"\r  🤖 执行操作: {action} (x{self.action_count})", end='', flush=True)
-            return
-        else:
-            # 如果之前有合并的操作，先换行
-            if self.action_count > 1:
-                print()  # 换行结束合并显示
-            self.last_action = action
-            self.action_count = 1
+    def _display_task_message(self, event: TaskAction, count: int = 1):
+        """显示任务执行消息，连续相同的 tap/click/wait 合并为一行计数"""
+        biz_type = event.biz_type
+        data_agent = event.params
+        action = event.action
+        console = self.renderer.console
         
         # 根据 action 类型显示不同状态
         if action == 'home':
             self._safe_print(f"\n  📱 执行操作: 返回桌面")
-            self.last_action = action
         elif action == 'finish':
-            with self.lock:
-                self.task_finished = True
-            # 如果有合并的操作，先换行
-            if self.action_count > 1:
-                self._safe_print()
             self._safe_print(f"\n  ✅ 任务执行完毕")
-            self.last_action = None
-            self.action_count = 0
         elif action == 'tap' or action == 'click':
             x, y = data_agent.get('x', 0), data_agent.get('y', 0)
             if x and y:
-                self._safe_print(f"\r  👆 点击: ({x}, {y})      ", end='', flush=True)
+                console.progress(f'action:{action}', f"  👆 点击: ({x}, {y})", count)
             else:
-                self._safe_print(f"\r  🤖 执行操作: tap", end='', flush=True)
+                console.progress(f'action:{action}', f"  🤖 执行操作: {action}", count)
         elif action == 'input' or action == 'type':
             text = data_agent.get('text', '')
             self._safe_print(f"\n  ⌨️  输入: {text[:30]}{'...' if len(text) > 30 else ''}")
-            self.last_action = action
         elif action == 'swipe':
             direction = data_agent.get('direction', '')
             start_x = data_agent.get('start_x', 0)
@@ -289,49 +408,56 @@ class AutoGLMInteractiveClient:
                     self._safe_print(f"\n  👋 滑动: ({start_x},{start_y}) -> ({end_x},{end_y})")
             else:
                 self._safe_print(f"\n  👋 滑动操作")
-            self.last_action = action
         elif action == 'long_press':
             x, y = data_agent.get('x', 0), data_agent.get('y', 0)
             self._safe_print(f"\n  👇 长按: ({x}, {y})")
-            self.last_action = action
         elif action == 'launch':
             app = data_agent.get('app', '')
             self._safe_print(f"\n  🚀 启动应用: {app}")
-            self.last_action = action
         elif action == 'wait':
-            self._safe_print(f"\r  ⏳ 等待...", end='', flush=True)
+            console.progress('action:wait', "  ⏳ 等待...", count)
         elif action:
             self._safe_print(f"\n  🤖 执行操作: {action}")
-            self.last_action = action
         else:
             # 无 action，显示简略信息
             if biz_type:
                 self._safe_print(f"\n  📋 任务类型: {biz_type}")
     
-    def _display_notify_message(self, msg_data: dict):
+    def _display_notify_message(self, event: Notify, count: int = 1):
         """显示通知消息（简洁格式）"""
-        biz_type = msg_data.get('biz_type', '')
-        query_status = msg_data.get('query_status', '')
-        reason = msg_data.get('reason', '')
-        
-        # 只显示关键状态变化
-        if biz_type == 'notify_task':
-            if query_status == 'task_doing':
-                # 任务进行中，只在特定情况下显示
-                pass  # 不显示，避免刷屏
-            elif query_status == 'task_done' or reason == 'finished':
-                self._safe_print(f"\n  📋 任务状态: 已完成")
+        # 只显示关键状态变化；task_doing 表示任务进行中，不显示，避免刷屏
+        if event.task_done:
+            self._safe_print(f"\n  📋 任务状态: 已完成")
     
     def _summarize_value(self, value, max_len: int = 100) -> str:
-        """对复杂值生成简短摘要"""
-        text = json.dumps(value, ensure_ascii=False)
-        if len(text) <= max_len:
-            return text
-        return text[:max_len] + f"... (共 {len(text)} 字符)"
+        """对复杂值生成简短摘要（序列化到 max_len 个字符即停止）"""
+        return summarize(value, max_len)
+
+    def _print_fields(self, fields: dict, prefix: str, total: int):
+        """
+        逐行显示字段，最多 MAX_FIELDS 个，其余只显示数量
+
+        Args:
+            fields: 字段（只读取前 MAX_FIELDS 个）
+            prefix: 每行的前缀
+            total: 字段总数
+        """
+        shown = 0
+        for key, value in islice(fields.items(), MAX_FIELDS):
+            self._safe_print(f"{prefix}{self._clip_field(key)}: {self._clip_field(value)}")
+            shown += 1
+        if total > shown:
+            self._safe_print(f"{prefix}... 另有 {total - shown} 个字段未显示")
+
+    def _clip_field(self, value) -> str:
+        """单个字段的显示文本：复杂值生成摘要，长字符串截断"""
+        if isinstance(value, (dict, list)):
+            return self._summarize_value(value)
+        text = value if isinstance(value, str) else str(value)
+        return text if len(text) <= FIELD_MAX_CHARS else f"{text[:FIELD_MAX_CHARS]}... (共 {len(text)} 字符)"
     
     def on_open(self, ws):
         """连接打开时的回调"""
-        self.connected = True
         self._safe_print("✅ WebSocket 连接已建立")
         self._safe_print("⏳ 正在初始化服务，请稍候...")
         
@@ -341,34 +467,145 @@ class AutoGLMInteractiveClient:
         
     def on_close(self, ws, close_status_code, close_msg):
         """连接关闭时的回调"""
-        self.connected = False
         self._safe_print(f"\n🔌 连接已关闭")
         if close_status_code:
             self._safe_print(f"   状态码: {close_status_code}")
         if close_msg:
             self._safe_print(f"   原因: {close_msg}")
+
+    def on_reconnect(self, ws, attempt: int, delay: float):
+        """重连前的回调"""
+        self._safe_print(f"\n🔄 {delay:.1f} 秒后第 {attempt} 次重连...")
     
-    def send_instruction(self, instruction: str):
-        """发送指令"""
-        if not self.connected or not self.ws:
+    def send_instruction(self, instruction: str, wait: bool = True):
+        """
+        发送指令；VM 正忙时在会话中排队，前一个任务结束后自动发送
+
+        Args:
+            instruction: 要执行的任务指令，以 '!' 开头时跳过结果缓存
+            wait: True 时记为交互循环等待的任务；False 时只排队，立即返回提示符
+        """
+        use_cache = not instruction.startswith('!')
+        instruction = instruction.lstrip('!').strip()
+        if not instruction:
+            return False
+        if not self.connected and not self.starting:
             self._safe_print("❌ 未连接到服务器，无法发送指令")
             return False
             
-        msg = self.create_message(instruction)
-        # 重置任务状态（必须在发送前重置）
-        with self.lock:
-            self.task_finished = False
-            self.last_action = None
-            self.action_count = 0
+        self.msg_counter += 1
         
         # 显示发送信息
         self._safe_print(f"\n[📤 发送指令 #{self.msg_counter}] {instruction}")
         self._safe_print("-" * 60)
-        self._safe_print(f"✅ 指令已发送: {instruction[:40]}{'...' if len(instruction) > 40 else ''}")
-        self._safe_print("⏳ 等待任务执行...")
         
-        self.ws.send(json.dumps(msg))
+        try:
+            stream = self._call_in_loop(self.client.submit, instruction, None, 0, use_cache)
+            task = self._run_coro(stream.submitted())
+        except Exception as e:
+            self._safe_print(f"❌ 指令发送失败: {e}")
+            return False
+        if task.cached:
+            self._safe_print("⚡ 命中结果缓存，未发送给 VM（指令前加 '!' 可跳过缓存）")
+            frame = {'msg_type': 'result', 'msg_id': task.msg_id, 'timestamp': int(task.finished_at * 1000)}
+            self.renderer.post(Result(frame, task.result or {}))
+            if wait:
+                self.current_task, self.current_stream = task, stream
+            return True
+        if task.status == 'queued' and not self.vm_ready:
+            self.queued_ids.add(task.msg_id)
+            self._safe_print(f"⏳ 虚拟机初始化中，就绪后立即发送 (msg_id: {task.msg_id[:8]})")
+        elif task.status == 'queued':
+            self.queued_ids.add(task.msg_id)
+            self._safe_print(f"🕒 已加入队列，前面还有 {self.session.pending - 1} 条指令 (msg_id: {task.msg_id[:8]})")
+        else:
+            self._safe_print(f"✅ 指令已发送: {instruction[:40]}{'...' if len(instruction) > 40 else ''}")
+        if wait:
+            self.current_task, self.current_stream = task, stream
+            self._safe_print("⏳ 等待任务执行...")
         return True
+
+    def show_tasks(self):
+        """列出排队、执行中与最近结束的任务"""
+        tasks = self._call_in_loop(lambda: list(self.session.tasks.values()))
+        if not tasks:
+            self._safe_print("\n📭 暂无任务")
+            return
+        icons = {'queued': '🕒', 'running': '⏳', 'finished': '✅', 'timeout': '⚠️ ', 'error': '❌', 'cancelled': '🛑'}
+        self._safe_print(f"\n📋 任务列表（排队 {self.session.pending} 条）:")
+        for task in tasks[-20:]:
+            duration = f"{task.duration:.1f}s" if task.duration is not None else "-"
+            self._safe_print(f"  {icons.get(task.status, '•')} #{task.seq:<3} {task.msg_id[:8]}  "
+                             f"{task.status:<8} 动作 {len(task.actions):<3} {duration:>7}  {task.instruction[:30]}")
+
+    def show_task(self, key: str):
+        """按序号（#n）或 msg_id（前缀）显示单个任务的状态"""
+        lookup = int(key[1:]) if key.startswith('#') and key[1:].isdigit() else key
+        task = self._call_in_loop(self.session.get_task, lookup)
+        if task is None:
+            self._safe_print(f"❌ 未找到任务: {key}")
+            return
+        info = self._call_in_loop(task.to_dict)
+        info.pop('timeline', None)
+        info['actions'] = [a.get('action', '') for a in info['actions']]
+        self._safe_print("\n" + summarize(info, RESULT_MAX_CHARS, indent=2))
+
+    def show_frames(self, args: list):
+        """
+        查看环形缓冲区中最近的原始消息（此时才解码与格式化）
+
+        Args:
+            args: [数量] [type=<msg_type>] [id=<msg_id 前缀>] [pretty] [save=<文件>]
+        """
+        ring = self.session.ring
+        if ring is None:
+            self._safe_print("❌ 未启用消息缓冲区（AUTO_GLM_RING_FRAMES=0）")
+            return
+        limit, msg_type, msg_id, pretty, save = 20, None, None, False, None
+        for arg in args:
+            if arg.isdigit():
+                limit = int(arg)
+            elif arg.startswith('type='):
+                msg_type = arg[5:]
+            elif arg.startswith('id='):
+                msg_id = arg[3:]
+            elif arg == 'pretty':
+                pretty = True
+            elif arg.startswith('save='):
+                save = arg[5:]
+            else:
+                self._safe_print("❌ 用法: frames [数量] [type=<msg_type>] [id=<msg_id>] [pretty] [save=<文件>]")
+                return
+        # 只在事件循环线程中复制原始字节，解码在当前线程进行
+        filtered = msg_type or msg_id
+        frames = self._call_in_loop(ring.snapshot, None if filtered else limit)
+        matches = list(filter_frames(frames, msg_type, msg_id))[-limit:]
+        if save:
+            with open(save, 'w', encoding='utf-8') as f:
+                for _, _, raw, _ in matches:
+                    f.write(raw.decode('utf-8', 'replace') + '\n')
+            self._safe_print(f"\n📁 已导出 {len(matches)} 条原始消息: {save}")
+            return
+        stats = ring.stats()
+        self._safe_print(f"\n🧾 最近消息 {len(matches)} 条（缓冲区 {stats['frames']} 帧 / "
+                         f"{stats['bytes'] / 1024:.1f} KB，累计 {stats['total']} 帧）:")
+        for received_at, size, raw, event in matches:
+            clock = time.strftime('%H:%M:%S', time.localtime(received_at)) + f".{int(received_at % 1 * 1000):03d}"
+            if pretty:
+                self._safe_print(f"\n[{clock}] {size} 字节")
+                if isinstance(event, Malformed):
+                    self._safe_print(clip_text(raw[:DEBUG_MAX_CHARS * 4].decode('utf-8', 'replace'), DEBUG_MAX_CHARS))
+                else:
+                    self._safe_print(summarize(event.frame, DEBUG_MAX_CHARS, indent=2))
+                continue
+            detail = event.action if isinstance(event, TaskAction) else getattr(event, 'biz_type', '')
+            self._safe_print(f"  {clock} {size:>7} {event.msg_type:<15} {(event.msg_id or '-')[:8]:<8} {detail}")
+
+    def _call_in_loop(self, func, *args):
+        """在事件循环线程中执行同步函数（读取会话状态时避免与接收线程竞争）"""
+        async def call():
+            return func(*args)
+        return self._run_coro(call())
     
     def show_help(self):
         """显示帮助信息"""
@@ -378,12 +615,98 @@ class AutoGLMInteractiveClient:
         self._safe_print("可用命令:")
         self._safe_print("  <任意文本>   - 发送指令给 AutoGLM")
         self._safe_print("  help        - 显示此帮助信息")
-        self._safe_print("  status      - 查看连接状态")
+        self._safe_print("  status      - 查看连接状态与延迟统计（p50/p90/p99）")
+        self._safe_print("  status json|prom [文件] - 以 JSON / Prometheus 文本导出延迟统计")
+        self._safe_print("  !<指令>     - 跳过结果缓存发送指令（设置 AUTO_GLM_CACHE 启用缓存时）")
+        self._safe_print("  queue <指令> - 排队发送指令，不等待完成（VM 空闲后自动执行）")
+        self._safe_print("  tasks       - 查看排队、执行中与最近结束的任务")
+        self._safe_print("  task <#序号|msg_id> - 查看单个任务的状态")
+        self._safe_print("  cancel [#序号|msg_id] - 取消任务（默认当前任务；等待时也可按 Ctrl+C）")
+        self._safe_print("  frames [数量] [type=..] [id=..] [pretty] [save=文件] - 查看最近的原始消息")
         self._safe_print("  example     - 显示示例指令")
         self._safe_print("  debug       - 切换调试模式（显示原始 JSON）")
         self._safe_print("  quit/exit   - 退出程序")
         self._safe_print("="*60)
     
+    def show_status(self, args: list = None):
+        """
+        显示连接状态与延迟统计
+
+        Args:
+            args: 为空时显示摘要；['json'] / ['prom'] 导出到终端，再附文件路径则写入文件
+        """
+        metrics = self.session.metrics
+        if args:
+            fmt = args[0].lower()
+            if fmt not in ('json', 'prom'):
+                self._safe_print("❌ 用法: status [json|prom] [文件]")
+                return
+            text = metrics.to_json() if fmt == 'json' else metrics.to_prometheus()
+            if len(args) > 1:
+                with open(args[1], 'w', encoding='utf-8') as f:
+                    f.write(text)
+                self._safe_print(f"\n📁 延迟统计已导出: {args[1]}")
+            else:
+                self._safe_print(text)
+            return
+
+        conn = self.session.connection_stats()
+        if self.connected and not self.vm_ready:
+            status = "🟡 虚拟机初始化中"
+        elif self.connected:
+            status = "🟢 已连接"
+        elif conn['reconnecting']:
+            status = "🟡 重连中"
+        elif self.starting:
+            status = "🟡 连接中"
+        else:
+            status = "🔴 未连接"
+        self._safe_print(f"\n连接状态: {status}")
+        if self.startup:
+            labels = (('prompt', '提示符'), ('vm_ready', '虚拟机就绪'), ('first_action', '首个动作'))
+            parts = [f"{label} {self.startup[key]:.2f}s" for key, label in labels if key in self.startup]
+            source = "，接入预热会话" if self.attached else ""
+            self._safe_print(f"⏱️  启动耗时: {'，'.join(parts)}{source}")
+        if self.session.reconnect is not None:
+            self._safe_print(f"🔄 重连: {conn['reconnects']} 次，累计断线 {conn['downtime']:.1f}s")
+        if conn['recycles']:
+            self._safe_print(f"♻️  回收: {conn['recycles']} 次（任务取消或超时后换用新的虚拟机）")
+        live = conn['liveness']
+        parts = []
+        if live['heartbeat_interval']:
+            parts.append(f"心跳间隔 {live['heartbeat_interval']:.1f}s")
+        if live['last_frame_age'] is not None:
+            parts.append(f"最近消息 {live['last_frame_age']:.1f}s 前")
+        if live['rtt'] is not None:
+            parts.append(f"RTT {live['rtt'] * 1000:.0f}ms（平均 {live['rtt_avg'] * 1000:.0f}ms）")
+        if live['failures']:
+            parts.append(f"判定失效 {live['failures']} 次")
+        if parts:
+            self._safe_print(f"💓 存活检测: {'，'.join(parts)}")
+        if self.session.keys is not None:
+            current = conn['api_key']
+            self._safe_print(f"🔑 API Key: 当前 {current or '-'}")
+            for line in self.session.keys.format_lines():
+                self._safe_print(f"  • {line}")
+        if self.session.ring is not None:
+            ring = self.session.ring.stats()
+            self._safe_print(f"🧾 消息缓冲区: {ring['frames']}/{ring['max_frames']} 帧，"
+                             f"{ring['bytes'] / 1024:.1f}/{ring['capacity'] / 1024:.0f} KB")
+        if self.session.recorder is not None:
+            trace = self.session.recorder.stats()
+            self._safe_print(f"📼 录制: {trace['path']}，{trace['frames']} 帧，"
+                             f"{trace['bytes_in'] / 1024:.1f} KB -> {trace['bytes_out'] / 1024:.1f} KB")
+        if self.session.cache is not None:
+            cache = self.session.cache.stats()
+            self._safe_print(f"🗄️  结果缓存: 命中 {cache['hits']}，未命中 {cache['misses']}，"
+                             f"过期 {cache['expired']}，淘汰 {cache['evictions']}，"
+                             f"{cache['entries']} 条 / {cache['bytes'] / 1024:.1f} KB")
+        lines = metrics.format_lines()
+        if lines:
+            self._safe_print("📊 延迟统计:")
+            for line in lines:
+                self._safe_print(f"  • {line}")
+
     def toggle_debug_mode(self):
         """切换调试模式"""
         self.debug_mode = not self.debug_mode
@@ -415,56 +738,27 @@ class AutoGLMInteractiveClient:
         self._safe_print("\n" + "="*60)
         self._safe_print("🚀 AutoGLM Phone API 交互式客户端")
         self._safe_print("="*60)
-        self._safe_print(f"连接地址: {URL}")
-        self._safe_print(f"API Key: {API_KEY[:10]}...{API_KEY[-4:]}")
+        self._safe_print(f"连接地址: {self.config.url}")
+        self._safe_print(f"API Key: {self.config.masked_key}")
         self._safe_print("-" * 60)
         
-        # 创建 WebSocket 应用
-        self.ws = websocket.WebSocketApp(
-            URL,
-            header=HEADERS,
-            on_open=self.on_open,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=self.on_close
-        )
-        
-        # 在后台线程运行 WebSocket
-        ws_thread = threading.Thread(target=self.ws.run_forever)
-        ws_thread.daemon = True
-        ws_thread.start()
+        # 在后台线程运行事件循环，连接与 VM 初始化在后台进行，不等待即显示提示符
+        self._start_loop()
+        self._warmup = asyncio.run_coroutine_threadsafe(self._warm_up(), self.loop)
         
-        # 等待连接建立
-        timeout = 10
-        start_time = time.time()
-        while not self.connected and time.time() - start_time < timeout:
-            time.sleep(0.1)
-        
-        if not self.connected:
-            self._safe_print("❌ 连接超时")
-            return
-        
-        # 等待 VM 初始化完成
-        init_timeout = 60
-        start_time = time.time()
-        while not self.vm_ready and time.time() - start_time < init_timeout:
-            time.sleep(0.1)
-        
-        if not self.vm_ready:
-            self._safe_print("❌ 服务初始化超时")
-            return
-        
-        # 初始化完成，显示提示信息
-        self._safe_print("-" * 60)
         self._safe_print("💡 提示: 输入指令发送给 AutoGLM，输入 'quit' 或 'exit' 退出")
         self._safe_print("💡 提示: 输入 'help' 查看帮助")
+        self.startup['prompt'] = time.perf_counter() - self.started
+        self._safe_print(f"⏱️  启动后 {self.startup['prompt'] * 1000:.0f}ms 显示提示符，"
+                         f"虚拟机在后台初始化，现在即可输入指令")
         self._safe_print("-" * 60)
         
         # 交互式循环
         try:
-            while self.connected:
+            while not self.session.closed:
                 try:
-                    # 获取用户输入
+                    # 获取用户输入（先等渲染队列输出完，避免覆盖提示符）
+                    self.renderer.drain()
                     user_input = input("\n🔹 请输入指令: ").strip()
                     
                     if not user_input:
@@ -472,27 +766,39 @@ class AutoGLMInteractiveClient:
                     
                     # 处理特殊命令
                     if user_input.lower() in ('quit', 'exit', 'q'):
-                        print("👋 正在退出...")
+                        self._safe_print("👋 正在退出...")
                         break
                     elif user_input.lower() == 'help':
                         self.show_help()
-                    elif user_input.lower() == 'status':
-                        status = "🟢 已连接" if self.connected else "🔴 未连接"
-                        self._safe_print(f"\n连接状态: {status}")
+                    elif user_input.lower().split()[0] == 'status':
+                        self.show_status(user_input.split()[1:])
                     elif user_input.lower() == 'example':
                         self.show_examples()
                     elif user_input.lower() == 'debug':
                         self.toggle_debug_mode()
+                    elif user_input.lower().split()[0] == 'queue' and len(user_input.split(None, 1)) > 1:
+                        self.send_instruction(user_input.split(None, 1)[1], wait=False)
+                    elif user_input.lower().split()[0] == 'frames':
+                        self.show_frames(user_input.split()[1:])
+                    elif user_input.lower() == 'tasks':
+                        self.show_tasks()
+                    elif user_input.lower().split()[0] == 'task' and len(user_input.split()) == 2:
+                        self.show_task(user_input.split()[1])
+                    elif user_input.lower().split()[0] == 'cancel' and len(user_input.split()) <= 2:
+                        self.cancel_task(user_input.split()[1] if len(user_input.split()) == 2 else None)
                     else:
                         # 发送指令
                         if self.send_instruction(user_input):
-                            # 等待任务执行完成
-                            wait_timeout = 120  # 最长等待120秒
-                            wait_start = time.time()
-                            while not self.task_finished and time.time() - wait_start < wait_timeout:
-                                time.sleep(0.1)
-                            if not self.task_finished:
-                                self._safe_print("\n⚠️  任务执行超时，但仍然可以发送下一条指令")
+                            # 等待任务执行完成（期限按相似指令的历史耗时推算，无历史时 120 秒），Ctrl+C 取消任务
+                            try:
+                                finished = self.wait_task_finished()
+                            except KeyboardInterrupt:
+                                self.cancel_task()
+                                continue
+                            if not finished:
+                                reason = self.current_task.error if self.current_task else None
+                                self._safe_print(f"\n⚠️  任务执行超时{f'（{reason}）' if reason else ''}，"
+                                                 f"正在回收虚拟机，可以发送下一条指令")
                             else:
                                 # 任务完成，显示分隔线和提示
                                 self._safe_print(f"\n{'-'*60}")
@@ -506,13 +812,28 @@ class AutoGLMInteractiveClient:
         except KeyboardInterrupt:
             self._safe_print("\n\n👋 用户中断")
         finally:
-            self.ws.close()
+            if self.handoff is not None and not self.session.closed and not self.handoff.available():
+                # 为下一次启动预热会话（VM 初始化与本进程退出并行）
+                pid = self.handoff.spawn()
+                self._safe_print(f"♨️  已在后台预热下一次的会话（进程 {pid}，"
+                                 f"{self.handoff.ttl:.0f} 秒内启动可直接接入）")
+            self._run_coro(self.client.close())
+            self.loop.call_soon_threadsafe(self.loop.stop)
             self._safe_print("👋 已断开连接，再见！")
+            self.renderer.close()
 
 
 def main():
     """主函数"""
-    client = AutoGLMInteractiveClient()
+    started = time.perf_counter()
+    config = AutoGLMConfig.from_env()
+    try:
+        config.validate()
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    client = AutoGLMInteractiveClient(config, spill=ResultSpill.from_env(), handoff=WarmHandoff.from_env(),
+                                      started=started)
     client.run()
 
 
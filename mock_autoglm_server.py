@@ -0,0 +1,311 @@
+"""
+AutoGLM Phone API 本地模拟服务端
+按与线上服务相同的协议发送 server_init / server_session / server_task / server_notify / result 消息，
+支持可配置的延迟、动作流长度、心跳频率、断线和畸形消息，用于无 API Key 的测试与压测
+
+用法:
+    python mock_autoglm_server.py --port 8765 --scenario fast
+    AUTO_GLM_URL=ws://127.0.0.1:8765 AUTO_GLM_API_KEY=dummy python interactive_autoglm.py
+"""
+
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from http import HTTPStatus
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+
+# 模拟动作流中循环使用的 data_agent 动作
+SAMPLE_ACTIONS = [
+    {"action": "launch", "app": "小红书"},
+    {"action": "tap", "x": 540, "y": 1200},
+    {"action": "tap", "x": 540, "y": 1200},
+    {"action": "input", "text": "云南旅游攻略"},
+    {"action": "click", "x": 980, "y": 160},
+    {"action": "wait"},
+    {"action": "wait"},
+    {"action": "swipe", "start_x": 540, "start_y": 1600, "end_x": 540, "end_y": 600},
+    {"action": "long_press", "x": 300, "y": 800},
+    {"action": "swipe", "start_x": 900, "start_y": 1000, "end_x": 100, "end_y": 1000},
+    {"action": "home"},
+]
+
+
+class MockScenario:
+    """模拟服务端的行为参数"""
+
+    def __init__(self, init_delay: float = 0.5, vm_states=("vm_starting", "vm_successful"),
+                 action_count: int = 8, action_delay: float = 0.3, heartbeat_interval: float = 10,
+                 drop_rate: float = 0.0, malformed_rate: float = 0.0, result_size: int = 0,
+                 finish_notify: bool = True, api_key: str = None):
+        """
+        Args:
+            init_delay: server_init / server_session 各阶段之间的延迟（秒）
+            vm_states: init_session 阶段依次上报的 vm_state，最后一个应为 vm_successful
+            action_count: 每个任务在 finish 之前的动作数量
+            action_delay: 相邻动作之间的延迟（秒），0 表示不等待
+            heartbeat_interval: 心跳间隔（秒），0 表示不发送心跳
+            drop_rate: 每个任务执行中途断开连接的概率
+            malformed_rate: 每帧被替换为畸形消息的概率
+            result_size: result 文本内容的长度（字符），0 表示只返回简短摘要
+            finish_notify: finish 之后是否发送 task_done 通知
+            api_key: 指定时校验 Authorization 头，不匹配返回 401
+        """
+        self.init_delay = init_delay
+        self.vm_states = tuple(vm_states)
+        self.action_count = action_count
+        self.action_delay = action_delay
+        self.heartbeat_interval = heartbeat_interval
+        self.drop_rate = drop_rate
+        self.malformed_rate = malformed_rate
+        self.result_size = result_size
+        self.finish_notify = finish_notify
+        self.api_key = api_key
+
+
+# 预置场景（负载画像）
+SCENARIOS = {
+    # 接近线上节奏
+    "default": {},
+    # 无延迟，用于吞吐压测（每秒可发送数千帧）
+    "fast": {"init_delay": 0, "action_delay": 0, "heartbeat_interval": 0},
+    # 长动作流洪泛
+    "flood": {"init_delay": 0, "action_count": 2000, "action_delay": 0, "heartbeat_interval": 0.05},
+    # 慢速 VM 与长任务
+    "slow": {"init_delay": 3, "vm_states": ("vm_starting", "vm_booting", "vm_successful"),
+             "action_count": 30, "action_delay": 1.5, "heartbeat_interval": 5},
+    # 不稳定网络：断线与畸形消息
+    "flaky": {"init_delay": 0.2, "action_delay": 0.1, "heartbeat_interval": 1,
+              "drop_rate": 0.2, "malformed_rate": 0.05},
+    # 超大结果
+    "large": {"init_delay": 0, "action_delay": 0, "heartbeat_interval": 0, "result_size": 5_000_000},
+}
+
+
+def make_scenario(name: str = "default", **overrides) -> MockScenario:
+    """按名称创建场景，overrides 中非 None 的参数覆盖预置值"""
+    if name not in SCENARIOS:
+        raise ValueError(f"未知场景: {name}，可选: {', '.join(SCENARIOS)}")
+    params = dict(SCENARIOS[name])
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    return MockScenario(**params)
+
+
+class MockConnection:
+    """单个客户端连接（对应一台模拟 VM）"""
+
+    def __init__(self, ws, scenario: MockScenario, rng: random.Random):
+        self.ws = ws
+        self.scenario = scenario
+        self.rng = rng
+        self.conversation_id = str(uuid.uuid4())
+        self.tasks = asyncio.Queue()
+        self.frames_sent = 0
+
+    def frame(self, msg_type: str, data: dict = None, msg_id: str = None) -> dict:
+        """构造一帧服务端消息"""
+        return {
+            "timestamp": int(time.time() * 1000),
+            "conversation_id": self.conversation_id,
+            "msg_type": msg_type,
+            "msg_id": msg_id or str(uuid.uuid4()),
+            "data": data or {},
+        }
+
+    async def send(self, frame: dict):
+        """发送一帧，按 malformed_rate 随机替换为畸形消息"""
+        text = json.dumps(frame, ensure_ascii=False)
+        if self.scenario.malformed_rate and self.rng.random() < self.scenario.malformed_rate:
+            text = text[:max(len(text) // 2, 1)]
+        await self.ws.send(text)
+        self.frames_sent += 1
+
+    async def pause(self, delay: float):
+        """延迟；0 时让出事件循环以免独占"""
+        await asyncio.sleep(delay)
+
+    async def initialize(self):
+        """模拟服务与 VM 初始化"""
+        s = self.scenario
+        await self.send(self.frame("server_init", {"biz_type": "init_server"}))
+        await self.pause(s.init_delay)
+        await self.send(self.frame("server_session", {"biz_type": "init_vm"}))
+        for state in s.vm_states:
+            await self.pause(s.init_delay)
+            await self.send(self.frame("server_session", {"biz_type": "init_session", "vm_state": state}))
+
+    async def heartbeat(self):
+        """定时发送心跳"""
+        while True:
+            await asyncio.sleep(self.scenario.heartbeat_interval)
+            await self.send(self.frame("heartbeat"))
+
+    async def run_task(self, request: dict):
+        """执行一条指令：回执、动作流、finish、通知与结果"""
+        s = self.scenario
+        msg_id = request.get('msg_id') or str(uuid.uuid4())
+        instruction = (request.get('data') or {}).get('instruction', '')
+        await self.send(self.frame("client_test", request.get('data'), msg_id))
+        await self.send(self.frame("server_notify", {"biz_type": "notify_task", "query_status": "task_doing"}, msg_id))
+
+        drop_at = -1
+        if s.drop_rate and self.rng.random() < s.drop_rate:
+            drop_at = self.rng.randrange(s.action_count + 1)
+        for i in range(s.action_count):
+            if i == drop_at:
+                await self.ws.close(1011, "mock drop")
+                return
+            await self.pause(s.action_delay)
+            action = SAMPLE_ACTIONS[i % len(SAMPLE_ACTIONS)]
+            data = {"biz_type": "task_agent", "data_agent": json.dumps(action, ensure_ascii=False)}
+            await self.send(self.frame("server_task", data, msg_id))
+        if drop_at == s.action_count:
+            await self.ws.close(1011, "mock drop")
+            return
+
+        await self.pause(s.action_delay)
+        finish = {"action": "finish", "message": "任务完成"}
+        await self.send(self.frame("server_task",
+                                   {"biz_type": "task_agent", "data_agent": json.dumps(finish, ensure_ascii=False)},
+                                   msg_id))
+        if s.finish_notify:
+            await self.send(self.frame("server_notify",
+                                       {"biz_type": "notify_task", "query_status": "task_done", "reason": "finished"},
+                                       msg_id))
+        content = f"已完成: {instruction}"
+        if s.result_size:
+            line = content + "\n"
+            content = (line * (s.result_size // len(line) + 1))[:s.result_size]
+        await self.send(self.frame("result", {"result_type": "text", "content": content}, msg_id))
+
+    async def executor(self):
+        """VM 同一时间只执行一个任务，按接收顺序依次执行"""
+        while True:
+            request = await self.tasks.get()
+            await self.run_task(request)
+
+    async def serve(self):
+        """连接主循环"""
+        background = []
+        try:
+            await self.initialize()
+            if self.scenario.heartbeat_interval:
+                background.append(asyncio.create_task(self.heartbeat()))
+            background.append(asyncio.create_task(self.executor()))
+            async for message in self.ws:
+                try:
+                    request = json.loads(message)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(request, dict) and request.get('msg_type') == 'client_test':
+                    self.tasks.put_nowait(request)
+        except ConnectionClosed:
+            pass
+        finally:
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+
+
+class MockAutoGLMServer:
+    """模拟服务端，可在测试或压测脚本中以 async with 启动"""
+
+    def __init__(self, scenario: MockScenario = None, host: str = "127.0.0.1", port: int = 0, seed: int = None):
+        self.scenario = scenario or MockScenario()
+        self.host = host
+        self.port = port
+        self.rng = random.Random(seed)
+        self.server = None
+        self.connections = 0
+        self.frames_sent = 0
+
+    @property
+    def url(self) -> str:
+        """实际监听地址（port=0 时为系统分配的端口）"""
+        return f"ws://{self.host}:{self.port}"
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def _check_auth(self, connection, request):
+        """校验 Authorization 头"""
+        if not self.scenario.api_key:
+            return None
+        if request.headers.get("Authorization") == f"Bearer {self.scenario.api_key}":
+            return None
+        return connection.respond(HTTPStatus.UNAUTHORIZED, "invalid api key\n")
+
+    async def _handler(self, ws):
+        self.connections += 1
+        conn = MockConnection(ws, self.scenario, self.rng)
+        try:
+            await conn.serve()
+        finally:
+            self.frames_sent += conn.frames_sent
+
+    async def start(self):
+        """启动监听"""
+        self.server = await serve(self._handler, self.host, self.port,
+                                  process_request=self._check_auth, max_size=None)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """停止监听并关闭所有连接"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def run_server(args):
+    """按命令行参数运行模拟服务端直到中断"""
+    scenario = make_scenario(
+        args.scenario,
+        init_delay=args.init_delay,
+        action_count=args.actions,
+        action_delay=args.action_delay,
+        heartbeat_interval=args.heartbeat,
+        drop_rate=args.drop_rate,
+        malformed_rate=args.malformed_rate,
+        result_size=args.result_size,
+        api_key=args.api_key,
+    )
+    async with MockAutoGLMServer(scenario, args.host, args.port, args.seed) as server:
+        print(f"🧪 模拟服务端已启动: {server.url} (场景: {args.scenario})")
+        print(f"   使用: AUTO_GLM_URL={server.url} python interactive_autoglm.py")
+        await asyncio.Future()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="AutoGLM Phone API 本地模拟服务端")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口（默认 8765）")
+    parser.add_argument("--scenario", default="default", choices=sorted(SCENARIOS), help="预置场景")
+    parser.add_argument("--init-delay", type=float, help="初始化各阶段延迟（秒）")
+    parser.add_argument("--actions", type=int, help="每个任务的动作数量")
+    parser.add_argument("--action-delay", type=float, help="动作间隔（秒）")
+    parser.add_argument("--heartbeat", type=float, help="心跳间隔（秒），0 表示关闭")
+    parser.add_argument("--drop-rate", type=float, help="任务中途断线概率")
+    parser.add_argument("--malformed-rate", type=float, help="畸形消息概率")
+    parser.add_argument("--result-size", type=int, help="结果文本长度（字符）")
+    parser.add_argument("--api-key", help="校验的 API Key（默认不校验）")
+    parser.add_argument("--seed", type=int, help="随机种子，用于复现断线/畸形消息")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_server(args))
+    except KeyboardInterrupt:
+        print("\n👋 模拟服务端已停止")
+
+
+if __name__ == "__main__":
+    main()
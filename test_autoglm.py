@@ -1,125 +1,284 @@
 """
-AutoGLM Phone API WebSocket 测试客户端
-通过 WebSocket 连接 AutoGLM API 并发送测试指令
+AutoGLM Phone API 并发负载测试
+按设定的并发连接数与爬坡时间建立会话，每个连接从指令文件中抽取指令执行，
+统计连接耗时、VM 就绪耗时、任务耗时分布、消息吞吐与错误率，用于上线前的容量评估
+
+用法:
+    python test_autoglm.py                                    # 单连接执行一条默认指令
+    python test_autoglm.py "打开淘宝搜索 iPhone 16 的价格"       # 单连接执行自定义指令
+    python test_autoglm.py -n 50 --ramp-up 10 -i instructions.txt -t 5 --json report.json
+    python test_autoglm.py -n 200 --mock fast -t 20           # 对进程内的本地模拟服务端压测
 """
 
 import os
+import sys
 import json
 import time
-import uuid
-import websocket
-from dotenv import load_dotenv
+import random
+import asyncio
+import argparse
+from collections import Counter
 
 from dotenv import load_dotenv
+
+from autoglm_metrics import QUANTILES, percentile
+from autoglm_session import AutoGLMSession
+
 # 把 .env 里所有 KEY=VALUE 注入到 os.environ
 load_dotenv()          # 默认查找当前目录下的 .env
 
-# 从环境变量获取 API Key
-API_KEY = os.getenv("AUTO_GLM_API_KEY")
-if not API_KEY:
-    raise ValueError("未找到 API Key，请在 .env 文件中设置 AUTO_GLM_API_KEY")
+# WebSocket URL（可通过 AUTO_GLM_URL 覆盖，例如指向本地模拟服务端）
+URL = os.getenv("AUTO_GLM_URL", "wss://autoglm-api.zhipuai.cn/openapi/v1/autoglm/developer")
 
-# WebSocket URL
-URL = "wss://autoglm-api.zhipuai.cn/openapi/v1/autoglm/developer"
+# 默认测试指令
+DEFAULT_INSTRUCTION = "帮我在小红书找三篇云南的旅游攻略汇总一篇"
 
-# 请求头
-HEADERS = {
-    "Authorization": f"Bearer {API_KEY}"
-}
 
-
-def create_test_message(instruction: str = "帮我在小红书找三篇云南的旅游攻略汇总一篇") -> dict:
+def load_instructions(path: str) -> list:
     """
-    创建测试指令消息
-    
-    Args:
-        instruction: 要执行的任务指令
-        
+    读取指令文件
+
+    每行一条纯文本指令，或 JSON 对象 {"instruction": "...", "weight": 3}；
+    weight 为抽取权重（默认 1），空行与 # 开头的行被忽略
+
     Returns:
-        消息字典
+        [(指令, 权重)]
     """
-    return {
-        "timestamp": int(time.time() * 1000),
-        "conversation_id": "",
-        "msg_type": "client_test",
-        "msg_id": str(uuid.uuid4()),
-        "data": {
-            "biz_type": "test_agent",
-            "instruction": instruction
-        }
-    }
+    mix = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                instruction = item.get('instruction')
+                if not isinstance(instruction, str) or not instruction.strip():
+                    raise ValueError(f"第 {line_no} 行缺少 instruction")
+                mix.append((instruction.strip(), float(item.get('weight', 1))))
+            else:
+                mix.append((line, 1.0))
+    if not mix:
+        raise ValueError(f"{path} 中没有指令")
+    return mix
 
 
-def on_message(ws, message):
-    """收到消息时的回调"""
-    try:
-        # 尝试解析 JSON
-        data = json.loads(message)
-        print(f"\n[收到消息] {json.dumps(data, ensure_ascii=False, indent=2)}")
-    except json.JSONDecodeError:
-        print(f"\n[收到消息] {message}")
+class LoadStats:
+    """负载测试统计"""
+
+    def __init__(self):
+        self.connect_latency = []  # 建立连接耗时（秒）
+        self.ready_latency = []  # 开始连接到 vm_successful 的耗时（秒）
+        self.task_durations = []  # 成功任务的耗时（秒）
+        self.task_status = Counter()
+        self.errors = Counter()  # 错误类型 -> 次数
+        self.frames = 0
+        self.connections = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
 
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @staticmethod
+    def distribution(values: list) -> dict:
+        """样本的数量、均值、分位数与最大值"""
+        if not values:
+            return {"count": 0}
+        ordered = sorted(values)
+        dist = {"count": len(ordered), "mean": sum(ordered) / len(ordered)}
+        for q in QUANTILES:
+            dist[f"p{int(q * 100)}"] = percentile(ordered, q)
+        dist["max"] = ordered[-1]
+        return dist
+
+    def report(self) -> dict:
+        """汇总报告"""
+        tasks = sum(self.task_status.values())
+        failed = tasks - self.task_status.get('finished', 0)
+        return {
+            "connections": self.connections,
+            "elapsed": self.elapsed,
+            "connect_latency": self.distribution(self.connect_latency),
+            "ready_latency": self.distribution(self.ready_latency),
+            "task_duration": self.distribution(self.task_durations),
+            "tasks": dict(self.task_status),
+            "task_error_rate": failed / tasks if tasks else None,
+            "connect_error_rate": (self.errors['connect'] + self.errors['ready_timeout']) / self.connections
+            if self.connections else None,
+            "errors": dict(self.errors),
+            "frames": self.frames,
+            "frames_per_sec": self.frames / self.elapsed if self.elapsed else None,
+        }
 
-def on_open(ws):
-    """连接打开时的回调"""
-    print("✓ WebSocket 连接已建立")
-    
-    # 发送测试指令
-    test_msg = create_test_message()
-    print(f"\n[发送指令] {json.dumps(test_msg, ensure_ascii=False, indent=2)}")
-    ws.send(json.dumps(test_msg))
+    def format_lines(self) -> list:
+        """可读的报告行"""
+        report = self.report()
+        lines = [f"连接数: {report['connections']}，耗时 {report['elapsed']:.1f}s"]
+        for key, label in (("connect_latency", "建立连接"), ("ready_latency", "VM 就绪"),
+                           ("task_duration", "任务耗时")):
+            dist = report[key]
+            if dist["count"]:
+                lines.append(f"{label}: p50 {dist['p50']:.3f}s  p90 {dist['p90']:.3f}s  "
+                             f"p99 {dist['p99']:.3f}s  max {dist['max']:.3f}s (n={dist['count']})")
+        tasks = report['tasks']
+        lines.append(f"任务: {sum(tasks.values())}（" + "，".join(f"{k} {v}" for k, v in sorted(tasks.items())) + "）")
+        if report['task_error_rate'] is not None:
+            lines.append(f"任务错误率: {report['task_error_rate']:.2%}")
+        if report['connect_error_rate'] is not None:
+            lines.append(f"连接错误率: {report['connect_error_rate']:.2%}")
+        if report['errors']:
+            lines.append("错误: " + "，".join(f"{k} {v}" for k, v in sorted(report['errors'].items())))
+        if report['frames_per_sec'] is not None:
+            lines.append(f"消息: {report['frames']} 帧，{report['frames_per_sec']:.1f} 帧/秒")
+        return lines
 
 
-def on_error(ws, error):
-    """发生错误时的回调"""
-    print(f"✗ 错误: {error}")
+async def run_connection(index: int, url: str, headers: dict, mix: list, tasks: int,
+                         stats: LoadStats, rng: random.Random, timeout: float = None,
+                         connect_timeout: float = 10, ready_timeout: float = 60, verbose: bool = False):
+    """单个连接：建立会话、等待 VM 就绪，然后按权重抽取指令依次执行"""
 
+    def on_message(session, message, event):
+        stats.frames += 1
+        if verbose:
+            frame = getattr(event, 'frame', None)
+            text = json.dumps(frame, ensure_ascii=False, indent=2) if frame is not None else message
+            print(f"\n[#{index} 收到消息] {text}")
 
-def on_close(ws, close_status_code, close_msg):
-    """连接关闭时的回调"""
-    print(f"\n✗ 连接已关闭")
-    if close_status_code:
-        print(f"  状态码: {close_status_code}")
-    if close_msg:
-        print(f"  原因: {close_msg}")
+    session = AutoGLMSession(url, headers, on_message=on_message)
+    stats.connections += 1
+    started = time.monotonic()
+    try:
+        await session.connect(connect_timeout)
+    except Exception as e:
+        stats.errors['connect'] += 1
+        if verbose:
+            print(f"✗ #{index} 连接失败: {e}")
+        return
+    stats.connect_latency.append(time.monotonic() - started)
+    try:
+        if not await session.wait_ready(ready_timeout):
+            stats.errors['ready_timeout'] += 1
+            return
+        stats.ready_latency.append(time.monotonic() - started)
+        instructions = [m[0] for m in mix]
+        weights = [m[1] for m in mix]
+        for _ in range(tasks):
+            instruction = rng.choices(instructions, weights)[0]
+            if verbose:
+                print(f"\n[#{index} 发送指令] {instruction}")
+            try:
+                record = await session.run_instruction(instruction, timeout)
+            except ConnectionError:
+                stats.errors['disconnected'] += 1
+                break
+            stats.task_status[record.status] += 1
+            if record.status == 'finished' and record.duration is not None:
+                stats.task_durations.append(record.duration)
+    finally:
+        await session.close()
 
 
-def run_test(instruction: str = None):
+async def run_load(url: str, headers: dict, mix: list, connections: int = 1, ramp_up: float = 0,
+                   tasks: int = 1, timeout: float = None, ready_timeout: float = 60,
+                   seed: int = None, verbose: bool = False) -> LoadStats:
     """
-    运行 WebSocket 测试
-    
+    按爬坡时间逐个启动连接并等待全部结束
+
     Args:
-        instruction: 自定义指令，不指定则使用默认指令
+        url: WebSocket 地址
+        headers: 请求头
+        mix: [(指令, 权重)]
+        connections: 并发连接数
+        ramp_up: 在多少秒内均匀启动全部连接
+        tasks: 每个连接执行的指令数
+        timeout: 单条指令超时（秒），None 时按历史自适应
+        ready_timeout: 等待 VM 就绪超时（秒）
+        seed: 随机种子，固定后指令抽取可复现
+        verbose: 打印每条消息
     """
-    print(f"=" * 50)
-    print("AutoGLM Phone API WebSocket 测试")
-    print(f"=" * 50)
-    print(f"连接地址: {URL}")
-    print(f"API Key: {API_KEY[:10]}...{API_KEY[-4:]}")
-    print(f"-" * 50)
-    
-    # 创建 WebSocket 应用
-    ws = websocket.WebSocketApp(
-        URL,
-        header=HEADERS,
-        on_open=on_open,
-        on_message=on_message,
-        on_error=on_error,
-        on_close=on_close
-    )
-    
+    stats = LoadStats()
+    rng = random.Random(seed)
+    interval = ramp_up / connections if connections > 1 else 0
+
+    async def delayed(i):
+        await asyncio.sleep(i * interval)
+        await run_connection(i, url, headers, mix, tasks, stats, random.Random(rng.random()),
+                             timeout=timeout, ready_timeout=ready_timeout, verbose=verbose)
+
+    await asyncio.gather(*(delayed(i) for i in range(connections)))
+    stats.finished_at = time.monotonic()
+    return stats
+
+
+async def _run_with_mock(scenario: str, **kwargs) -> LoadStats:
+    """在进程内启动本地模拟服务端并对其压测"""
+    from mock_autoglm_server import MockAutoGLMServer, make_scenario
+
+    async with MockAutoGLMServer(make_scenario(scenario)) as server:
+        return await run_load(server.url, {}, **kwargs)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="AutoGLM 并发负载测试")
+    parser.add_argument("instruction", nargs="*", help="指令（未指定 -i 时使用，默认一条示例指令）")
+    parser.add_argument("-n", "--connections", type=int, default=1, help="并发连接数（默认 1）")
+    parser.add_argument("--ramp-up", type=float, default=0, help="在多少秒内均匀启动全部连接（默认 0）")
+    parser.add_argument("-i", "--instructions", help="指令文件：每行一条指令，或 {\"instruction\": ..., \"weight\": ...}")
+    parser.add_argument("-t", "--tasks", type=int, default=1, help="每个连接执行的指令数（默认 1）")
+    parser.add_argument("--timeout", type=float, default=None, help="单条指令超时秒数（默认按历史自适应）")
+    parser.add_argument("--ready-timeout", type=float, default=60, help="等待 VM 就绪的秒数（默认 60）")
+    parser.add_argument("--mock", metavar="SCENARIO", help="对进程内的本地模拟服务端压测（场景名，如 fast）")
+    parser.add_argument("--url", default=URL, help="WebSocket 地址（默认 AUTO_GLM_URL 或线上地址）")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    parser.add_argument("--json", metavar="FILE", help="把报告写入 JSON 文件")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印每条收到的消息")
+    args = parser.parse_args()
+
+    if args.instructions:
+        mix = load_instructions(args.instructions)
+    else:
+        mix = [(" ".join(args.instruction) or DEFAULT_INSTRUCTION, 1.0)]
+    options = dict(mix=mix, connections=args.connections, ramp_up=args.ramp_up, tasks=args.tasks,
+                   timeout=args.timeout, ready_timeout=args.ready_timeout, seed=args.seed,
+                   verbose=args.verbose)
+
+    print("=" * 50)
+    print("AutoGLM Phone API 负载测试")
+    print("=" * 50)
+    if args.mock:
+        print(f"目标: 本地模拟服务端（场景 {args.mock}）")
+    else:
+        api_key = os.getenv("AUTO_GLM_API_KEY")
+        if not api_key:
+            raise ValueError("未找到 API Key，请在 .env 文件中设置 AUTO_GLM_API_KEY")
+        print(f"连接地址: {args.url}")
+        print(f"API Key: {api_key[:10]}...{api_key[-4:]}")
+    print(f"并发 {args.connections}，爬坡 {args.ramp_up}s，每连接 {args.tasks} 条指令，指令种类 {len(mix)}")
+    print("-" * 50)
+
     try:
-        # 运行 WebSocket 连接
-        ws.run_forever()
+        if args.mock:
+            stats = asyncio.run(_run_with_mock(args.mock, **options))
+        else:
+            headers = {"Authorization": f"Bearer {api_key}"}
+            stats = asyncio.run(run_load(args.url, headers, **options))
     except KeyboardInterrupt:
-        print("\n\n用户中断，正在关闭连接...")
-        ws.close()
+        print("\n\n用户中断")
+        sys.exit(130)
+
+    for line in stats.format_lines():
+        print(f"📊 {line}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(stats.report(), f, ensure_ascii=False, indent=2)
+        print(f"📁 报告已写入: {args.json}")
+    report = stats.report()
+    sys.exit(0 if not report['errors'] and not report['task_error_rate'] else 1)
 
 
 if __name__ == "__main__":
-    import sys
-    
-    # 支持命令行参数传入自定义指令
-    custom_instruction = " ".join(sys.argv[1:]) if len(sys.argv) > 1 else None
-    
-    run_test(custom_instruction)
+    main()
@@ -0,0 +1,50 @@
+"""
+DeadlineEstimator 单元测试
+运行: python -m pytest -q test_liveness.py
+"""
+
+from autoglm_liveness import DeadlineEstimator
+
+LONG_TASK = "帮我在小红书找三篇云南的旅游攻略汇总一篇"
+
+
+def test_unrelated_fast_tasks_do_not_shorten_deadline():
+    """三条无关的短任务不会缩短新指令的期限，也不会为它启用停滞判定"""
+    estimator = DeadlineEstimator()
+    for i in range(3):
+        estimator.observe(f"打开微信 {i}", duration=8, action_count=2, max_gap=3)
+    assert estimator.deadline(LONG_TASK) == estimator.default
+    assert estimator.stall_timeout(LONG_TASK) is None
+
+
+def test_prefix_history_only_extends_deadline():
+    """相同前缀的历史只能延长期限"""
+    estimator = DeadlineEstimator()
+    for i in range(3):
+        estimator.observe(f"打开微信 {i}", duration=8, action_count=2, max_gap=3)
+    assert estimator.deadline("打开微信 发消息") == estimator.default
+    for i in range(3):
+        estimator.observe(f"打开微信 {i}", duration=300, action_count=30, max_gap=20)
+    assert estimator.default < estimator.deadline("打开微信 发消息") <= estimator.max_deadline
+    assert estimator.stall_timeout("打开微信 发消息") is None
+
+
+def test_exact_history_sets_deadline_and_stall():
+    """相同指令的历史决定期限与停滞判定时间"""
+    estimator = DeadlineEstimator()
+    for _ in range(3):
+        estimator.observe("打开微信", duration=8, action_count=2, max_gap=3)
+    assert estimator.deadline("打开 微信！") == estimator.min_deadline
+    assert estimator.stall_timeout("打开微信") == estimator.min_stall
+
+
+def test_history_keys_are_bounded():
+    """历史分组数超过 max_keys 时淘汰最久未使用的"""
+    estimator = DeadlineEstimator(max_keys=10)
+    for _ in range(3):
+        estimator.observe("打开微信", duration=8, action_count=2, max_gap=3)
+    for i in range(100):
+        estimator.observe(f"指令{i:03d}", duration=8, action_count=2, max_gap=3)
+        estimator.deadline("打开微信")
+    assert len(estimator._samples) <= 10
+    assert estimator.deadline("打开微信") == estimator.min_deadline